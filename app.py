@@ -1,13 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort, Response, stream_with_context
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from werkzeug.security import generate_password_hash, check_password_hash
-from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime, timedelta
-from email.message import EmailMessage
 from chatbot import EmotionalChatbot
+from conversation_memory import ConversationStore
+from chat_service import ChatService
+from crisis_mailer import CrisisMailer, enqueue_unsent
+from crisis_events import CrisisEventBroker
 from flask import Flask, jsonify
 import sentiment_analysis as sa
+import mood_registry
+from chart_render import FORMATS as CHART_FORMATS, make_chart_renderer
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
 from datetime import datetime
 from flask_cors import CORS
@@ -15,18 +21,22 @@ from bson import ObjectId
 from bson.son import SON
 import traceback
 import logging
-import smtplib
 import torch
 import uuid
 import re
 import json
-import csv
 import os
-import io
+import unicodedata
+from urllib.parse import quote
 
-import subprocess
-import tempfile
-from google.cloud import speech_v1 as speech
+from transcription import TranscriptionBackend, TranscriptionJobs, TranscriptionError, make_recognizer
+from audio_preprocess import AudioError, MAX_UPLOAD_BYTES, read_limited
+from upload_request import UploadRequest
+from journal_audio import JournalAudioTranscoder, sniff_audio_mimetype
+from blob_store import make_blob_store, collect_garbage, shard_path
+from journal_search import JournalSearch
+from journal_insights import JournalInsightIndexer, SentimentModel
+from history_export import HistoryExporter, FORMATS as EXPORT_FORMATS
 
 
 # --- Load environment variables ---
@@ -56,6 +66,8 @@ assess_col = db["assessments"]   # stores PH
 sessions_col = db["sessions"]
 page_views_col = db["page_views"] 
 mood_entries_col = db["mood_entries"]
+conversations_col = db["conversations"]
+crisis_mail_col = db["crisis_mail_queue"]
 
 
 print("✅ Connected to MongoDB:", client.list_database_names())
@@ -123,8 +135,17 @@ class AIModerator:
 ai_moderator = AIModerator()
 
 # --- Flask setup ---
+class AppRequest(UploadRequest):
+    # /transcribe reads the whole clip into memory: cap it at the clip size
+    # plus a 64 KB allowance for form fields
+    in_memory_endpoints = frozenset({"transcribe_audio", "create_transcription_job"})
+    in_memory_limit = MAX_UPLOAD_BYTES + 64 * 1024
+
 app = Flask(__name__)
+app.request_class = AppRequest
 app.secret_key = os.getenv("SECRET_KEY", "secretkey123")
+# Any other request body (journal recordings included), MAX_UPLOAD_MB megabytes
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
 
 # --- Helper Functions ---
 def get_next_id(collection, id_field):
@@ -260,19 +281,39 @@ def update_user_role(user_id, new_role):
     users_col.update_one({"_id": ObjectId(user_id)}, {"$set": {"role": new_role}})
 
 
+def serialize_crisis_log(log):
+    return {
+        "id": str(log.get("_id", ObjectId())),  # ID as string for template
+        "username": log.get("username", "Unknown"),
+        "ip_address": log.get("ip_address", "N/A"),
+        "timestamp": log.get("timestamp").strftime("%Y-%m-%d %H:%M:%S") 
+                     if isinstance(log.get("timestamp"), datetime) else str(log.get("timestamp")),
+        "resolved": log.get("resolved", False),
+        "resolved_at": log.get("resolved_at"),
+        "notification": log.get("notification", {}).get("status", "not sent")
+    }
+
 def get_crisis_logs():
-    logs = []
-    for log in crisis_col.find().sort("timestamp", -1):
-        logs.append({
-            "id": str(log.get("_id", ObjectId())),  # ID as string for template
-            "username": log.get("username", "Unknown"),
-            "ip_address": log.get("ip_address", "N/A"),
-            "timestamp": log.get("timestamp").strftime("%Y-%m-%d %H:%M:%S") 
-                         if isinstance(log.get("timestamp"), datetime) else str(log.get("timestamp")),
-            "resolved": log.get("resolved", False),
-            "resolved_at": log.get("resolved_at")
-        })
-    return logs
+    return [serialize_crisis_log(log) for log in crisis_col.find().sort("timestamp", -1)]
+
+def get_crisis_logs_page(status="unresolved", before=None, limit=20):
+    """
+    One page of crisis logs, newest first, keyset-paginated on _id.
+    status: "unresolved" (default), "resolved" or "all".
+    Returns (logs, next_cursor) where next_cursor is None on the last page.
+    """
+    query = {}
+    if status == "unresolved":
+        query["resolved"] = {"$ne": True}
+    elif status == "resolved":
+        query["resolved"] = True
+    if before:
+        query["_id"] = {"$lt": ObjectId(before)}
+
+    docs = list(crisis_col.find(query).sort("_id", -1).limit(limit + 1))
+    logs = [serialize_crisis_log(log) for log in docs[:limit]]
+    next_cursor = logs[-1]["id"] if len(docs) > limit else None
+    return logs, next_cursor
 
 
 
@@ -355,7 +396,11 @@ def check_username():
 
 @app.route("/logout", methods=["POST"])
 def logout():
+    user_id = session.get("user_id")
     session.clear()
+    if user_id:
+        # Chat memory is keyed by user; don't keep transcripts past the session
+        conversation_store.clear(user_id)
     flash('Logged out successfully', 'success')
     return redirect(url_for("login"))
 
@@ -392,6 +437,24 @@ except Exception as e:
     chatbot = None
     print(f"❌ Failed to initialize chatbot: {e}")
 
+# Last few turns + rolling summary per user, fed back into the chatbot prompt.
+# Cleared on logout; Mongo expires conversations left idle for CONVERSATION_RETENTION_DAYS.
+conversation_store = ConversationStore(
+    conversations_col,
+    retention=int(os.getenv("CONVERSATION_RETENTION_DAYS", "30")) * 24 * 3600
+)
+try:
+    conversation_store.ensure_indexes()
+except PyMongoError as e:
+    print(f"Could not create conversation indexes: {e}")
+
+# LLM calls run off the request thread with a concurrency cap and a per-request deadline
+chat_service = ChatService(
+    chatbot,
+    max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+    timeout=float(os.getenv("CHAT_TIMEOUT_SECONDS", "12"))
+) if chatbot else None
+
 # --- Chatbot Routes ---
 @app.route("/chatbot")
 def chatbot_page():
@@ -414,8 +477,12 @@ def chat():
         return jsonify({"response": "I'm here to listen. Please share what's on your mind."}), 400
     
     try:
-        response = chatbot.chat(message)
-        return jsonify({"response": response})
+        context = conversation_store.get_context(session["user_id"])
+        response, is_fallback = chat_service.chat(message, context)
+        # Canned fallback replies (LLM down, busy or too slow) stay out of the conversation memory
+        if not is_fallback:
+            conversation_store.add_turn(session["user_id"], message, response)
+        return jsonify({"response": response, "fallback": is_fallback})
     except Exception as e:
         print(f"Chatbot error: {e}")
         return jsonify({"response": "I'm here to support you. Could you tell me more about how you're feeling right now?"}), 500
@@ -434,34 +501,54 @@ def journal():
     )
 
     if last_mood:
-        mood = last_mood["mood"]
-
-        if mood in ["Sad", "Angry"]:
-            journaling_prompt = (
-                "I'm sorry you're feeling this way. "
-                "What do you think contributed to this feeling? "
-                "Would you like to write about what might help you feel better?"
-            )
-        elif mood == "Happy":
-            journaling_prompt = (
-                "That's wonderful! What made you feel this way today? "
-                "Would you like to write it down so you can revisit it later?"
-            )
-        elif mood == "Calm":
-            journaling_prompt = (
-                "It's great that you're feeling peaceful. "
-                "What helped you achieve this sense of calm today?"
-            )
-        elif mood == "Void":
-            journaling_prompt = (
-                "Sometimes feeling neutral is perfectly okay. "
-                "Would you like to explore what's on your mind right now?"
-            )
+        code = last_mood.get("mood_code", mood_registry.code_for(last_mood.get("mood")))
+        journaling_prompt = mood_registry.journaling_prompt(code)
 
     # ✅ Render journal template with prompt
     return render_template("journal.html", journaling_prompt=journaling_prompt, username = session["username"])
 
 
+# Journal audio lives in the content-addressed blob store (see BLOB_STORE / BLOB_ROOT);
+# AUDIO_DIR only holds files of entries saved before it, which keep their "audio_file" name
+AUDIO_DIR = os.path.join("static", "audio")
+blob_store = make_blob_store()
+
+# Voice journals are re-encoded to Opus/OGG in the background (needs ffmpeg with libopus)
+journal_audio = JournalAudioTranscoder(
+    journals_col, blob_store, AUDIO_DIR,
+    bitrate=os.getenv("JOURNAL_AUDIO_BITRATE", "24k")
+)
+try:
+    journals_col.create_index("audio_blob", sparse=True)
+    journals_col.create_index([("user_id", 1), ("journal_id", -1)])
+    resumed = journal_audio.resume_pending()
+    if resumed:
+        print(f"Resuming {resumed} pending journal audio transcodes")
+except PyMongoError as e:
+    print(f"Could not resume journal audio transcodes: {e}")
+
+# Text index over titles, entries and voice journal transcripts
+journal_search = JournalSearch(journals_col)
+try:
+    journal_search.ensure_index()
+except PyMongoError as e:
+    print(f"Could not create journal search index: {e}")
+
+# Sentiment and topic tags for each journal entry, scored in the background,
+# with per-user daily rollups for the dashboard trends
+journal_insights = JournalInsightIndexer(
+    journals_col, db["indexer_state"], db["journal_insights_daily"],
+    SentimentModel(batch_size=int(os.getenv("JOURNAL_SENTIMENT_BATCH", "16")))
+)
+# JOURNAL_INSIGHTS=1 turns it on; the sentiment model (torch + transformers) is downloaded
+# from Hugging Face on the first batch, so it is off unless asked for
+if os.getenv("JOURNAL_INSIGHTS", "0") == "1":
+    try:
+        journal_insights.ensure_indexes()
+        journal_insights.start()
+    except PyMongoError as e:
+        print(f"Could not start journal insights indexer: {e}")
+
 @app.route("/add_journal", methods=["POST"])
 def add_journal():
     if "user_id" not in session:
@@ -473,6 +560,7 @@ def add_journal():
         title = request.form.get("title", "").strip()
         entry_type = request.form.get("type", "text")
         audio_file = request.files.get("audio")
+        transcript = request.form.get("transcript", "").strip()
 
         if not title or not audio_file:
             return jsonify({"error": "Title and audio file are required"}), 400
@@ -481,27 +569,28 @@ def add_journal():
         date = now.strftime("%Y-%m-%d")
         time = now.strftime("%H:%M:%S")
 
-        # Create audio directory if it doesn't exist
-        audio_dir = os.path.join("static", "audio")
-        os.makedirs(audio_dir, exist_ok=True)
-
-        # Save audio file with unique name
-        journal_id = get_next_id(journals_col, "journal_id")
-        filename = f"audio_{journal_id}_{session['user_id']}.wav"
-        audio_path = os.path.join(audio_dir, filename)
-        audio_file.save(audio_path)
+        # Store the recording by content hash
+        head = audio_file.stream.read(16)
+        audio_file.stream.seek(0)
+        audio_key = blob_store.put(audio_file.stream)
+        transcode = journal_audio.enabled
 
         entry = {
-            "journal_id": journal_id,
+            "journal_id": get_next_id(journals_col, "journal_id"),
             "user_id": session["user_id"],
             "title": title,
             "type": "audio",
-            "audio_file": filename,
+            "audio_blob": audio_key,
+            "audio_mimetype": sniff_audio_mimetype(head),
+            "audio_status": "pending" if transcode else "original",
+            "audio_size": blob_store.size(audio_key),
             "datetime": now,
             "is_edited": False,
             "date": date,
             "time": time
         }
+        if transcript:
+            entry["transcript"] = transcript
     else:
         # Text entry
         data = request.get_json()
@@ -528,10 +617,43 @@ def add_journal():
 
     try:
         journals_col.insert_one(entry)
-        return jsonify({"message": "Journal added successfully", "id": entry["journal_id"]}), 201
     except Exception as e:
         return jsonify({"error": "Failed to save journal"}), 500
 
+    # The entry is saved from here on: a failed follow-up step is reported with the
+    # 201 rather than as an error, so the client doesn't retry and save it twice
+    warnings = []
+    if entry.get("audio_blob"):
+        try:
+            audio_file.stream.seek(0)
+            journal_audio.ensure_stored(entry["audio_blob"], audio_file.stream)
+        except Exception:
+            logger.exception("Audio for journal %s not stored", entry["journal_id"])
+            warnings.append("The recording may not have been saved; please check the entry.")
+        try:
+            if entry["audio_status"] == "pending":
+                journal_audio.submit(entry["journal_id"])
+        except Exception:
+            # Picked up again by resume_pending() on the next start
+            logger.exception("Transcode of journal %s not queued", entry["journal_id"])
+        if "transcript" not in entry and JOURNAL_TRANSCRIBE:
+            if entry["audio_size"] > MAX_UPLOAD_BYTES:
+                # Transcription refuses anything this big; don't read it in just to find out
+                logger.info("Journal %s audio too large to transcribe (%s bytes)", entry["journal_id"], entry["audio_size"])
+            else:
+                try:
+                    audio_file.stream.seek(0)
+                    transcribe_journal_audio(entry["journal_id"], audio_file.stream.read(),
+                                             request.form.get("language_code", "en-US"))
+                except Exception:
+                    logger.exception("Transcript for journal %s not queued", entry["journal_id"])
+    journal_insights.wake()
+
+    response = {"message": "Journal added successfully", "id": entry["journal_id"]}
+    if warnings:
+        response["warnings"] = warnings
+    return jsonify(response), 201
+
 @app.route("/get_journals/<username>", methods=["GET"])
 def get_journals(username):
     if "user_id" not in session:
@@ -549,18 +671,146 @@ def get_journals(username):
             e["type"] = "text"  # Ensure old entries have type
     return jsonify(user_entries)
 
+def get_journals_page(user_id, before=None, limit=20, preview_chars=120):
+    """
+    One page of a user's journal summaries, newest first, keyset-paginated on journal_id.
+    Only the first preview_chars characters of each entry leave the database.
+    Returns (entries, next_cursor) where next_cursor is None on the last page.
+    """
+    query = {"user_id": user_id}
+    if before is not None:
+        query["journal_id"] = {"$lt": before}
+
+    text = {"$ifNull": ["$entry", ""]}
+    docs = list(journals_col.aggregate([
+        {"$match": query},
+        {"$sort": {"journal_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {
+            "_id": 0,
+            "id": "$journal_id",
+            "title": 1,
+            "date": 1,
+            "time": 1,
+            "is_edited": 1,
+            "audio_duration": 1,
+            "audio_mimetype": 1,
+            "type": {"$ifNull": ["$type", "text"]},
+            "preview": {"$substrCP": [text, 0, preview_chars]},
+            "truncated": {"$gt": [{"$strLenCP": text}, preview_chars]}
+        }}
+    ]))
+    entries = docs[:limit]
+    next_cursor = entries[-1]["id"] if len(docs) > limit else None
+    return entries, next_cursor
+
+@app.route("/api/journals", methods=["GET"])
+def api_journals():
+    """Paginated journal summaries: ?before=<journal_id>&limit=20&preview=120"""
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    preview = min(max(request.args.get("preview", 120, type=int), 0), 1000)
+    before = request.args.get("before", type=int)
+
+    entries, next_cursor = get_journals_page(session["user_id"], before, limit, preview)
+    return jsonify({"entries": entries, "next_cursor": next_cursor}), 200
+
+@app.route("/api/journals/search", methods=["GET"])
+def api_journal_search():
+    """Ranked search over titles, entries and transcripts: ?q=...&page=1&per_page=20"""
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Search query is required"}), 400
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 20, type=int), 1), 50)
+
+    try:
+        return jsonify(journal_search.search(session["user_id"], query, page, per_page)), 200
+    except PyMongoError as e:
+        app.logger.exception("Journal search failed: %s", e)
+        return jsonify({"error": "Search is unavailable"}), 503
+
+@app.route("/api/journal_insights", methods=["GET"])
+def api_journal_insights():
+    """Daily journal sentiment and topic counts for the dashboard: ?days=30"""
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    days = min(max(request.args.get("days", 30, type=int), 1), 365)
+    return jsonify(journal_insights.trends(session["user_id"], days)), 200
+
+@app.route("/api/journals/<int:entry_id>", methods=["GET"])
+def api_journal_entry(entry_id):
+    """One full journal entry"""
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    entry = journals_col.find_one({"journal_id": entry_id, "user_id": session["user_id"]}, {"_id": 0})
+    if not entry:
+        return jsonify({"error": "not found"}), 404
+    entry["id"] = entry["journal_id"]
+    entry["type"] = entry.get("type", "text")
+    entry["content"] = entry.get("entry") if entry["type"] == "text" else None
+    return jsonify(entry), 200
+
+# Who sends the audio bytes: "" = this worker, "x-accel" = nginx via X-Accel-Redirect to
+# AUDIO_ACCEL_PREFIX + <blob path>, e.g.  location /_protected_audio/ { internal; alias /srv/soulace/data/blobs/; }
+# "x-sendfile" = Apache/lighttpd via X-Sendfile with the absolute file path
+AUDIO_SENDFILE = os.getenv("AUDIO_SENDFILE", "").lower()
+AUDIO_ACCEL_PREFIX = os.getenv("AUDIO_ACCEL_PREFIX", "/_protected_audio/")
+
+def send_audio(audio_path, mimetype=None, blob_key=None):
+    """
+    Serve a journal recording. Blobs use their content hash as a strong ETag, and
+    "private, no-cache" lets the browser keep its copy but revalidate, so replays
+    are 304s. Range requests get 206 partial content, so seeking doesn't refetch.
+    """
+    if blob_key and request.if_none_match.contains(blob_key):
+        response = Response(status=304)
+    elif AUDIO_SENDFILE == "x-accel" and blob_key:
+        # The proxy handles Range itself
+        response = Response(mimetype=mimetype or "application/octet-stream")
+        response.headers["X-Accel-Redirect"] = AUDIO_ACCEL_PREFIX + shard_path(blob_key)
+    elif AUDIO_SENDFILE == "x-sendfile":
+        response = Response(mimetype=mimetype or "application/octet-stream")
+        response.headers["X-Sendfile"] = os.path.abspath(audio_path)
+    else:
+        # With a file path Werkzeug hands full responses to the server's wsgi.file_wrapper (sendfile under gunicorn)
+        response = send_file(audio_path, mimetype=mimetype, as_attachment=False, conditional=True,
+                             etag=blob_key or True)
+    if blob_key:
+        response.set_etag(blob_key)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @app.route("/get_audio/<int:entry_id>")
 def get_audio(entry_id):
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
-    entry = journals_col.find_one({"journal_id": entry_id, "user_id": session["user_id"], "type": "audio"})
-    if not entry or not entry.get("audio_file"):
+    entry = journals_col.find_one({"journal_id": entry_id, "user_id": session["user_id"], "type": "audio"},
+                                  {"audio_blob": 1, "audio_file": 1, "audio_mimetype": 1})
+    if not entry or not (entry.get("audio_blob") or entry.get("audio_file")):
         abort(404)
 
-    audio_path = os.path.join("static", "audio", entry["audio_file"])
+    blob_key = entry.get("audio_blob")
+    if blob_key:
+        audio_path = blob_store.local_path(blob_key)
+        if audio_path is None:
+            if request.if_none_match.contains(blob_key):
+                return send_audio(None, blob_key=blob_key)
+            # Remote store: let the client fetch the bytes (and ranges) from it directly
+            return redirect(blob_store.url(blob_key))
+    else:
+        audio_path = os.path.join(AUDIO_DIR, entry["audio_file"])
     if os.path.exists(audio_path):
-        return send_file(audio_path, as_attachment=False)
+        return send_audio(audio_path, entry.get("audio_mimetype"), blob_key)
     else:
         abort(404)
 
@@ -569,28 +819,72 @@ def delete_journal(entry_id):
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
-    # Find the entry first to check if it's an audio entry
-    entry = journals_col.find_one({"journal_id": entry_id, "user_id": session["user_id"]})
+    # Delete the database entry first and get it back in one step, so the audio file we remove
+    # is the current one even if the background transcoder just swapped it for the .ogg
+    entry = journals_col.find_one_and_delete({"journal_id": entry_id, "user_id": session["user_id"]})
     if not entry:
         return jsonify({"success": False, "error": "not found"}), 404
 
-    # Delete audio file if it exists
-    if entry.get("type") == "audio" and entry.get("audio_file"):
-        audio_path = os.path.join("static", "audio", entry["audio_file"])
-        if os.path.exists(audio_path):
-            try:
-                os.remove(audio_path)
-            except Exception as e:
-                print(f"Failed to delete audio file: {e}")
+    try:
+        journal_insights.retract(entry)
+    except PyMongoError as e:
+        print(f"Failed to update journal insights: {e}")
+
+    # Delete the recording unless another entry shares the same content
+    if entry.get("type") == "audio":
+        try:
+            journal_audio.release(entry)
+        except Exception as e:
+            print(f"Failed to delete audio file: {e}")
+
+    return jsonify({"success": True})
 
-    # Delete the database entry
-    res = journals_col.delete_one({"journal_id": entry_id, "user_id": session["user_id"]})
-    if res.deleted_count == 1:
-        return jsonify({"success": True})
-    return jsonify({"success": False, "error": "not found"}), 404
+# Uploads are stored before their journal entry is saved and transcoded
+# copies before the entry points at them, so never collect blobs younger than this
+BLOB_GC_MIN_GRACE_SECONDS = 600
+
+@app.route("/admin/api/blob_gc", methods=["POST"])
+def admin_blob_gc():
+    """Delete stored journal audio that no entry references any more (?grace_seconds=3600)"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"ok": False, "error": "Admin access required"}), 403
+
+    # type=int falls back to the default on bad input, so check for that first
+    if "grace_seconds" in request.args and request.args.get("grace_seconds", type=int) is None:
+        return jsonify({"ok": False, "error": "grace_seconds must be a whole number of seconds"}), 400
+    grace = max(request.args.get("grace_seconds", 3600, type=int), BLOB_GC_MIN_GRACE_SECONDS)
+    referenced = set(journals_col.distinct("audio_blob"))
+    result = collect_garbage(blob_store, referenced, grace_seconds=grace)
+    return jsonify({"ok": True, "grace_seconds": grace, **result})
     
 
 # --- Mood Tracking ---
+# Charts render in spawned worker processes, which re-import __main__. When that is this
+# file (python app.py) they would redo all of the app's setup, so use threads there.
+sa.chart_renderer = make_chart_renderer(processes=__name__ != "__main__")
+
+# Mood logs carry a mood_code from mood_registry; any log without one (saved before that,
+# or by an older instance mid-deploy) gets its code here on each startup
+try:
+    migrated = mood_registry.migrate_mood_codes(moodtracking_col)
+    if migrated:
+        print(f"Added mood codes to {migrated} mood logs")
+except PyMongoError as e:
+    print(f"Could not migrate mood codes: {e}")
+
+# Sentiment counts only read user_id and mood_code, so this index covers them
+try:
+    moodtracking_col.create_index([("user_id", 1), ("mood_code", 1)])
+except PyMongoError as e:
+    print(f"Could not create mood index: {e}")
+
+# Streaming CSV / Parquet / Arrow exports of a user's history, read in time order
+history_exporter = HistoryExporter({"moods": moodtracking_col, "journals": journals_col, "assessments": assess_col})
+try:
+    history_exporter.ensure_indexes()
+except PyMongoError as e:
+    print(f"Could not create history export indexes: {e}")
+
 @app.route("/save_mood", methods=["POST"])
 def save_mood():
     if "user_id" not in session:
@@ -599,9 +893,8 @@ def save_mood():
     data = request.get_json()
     mood = data.get("mood")
     
-    # ✅ Define valid moods (matching SVG files)
-    valid_moods = ["Happy", "Calm", "Void", "Sad", "Angry"]
-    if mood not in valid_moods:
+    # ✅ Moods the picker offers (matching SVG files)
+    if not mood_registry.is_active(mood):
         return jsonify({"error": "Invalid mood value"}), 400
 
     # ✅ Insert into DB
@@ -609,32 +902,11 @@ def save_mood():
         "mood_id": get_next_id(moodtracking_col, "mood_id"),
         "user_id": session["user_id"],
         "datetime": datetime.now(),
-        "mood": mood
+        **mood_registry.mood_document(mood)
     }
 
-    journaling_prompt = None
-    # 🎯 Suggest journaling prompts based on mood
-    if mood in ["Sad", "Angry"]:
-        journaling_prompt = (
-            "I'm sorry you're feeling this way. "
-            "What do you think contributed to this feeling? "
-            "Would you like to write about what might help you feel better?"
-        )
-    elif mood == "Happy":
-        journaling_prompt = (
-            "That's wonderful! What made you feel this way today? "
-            "Would you like to write it down so you can revisit it later?"
-        )
-    elif mood == "Calm":
-        journaling_prompt = (
-            "It's great that you're feeling peaceful. "
-            "What helped you achieve this sense of calm today?"
-        )
-    elif mood == "Void":
-        journaling_prompt = (
-            "Sometimes feeling neutral is perfectly okay. "
-            "Would you like to explore what's on your mind right now?"
-        )
+    # 🎯 Suggest a journaling prompt for the mood
+    journaling_prompt = mood_registry.journaling_prompt(mood_entry["mood_code"])
 
     try:
         moodtracking_col.insert_one(mood_entry)
@@ -660,34 +932,74 @@ def get_moods():
 def download_csv():
     if "user_id" not in session:
         return redirect(url_for("login"))
-    
-    moods = list(moodtracking_col.find({"user_id": session["user_id"]}).sort("datetime", 1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Time", "Mood"])
-    
-    for mood in moods:
-        dt = mood["datetime"]
-        writer.writerow([dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M:%S"), mood["mood"]])
-    
-    output.seek(0)
-    file_data = io.BytesIO()
-    file_data.write(output.getvalue().encode('utf-8'))
-    file_data.seek(0)
-    
-    return send_file(file_data, 
-                     mimetype='text/csv',
-                     as_attachment=True,
-                     download_name=f'moods_{session["username"]}.csv')
 
+    return download_response(history_exporter.mood_download(session["user_id"]),
+                             "text/csv", f'moods_{session["username"]}.csv')
+
+
+def download_response(body, mimetype, filename):
+    """Streamed attachment response, with the filename encoded the way send_file does it"""
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    ascii_name = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+    names = {"filename": ascii_name}
+    if ascii_name != filename:
+        names["filename*"] = f"UTF-8''{quote(filename, safe='')}"
+    response.headers.set("Content-Disposition", "attachment", **names)
+    return response
+
+
+@app.route("/export/<dataset>", methods=["GET"])
+def export_history(dataset):
+    """The user's moods, journals or assessments: ?format=csv|parquet|arrow&start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    fmt = request.args.get("format", "csv")
+    try:
+        body = history_exporter.stream(dataset, session["user_id"], fmt, **date_range_args())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return download_response(body, mimetype, f'{dataset}_{session["username"]}.{extension}')
 
 @app.route("/download_chart", methods=["GET"])
 def download_chart():
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
-    file_path = sa.generate_user_chart(session["user_id"], moodtracking_col)
-    return send_file(file_path, as_attachment=True)
+    fmt = request.args.get("format", "png")
+    if fmt not in CHART_FORMATS:
+        return jsonify({"error": "format must be png or svg"}), 400
+    file_path = sa.generate_user_chart(session["user_id"], moodtracking_col, fmt)
+    return send_file(file_path, mimetype=CHART_FORMATS[fmt], as_attachment=True,
+                     download_name=f"user_{session['user_id']}_sentiment.{fmt}")
+
+
+def date_range_args():
+    """{"start": date, "end": date} from ?start=YYYY-MM-DD&end=YYYY-MM-DD, None where not given"""
+    def parse(name):
+        value = request.args.get(name)
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+        except ValueError:
+            raise ValueError(f"{name} must be a date like 2026-01-31")
+    return {"start": parse("start"), "end": parse("end")}
+
+def chart_range_args():
+    """sentiment_series() keyword args from ?start=YYYY-MM-DD&end=YYYY-MM-DD&bucket=day|week|month"""
+    return {**date_range_args(), "bucket": request.args.get("bucket", "day")}
+
+@app.route("/api/sentiment_chart", methods=["GET"])
+def sentiment_chart_data():
+    """Chart data for the user's mood sentiment, for the browser to draw"""
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    try:
+        return jsonify(sa.sentiment_series(moodtracking_col, session["user_id"], **chart_range_args())), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 
 # --- Appointments Routes ---
@@ -1775,6 +2087,21 @@ def bulk_action():
 
 #---Crisis---
 
+def crisis_changes(since):
+    """Crisis events since `since`, read back from Mongo so every worker's admin streams see them"""
+    for log in crisis_col.find({"timestamp": {"$gte": since}}).sort("_id", 1).limit(100):
+        yield {"type": "new", **serialize_crisis_log(log)}
+    for log in crisis_col.find({"resolved_at": {"$gte": since}}, {"resolved_at": 1}).limit(100):
+        yield {"type": "resolved", "id": str(log["_id"]), "resolved_at": log["resolved_at"]}
+    for log in crisis_col.find({"notification.updated_at": {"$gte": since}}, {"notification.status": 1}).limit(100):
+        yield {"type": "notification", "id": str(log["_id"]), "notification": log["notification"]["status"]}
+
+# Pushes new/resolved crisis events to admins connected to /admin/crisis_stream: straight
+# away within this worker, and within CRISIS_POLL_SECONDS from any other worker
+crisis_events = CrisisEventBroker(poll=crisis_changes, poll_interval=float(os.getenv("CRISIS_POLL_SECONDS", "2")))
+# Each stream holds a worker thread: close it after this long and let the browser reconnect
+CRISIS_STREAM_MAX_SECONDS = float(os.getenv("CRISIS_STREAM_MAX_MINUTES", "10")) * 60
+
 @app.route("/crisis", methods=["POST"])
 def crisis():
     if "username" not in session:
@@ -1784,13 +2111,36 @@ def crisis():
     ip_address = request.headers.get("X-Forwarded-For", request.remote_addr)
 
     crisis_doc = {
+        "_id": ObjectId(),
         "username": username,
         "ip_address": ip_address,
         "timestamp": datetime.now()
     }
-    db["crisis"].insert_one(crisis_doc)
 
-    return jsonify({"message": "Crisis logged successfully"})
+    if not crisis_mailer:
+        crisis_col.insert_one(crisis_doc)
+        crisis_events.publish({"type": "new", **serialize_crisis_log(crisis_doc)})
+        return jsonify({"message": "Crisis logged successfully"})
+
+    # The log entry and its outbox alert are written together, so a crisis can't be
+    # logged without a notification being queued for it
+    alert = crisis_alert(crisis_mailer, crisis_doc)
+    crisis_doc["notification"] = {"status": "queued", "tracking_id": alert["tracking_id"]}
+
+    def write_crisis(s=None):
+        crisis_col.insert_one(crisis_doc, session=s)
+        crisis_mail_col.insert_one(alert, session=s)
+
+    if MONGO_TRANSACTIONS:
+        with client.start_session() as s:
+            s.with_transaction(write_crisis)
+    else:
+        # Standalone Mongo: the outbox sweep re-enqueues it if we die in between
+        write_crisis()
+    crisis_mailer.wake()
+    crisis_events.publish({"type": "new", **serialize_crisis_log(crisis_doc)})
+
+    return jsonify({"message": "Crisis logged successfully", "tracking_id": alert["tracking_id"]})
 
 
 @app.route("/admin", methods=["GET", "POST"])
@@ -1812,7 +2162,8 @@ def admin_dashboard():
     }
 
     users = get_all_users()
-    logs = get_crisis_logs()
+    # Only the first page of open crises; newer ones arrive over /admin/crisis_stream
+    logs, _ = get_crisis_logs_page()
     visits = list(db.page_views.find().sort("timestamp", -1))
     visits=str(visits)
 
@@ -1876,19 +2227,46 @@ def admin_flagged_posts():
 
 @app.route("/admin/crisis_logs", methods=["GET"])
 def get_crisis_logs():
-    logs = []
-    for log in crisis_col.find().sort("timestamp", -1):
-        logs.append({
-            "id": str(log.get("_id", ObjectId())),  # ID as string for template
-            "username": log.get("username", "Unknown"),
-            "ip_address": log.get("ip_address", "N/A"),
-            "timestamp": log.get("timestamp").strftime("%Y-%m-%d %H:%M:%S") 
-                         if isinstance(log.get("timestamp"), datetime) else str(log.get("timestamp")),
-            "resolved": log.get("resolved", False),
-            "resolved_at": log.get("resolved_at")
-        })
-    print(logs)
+    logs = [serialize_crisis_log(log) for log in crisis_col.find().sort("timestamp", -1)]
     return logs
+
+@app.route("/admin/api/crisis_logs", methods=["GET"])
+def api_crisis_logs():
+    """Paginated crisis logs: ?status=unresolved|resolved|all&before=<id>&limit=20"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"ok": False, "error": "Admin access required"}), 403
+
+    status = request.args.get("status", "unresolved")
+    if status not in ("unresolved", "resolved", "all"):
+        return jsonify({"ok": False, "error": "Invalid status"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    before = request.args.get("before")
+    if before and not ObjectId.is_valid(before):
+        return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+
+    logs, next_cursor = get_crisis_logs_page(status, before, limit)
+    return jsonify({"ok": True, "logs": logs, "next_cursor": next_cursor}), 200
+
+@app.route("/admin/crisis_stream")
+def crisis_stream():
+    """Server-Sent Events feed of new/resolved crises for the admin dashboard"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    # On reconnect the browser sends the id of the last event it got; resume from there
+    # (up to an hour back) so nothing logged while it was disconnected is missed
+    since = None
+    try:
+        since = datetime.fromisoformat(request.headers.get("Last-Event-ID", ""))
+        since = max(since, datetime.now() - timedelta(hours=1))
+    except ValueError:
+        pass
+
+    return Response(
+        stream_with_context(crisis_events.stream(since=since, max_age=CRISIS_STREAM_MAX_SECONDS)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
 
 
@@ -1906,6 +2284,7 @@ def resolve_crisis(log_id):
         if result.matched_count == 0:
             return jsonify({"error": "Crisis log not found"}), 404
 
+        crisis_events.publish({"type": "resolved", "id": log_id, "resolved_at": datetime.now()})
         return jsonify({"message": "Crisis log resolved successfully"}), 200
 
     except Exception as e:
@@ -1916,65 +2295,8 @@ def mood_trends():
     if "user_id" not in session or session.get("role") != "admin":
         return jsonify({"error": "Admin only"}), 403
 
-    # Map moods to numeric values for average calculation
-    mood_map = {
-        "Happy": 4,
-        "Calm": 3,
-        "Void": 2,
-        "Sad": 1,
-        "Angry": 0
-    }
-
-    # Aggregate counts per mood per day
-    pipeline = [
-        {
-            "$group": {
-                "_id": {
-                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$datetime"}},
-                    "mood": "$mood"
-                },
-                "count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id.date": 1}}
-    ]
-
-    results = list(moodtracking_col.aggregate(pipeline))
-
-    # Reshape into { date: {mood: count, ...}, ... }
-    mood_data = {}
-    for r in results:
-        date = r["_id"]["date"]
-        mood = r["_id"]["mood"]
-        count = r["count"]
-        if date not in mood_data:
-            mood_data[date] = {}
-        mood_data[date][mood] = count
-
-
-    dates = sorted(mood_data.keys())
-    moods = sorted(mood_map.keys(), key=lambda m: -mood_map[m])  # keep consistent order
-
-    distribution = [
-        [mood_data[date].get(m, 0) for m in moods]
-        for date in dates
-    ]
-
-    averages = [
-        round(
-            sum((mood_map.get(m, 0) * mood_data[date].get(m, 0)) for m in moods) 
-            / max(sum(mood_data[date].values()), 1), 2
-        )
-        for date in dates
-    ]
-
-    data = {
-        "dates": dates,
-        "moods": moods,
-        "distribution": distribution,
-        "averages": averages
-    }
-    return jsonify(data), 200
+    # Per day: how many logs of each mood, and the average mood score
+    return jsonify(sa.mood_trends(moodtracking_col)), 200
 
 @app.route("/admin/api/stats", methods=["GET"])
 def admin_api_stats():
@@ -2042,6 +2364,21 @@ def admin_api_stats():
         return jsonify({"ok": False, "error": str(e)}), 500
     
     
+@app.route("/admin/api/llm_breaker", methods=["GET"])
+def admin_llm_breaker():
+    """Return circuit breaker state and counters for the chatbot's LLM provider"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"ok": False, "error": "Admin access required"}), 403
+
+    if not chatbot:
+        return jsonify({"ok": False, "error": "Chatbot not initialized"}), 503
+
+    data = chatbot.breaker.snapshot()
+    if chat_service:
+        data["chat_service"] = dict(chat_service.stats)
+    return jsonify({"ok": True, "breaker": data}), 200
+
+
 @app.route("/admin/api/daily_hits", methods=["GET"])
 def admin_daily_hits():
     """Return daily page hits for the last 30 days"""
@@ -2095,54 +2432,9 @@ def admin_mood_trend():
         return jsonify({"error": "Admin access required"}), 403
     
     try:
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        
-        # Mood scoring system
-        mood_scores = {
-            "Very Happy": 8,
-            "Feeling Blessed": 7,
-            "Happy": 6,
-            "Mind Blown": 5,
-            "Frustrated": 3,
-            "Sad": 2,
-            "Angry": 1,
-            "Crying": 0
-        }
-        
-        pipeline = [
-            {"$match": {"datetime": {"$gte": thirty_days_ago}}},
-            {"$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$datetime"}},
-                "moods": {"$push": "$mood"}
-            }},
-            {"$sort": {"_id": 1}}
-        ]
-        
-        results = list(moodtracking_col.aggregate(pipeline))
-        
-        # Calculate daily averages
-        dates = []
-        averages = []
-        
-        for i in range(30):
-            date = (datetime.now() - timedelta(days=29-i)).strftime("%Y-%m-%d")
-            dates.append(date)
-            
-            # Find moods for this date
-            daily_moods = []
-            for result in results:
-                if result["_id"] == date:
-                    daily_moods = result["moods"]
-                    break
-            
-            if daily_moods:
-                # Calculate average mood score for the day
-                scores = [mood_scores.get(mood, 4) for mood in daily_moods]  # default to 4 if unknown
-                avg = sum(scores) / len(scores)
-                averages.append(round(avg, 1))
-            else:
-                averages.append(0)
-        
+        # Average mood score per day (0-4, see mood_registry), computed by Mongo
+        dates, averages = sa.daily_average_scores(moodtracking_col, days=30)
+
         return jsonify({
             "labels": [datetime.strptime(d, "%Y-%m-%d").strftime("%m/%d") for d in dates],
             "avgs": averages
@@ -2152,6 +2444,17 @@ def admin_mood_trend():
         print(f"Error getting mood trend: {e}")
         return jsonify({"labels": [], "avgs": []}), 500
 
+@app.route("/admin/api/sentiment_chart", methods=["GET"])
+def admin_sentiment_chart_data():
+    """Chart data for everyone's mood sentiment: ?start=&end=&bucket=day|week|month"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"error": "Admin access required"}), 403
+
+    try:
+        return jsonify(sa.sentiment_series(moodtracking_col, **chart_range_args())), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
 @app.route("/track_page", methods=["POST"])
 def track_page():
     """Track page visits with user information"""
@@ -2686,57 +2989,80 @@ SENDER = os.environ.get("CRISIS_EMAIL")
 APP_PWD = os.environ.get("CRISIS_APP_PASSWORD")
 RECEIVER = os.environ.get("CRISIS_RECEIVER")
 
-executor = ThreadPoolExecutor(max_workers=4)
+def crisis_alert(mailer, crisis_doc):
+    """Outbox document for one crisis log; dedupe_key makes it one email per crisis"""
+    return mailer.new_alert(
+        "🚨 Crisis Alert",
+        f"Crisis button triggered in dashboard by {crisis_doc.get('username', 'Unknown')} "
+        f"at {crisis_doc['timestamp']:%Y-%m-%d %H:%M:%S}.",
+        dedupe_key=f"crisis:{crisis_doc['_id']}",
+        crisis_id=crisis_doc["_id"]
+    )
+
+def write_crisis_receipt(alert):
+    """Copy an alert's delivery state onto the crisis log it belongs to"""
+    if alert.get("crisis_id") is None:
+        return
+    crisis_col.update_one({"_id": alert["crisis_id"]}, {"$set": {"notification": {
+        "status": alert["status"],
+        "tracking_id": alert["tracking_id"],
+        "attempts": alert.get("attempts", 0),
+        "sent_at": alert.get("sent_at"),
+        "last_error": alert.get("last_error"),
+        "updated_at": datetime.now()
+    }}})
+    crisis_events.publish({"type": "notification", "id": str(alert["crisis_id"]), "notification": alert["status"]})
+
+def enqueue_unsent_crises(mailer):
+    """Queue alerts for crisis logs whose outbox insert never happened (no transactions)"""
+    enqueue_unsent(mailer, crisis_col, crisis_alert)
+
+def mongo_supports_transactions():
+    try:
+        hello = client.admin.command("hello")
+    except PyMongoError:
+        return False
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+MONGO_TRANSACTIONS = mongo_supports_transactions()
+crisis_col.create_index("notification.status")
+crisis_col.create_index([("resolved", 1), ("_id", -1)])
+# For crisis_changes()
+crisis_col.create_index("timestamp")
+crisis_col.create_index("resolved_at", sparse=True)
+crisis_col.create_index("notification.updated_at", sparse=True)
+
+# Background sender draining the crisis_mail_queue outbox over a warm SMTP connection
+crisis_mailer = CrisisMailer(
+    SENDER, APP_PWD, RECEIVER, crisis_mail_col,
+    on_update=write_crisis_receipt,
+    sweep=enqueue_unsent_crises
+) if (SENDER and APP_PWD and RECEIVER) else None
 logging.basicConfig(level=logging.DEBUG)
 CORS(app)   # allow cross-origin calls during dev
 
 @app.route("/send_email", methods=["POST"])
 def send_email():
-    SENDER = os.environ.get("CRISIS_EMAIL")
-    APP_PWD = os.environ.get("CRISIS_APP_PASSWORD")
-    RECEIVER = os.environ.get("CRISIS_RECEIVER")
-
-    if not (SENDER and APP_PWD and RECEIVER):
+    if not crisis_mailer:
         return jsonify({"ok": False, "error": "Missing env vars (CRISIS_EMAIL / CRISIS_APP_PASSWORD / CRISIS_RECEIVER)"}), 500
 
-    msg = EmailMessage()
-    msg["From"] = SENDER
-    msg["To"] = RECEIVER
-    msg["Subject"] = "🚨 Crisis Alert"
-    msg.set_content("Crisis button triggered in dashboard.")
+    tracking_id = crisis_mailer.send_alert(
+        "🚨 Crisis Alert",
+        "Crisis button triggered in dashboard.",
+        username=session.get("username")
+    )
+    return jsonify({"ok": True, "status": "queued", "tracking_id": tracking_id}), 202
 
-    # Attempt 1: SSL on 465
-    try:
-        logging.info("Trying SMTP_SSL smtp.gmail.com:465")
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=20) as smtp:
-            smtp.login(SENDER, APP_PWD)
-            smtp.send_message(msg)
-        logging.info("Email sent via 465")
-        return jsonify({"ok": True, "method": "ssl465"}), 200
-    except Exception as e465:
-        logging.warning("465 attempt failed: %s", repr(e465))
-
-    # Attempt 2: STARTTLS on 587
-    try:
-        logging.info("Trying SMTP STARTTLS smtp.gmail.com:587")
-        with smtplib.SMTP("smtp.gmail.com", 587, timeout=20) as smtp:
-            smtp.ehlo()
-            smtp.starttls()
-            smtp.ehlo()
-            smtp.login(SENDER, APP_PWD)
-            smtp.send_message(msg)
-        logging.info("Email sent via 587")
-        return jsonify({"ok": True, "method": "starttls587"}), 200
-    except Exception as e587:
-        logging.exception("587 attempt failed")
-
-    # Both attempts failed — return both errors
-    return jsonify({
-        "ok": False,
-        "error": "Both connection attempts failed",
-        "details_465": repr(e465),
-        "details_587": repr(e587)
-    }), 500
+
+@app.route("/send_email/<tracking_id>", methods=["GET"])
+def send_email_status(tracking_id):
+    if not crisis_mailer:
+        return jsonify({"ok": False, "error": "Crisis email not configured"}), 500
+
+    status = crisis_mailer.status(tracking_id)
+    if status is None:
+        return jsonify({"ok": False, "error": "Unknown tracking id"}), 404
+    return jsonify({"ok": True, **status}), 200
 
 
 # Login session verification
@@ -2753,33 +3079,80 @@ def session_info():
 
 
 # Add dependencies:
-# pip install google-cloud-speech flask tempfile
+# pip install google-cloud-speech flask
 
 
-# Make sure GOOGLE_APPLICATION_CREDENTIALS env var is set to the JSON key path.
+# Make sure GOOGLE_APPLICATION_CREDENTIALS env var is set to the JSON key path,
+# or transcribe on the server's CPU with TRANSCRIBE_BACKEND=whisper (pip install faster-whisper)
+# or TRANSCRIBE_BACKEND=vosk (pip install vosk, VOSK_MODEL_PATH=<model dir>).
+# TRANSCRIBE_BACKEND=fake is for local development without any of them.
 # configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("transcribe")
 
-def ffmpeg_installed():
+transcription_jobs = TranscriptionJobs(
+    TranscriptionBackend(
+        make_recognizer(),
+        vad=os.getenv("TRANSCRIBE_VAD", "1") != "0",
+        chunk_workers=int(os.getenv("TRANSCRIBE_CHUNK_WORKERS", "4"))
+    ),
+    max_workers=int(os.getenv("TRANSCRIBE_WORKERS", "2")),
+    # Uploads waiting for a worker are held in memory: refuse more than this with a 503
+    max_pending=int(os.getenv("TRANSCRIBE_MAX_PENDING", "20"))
+)
+# How long /transcribe waits for its result before handing back the job id to poll instead
+TRANSCRIBE_WAIT_SECONDS = float(os.getenv("TRANSCRIBE_WAIT_SECONDS", "60"))
+
+# JOURNAL_TRANSCRIBE=1 transcribes voice journals saved without a transcript so search can find them
+JOURNAL_TRANSCRIBE = os.getenv("JOURNAL_TRANSCRIBE", "0") == "1"
+
+def transcribe_journal_audio(journal_id, audio_bytes, language_code):
+    def store(job):
+        if job["status"] == "done" and job["transcript"]:
+            journals_col.update_one({"journal_id": journal_id},
+                                    {"$set": {"transcript": job["transcript"], "insights_stale": datetime.now()}})
+            journal_insights.wake()
+        elif job["status"] == "failed":
+            logger.warning("Transcript for journal %s failed: %s", journal_id, job["error"])
     try:
-        subprocess.check_output(["ffmpeg", "-version"])
-        return True
-    except Exception:
-        return False
+        return transcription_jobs.submit(audio_bytes, language_code, callback=store)
+    except TranscriptionError as e:
+        # Best effort: the journal is saved either way, just without a transcript
+        logger.warning("Transcript for journal %s not queued: %s", journal_id, e.message)
+        return None
 
-def convert_to_wav(input_path, output_path, sample_rate=16000):
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i", input_path,
-        "-ac", "1",                 # mono
-        "-ar", str(sample_rate),    # sample rate
-        "-sample_fmt", "s16",       # 16-bit
-        output_path
-    ]
-    logger.info("Running ffmpeg command: %s", " ".join(cmd))
-    subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+def transcription_owner():
+    """
+    Who may poll a transcription job: the logged-in user, or for anonymous
+    callers a random token kept in their session cookie, so one anonymous
+    visitor can't read another's transcript by guessing or leaking a job id
+    """
+    if "user_id" in session:
+        return session["user_id"]
+    if "transcribe_token" not in session:
+        session["transcribe_token"] = uuid.uuid4().hex
+    return "anonymous:" + session["transcribe_token"]
+
+def read_transcription_upload():
+    """Return (audio_bytes, language_code) from a /transcribe style request, or raise TranscriptionError"""
+    # AppRequest caps the body while it is parsed, with or without a Content-Length
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        raise TranscriptionError(f"Uploaded audio too large. Max allowed {MAX_UPLOAD_BYTES} bytes.", 413)
+    if 'audio' not in files:
+        logger.warning("No 'audio' in request.files")
+        raise TranscriptionError("No audio file uploaded. Send multipart/form-data with field 'audio'.", 400)
+
+    audio_file = files['audio']
+    logger.info("Received file: filename=%s content_type=%s size=%s", audio_file.filename, audio_file.content_type, request.content_length)
+
+    language_code = request.form.get('languageCode') or request.headers.get('X-Language-Code') or "en-US"
+    logger.info("Using language code: %s", language_code)
+    try:
+        return read_limited(audio_file.stream), language_code
+    except AudioError as e:
+        raise TranscriptionError(e.message, e.status)
 
 @app.route("/transcribe", methods=["POST"])
 def transcribe_audio():
@@ -2787,83 +3160,64 @@ def transcribe_audio():
     Accepts multipart form-data with file field 'audio'.
     Optional form field: 'languageCode' (e.g. 'en-US' or 'hi-IN').
     Returns JSON with either {"transcript": "..."} or {"error": "..."} and proper status code.
+    Waits up to TRANSCRIBE_WAIT_SECONDS for the result, then returns 504 with the
+    job id to poll; use /transcribe/jobs to get a job id back immediately instead.
+    Returns 503 when too many transcriptions are already queued.
     """
     try:
-        # Basic checks
-        if 'audio' not in request.files:
-            logger.warning("No 'audio' in request.files")
-            return jsonify({"error": "No audio file uploaded. Send multipart/form-data with field 'audio'."}), 400
-
-        audio_file = request.files['audio']
-        logger.info("Received file: filename=%s content_type=%s size=%s", audio_file.filename, audio_file.content_type, request.content_length)
-
-        # Save incoming file to temp
-        with tempfile.TemporaryDirectory() as tmpdir:
-            src_path = os.path.join(tmpdir, "input_audio")
-            audio_file.save(src_path)
-            logger.info("Saved incoming audio to %s", src_path)
-
-            # Optional: check file size (in bytes) and reject huge files
-            max_bytes = 10 * 1024 * 1024  # 10 MB
-            file_size = os.path.getsize(src_path)
-            logger.info("Uploaded file size: %d bytes", file_size)
-            if file_size > max_bytes:
-                return jsonify({"error": f"Uploaded audio too large ({file_size} bytes). Max allowed {max_bytes} bytes."}), 413
-
-            # Make sure ffmpeg exists
-            if not ffmpeg_installed():
-                logger.error("ffmpeg not found on server PATH")
-                return jsonify({"error": "Server misconfiguration: ffmpeg not installed on server."}), 500
-
-            wav_path = os.path.join(tmpdir, "converted.wav")
-            try:
-                convert_to_wav(src_path, wav_path, sample_rate=16000)
-            except subprocess.CalledProcessError as e:
-                logger.exception("ffmpeg conversion failed")
-                return jsonify({"error": "Audio conversion failed (ffmpeg error). Are you sending a valid audio blob?"}), 500
-
-            # read converted wav
-            with open(wav_path, "rb") as f:
-                wav_bytes = f.read()
-
-            # Prepare Google Speech client
-            try:
-                client = speech.SpeechClient()
-            except Exception as e:
-                logger.exception("Failed to initialize Google Speech client")
-                return jsonify({"error": "Server misconfiguration: Google Speech client init failed. Check GOOGLE_APPLICATION_CREDENTIALS."}), 500
-
-            language_code = request.form.get('languageCode') or request.headers.get('X-Language-Code') or "en-US"
-            logger.info("Using language code: %s", language_code)
-
-            audio = speech.RecognitionAudio(content=wav_bytes)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=16000,
-                language_code=language_code,
-                enable_automatic_punctuation=True,
-            )
-
-            try:
-                # synchronous recognize (good for short audio < 60s)
-                response = client.recognize(config=config, audio=audio)
-            except Exception as e:
-                logger.exception("Google Speech API error")
-                return jsonify({"error": f"Speech API error: {str(e)}"}), 500
-
-            # Build transcript
-            transcripts = []
-            for result in response.results:
-                transcripts.append(result.alternatives[0].transcript)
-            transcript_text = " ".join(transcripts).strip()
-
-            logger.info("Transcription result: %s", transcript_text)
-            return jsonify({"transcript": transcript_text}), 200
-
+        audio_bytes, language_code = read_transcription_upload()
+        job_id = transcription_jobs.submit(audio_bytes, language_code, transcription_owner())
+        try:
+            job = transcription_jobs.wait(job_id, timeout=TRANSCRIBE_WAIT_SECONDS)
+        except TimeoutError:
+            return jsonify({
+                "error": "Transcription is taking longer than usual.",
+                "job_id": job_id,
+                "status_url": url_for("get_transcription_job", job_id=job_id)
+            }), 504
+        if job["status"] == "failed":
+            return jsonify({"error": job["error"]}), job["error_status"]
+        return jsonify({"transcript": job["transcript"]}), 200
+
+    except TranscriptionError as e:
+        return jsonify({"error": e.message}), e.status
     except Exception as e:
         logger.exception("Unhandled exception in /transcribe")
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+@app.route("/transcribe/jobs", methods=["POST"])
+def create_transcription_job():
+    """
+    Same input as /transcribe; returns 202 with a job id to poll at /transcribe/jobs/<job_id>,
+    or 503 when too many transcriptions are already queued
+    """
+    try:
+        audio_bytes, language_code = read_transcription_upload()
+        job_id = transcription_jobs.submit(audio_bytes, language_code, transcription_owner())
+    except TranscriptionError as e:
+        return jsonify({"error": e.message}), e.status
+
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for("get_transcription_job", job_id=job_id)
+    }), 202
+
+# Jobs are held in the memory of the process that took the upload: serve the
+# /transcribe routes from a single worker process (or sticky sessions) so the
+# poll reaches that process
+@app.route("/transcribe/jobs/<job_id>", methods=["GET"])
+def get_transcription_job(job_id):
+    job = transcription_jobs.get(job_id)
+    if not job or job["owner"] != transcription_owner():
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(transcription_jobs.public_view(job)), 200
+
+@app.route("/transcribe/health", methods=["GET"])
+def transcription_health():
+    health = transcription_jobs.health()
+    return jsonify(health), 200 if health["ok"] else 503
+
 
 # --- Run App ---
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+import io
+import logging
+import subprocess
+import threading
+import time
+import wave
+
+import numpy as np
+
+logger = logging.getLogger("audio_preprocess")
+
+SAMPLE_RATE = 16000
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10 MB
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class AudioError(Exception):
+    """Audio that can't be read or decoded, with the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class FFmpegProbe:
+    """
+    Checks once per process whether ffmpeg is on PATH and which audio codecs it
+    can decode/encode, instead of spawning `ffmpeg -version` on every request.
+    A failed probe is retried after `retry_after` seconds, so installing ffmpeg
+    doesn't need an app restart.
+    """
+
+    AUDIO_CODECS = ("opus", "libopus", "vorbis", "aac", "mp3", "flac", "pcm_s16le", "amrnb")
+
+    def __init__(self, binary="ffmpeg", retry_after=60):
+        self.binary = binary
+        self.retry_after = retry_after
+        self._info = None
+        self._probed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _codecs(self, flag):
+        output = subprocess.check_output([self.binary, "-hide_banner", flag], text=True, stderr=subprocess.DEVNULL)
+        names = set()
+        for line in output.splitlines():
+            parts = line.split()
+            # Codec lines look like " A....D opus   Opus (Opus Interactive Audio Codec)"
+            if len(parts) >= 2 and parts[0].startswith("A") and len(parts[0]) == 6:
+                names.add(parts[1])
+        return sorted(names.intersection(self.AUDIO_CODECS))
+
+    def info(self):
+        with self._lock:
+            stale = self._info is not None and not self._info["available"] \
+                and time.monotonic() - self._probed_at > self.retry_after
+            if self._info is None or stale:
+                try:
+                    version = subprocess.check_output([self.binary, "-version"], text=True).splitlines()[0]
+                    self._info = {
+                        "available": True,
+                        "version": version,
+                        "decoders": self._codecs("-decoders"),
+                        "encoders": self._codecs("-encoders"),
+                    }
+                except Exception:
+                    self._info = {"available": False, "version": None, "decoders": [], "encoders": []}
+                self._probed_at = time.monotonic()
+            return self._info
+
+    @property
+    def available(self):
+        return self.info()["available"]
+
+    def can_encode(self, codec):
+        return codec in self.info()["encoders"]
+
+
+FFMPEG = FFmpegProbe()
+
+
+def read_limited(stream, limit=MAX_UPLOAD_BYTES):
+    """Read an upload stream into memory, stopping as soon as it goes over `limit` bytes"""
+    buf = bytearray()
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            return bytes(buf)
+        buf += chunk
+        if len(buf) > limit:
+            raise AudioError(f"Uploaded audio too large (over {limit} bytes). Max allowed {limit} bytes.", 413)
+
+
+# --- In-process decoding ---
+def is_wav(data):
+    return len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def decode_wav(data):
+    """PCM WAV bytes -> (float32 mono samples in [-1, 1], sample rate)"""
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise AudioError(f"Unreadable WAV file: {e}")
+
+    if width == 1:
+        ints, offset, scale = np.frombuffer(frames, dtype=np.uint8), 128, 128
+    elif width == 2:
+        ints, offset, scale = np.frombuffer(frames, dtype="<i2"), 0, 1 << 15
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints, offset, scale = np.where(ints >= 1 << 23, ints - (1 << 24), ints), 0, 1 << 23
+    elif width == 4:
+        ints, offset, scale = np.frombuffer(frames, dtype="<i4"), 0, 1 << 31
+    else:
+        raise AudioError(f"Unsupported WAV sample width: {width * 8} bits")
+
+    # Downmix by summing channel columns (much faster than mean(axis=1) on a narrow axis)
+    ints = ints[:len(ints) - len(ints) % channels].reshape(-1, channels)
+    samples = ints[:, 0].astype(np.float32)
+    for channel in range(1, channels):
+        samples += ints[:, channel]
+    if offset:
+        samples -= offset * channels
+    samples *= np.float32(1 / (scale * channels))
+    return samples, rate
+
+
+def resample(samples, src_rate, dst_rate=SAMPLE_RATE):
+    """
+    Linear-interpolation resampler. When downsampling, a windowed-sinc low-pass
+    at the new Nyquist frequency runs first so high frequencies don't alias
+    into the speech band.
+    """
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    if src_rate > dst_rate:
+        cutoff = dst_rate / src_rate / 2
+        taps = np.arange(-32, 33)
+        kernel = np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        samples = np.convolve(samples, (kernel / kernel.sum()).astype(np.float32), mode="same")
+    count = int(round(len(samples) * dst_rate / src_rate))
+    positions = np.arange(count, dtype=np.float64) * (src_rate / dst_rate)
+    left = np.minimum(positions.astype(np.int64), len(samples) - 1)
+    right = np.minimum(left + 1, len(samples) - 1)
+    frac = (positions - left).astype(np.float32)
+    return samples[left] + (samples[right] - samples[left]) * frac
+
+
+def to_s16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+# --- ffmpeg pipe ---
+def ffmpeg_decode(data, sample_rate=SAMPLE_RATE, ffmpeg=FFMPEG):
+    """Decode any format ffmpeg knows, piping the bytes through stdin/stdout instead of temp files"""
+    if not ffmpeg.available:
+        logger.error("ffmpeg not found on server PATH")
+        raise AudioError("Server misconfiguration: ffmpeg not installed on server.", 500)
+    cmd = [
+        ffmpeg.binary, "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-ac", "1",                 # mono
+        "-ar", str(sample_rate),    # sample rate
+        "-f", "s16le",              # raw 16-bit PCM, no header
+        "pipe:1"
+    ]
+    proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        logger.error("ffmpeg conversion failed: %s", proc.stderr.decode(errors="replace").strip())
+        raise AudioError("Audio conversion failed (ffmpeg error). Are you sending a valid audio blob?", 500)
+    return proc.stdout
+
+
+def to_pcm16(data, sample_rate=SAMPLE_RATE, ffmpeg=FFMPEG):
+    """
+    Any uploaded audio -> 16-bit mono PCM at `sample_rate`, entirely in memory.
+    PCM WAV is decoded and resampled with NumPy; everything else (webm/opus
+    from the browser recorder, mp3, m4a, ...) goes through an ffmpeg pipe.
+    """
+    if is_wav(data):
+        try:
+            samples, rate = decode_wav(data)
+        except AudioError:
+            # e.g. compressed WAV variants the wave module can't read
+            return ffmpeg_decode(data, sample_rate, ffmpeg)
+        return to_s16(resample(samples, rate, sample_rate))
+    return ffmpeg_decode(data, sample_rate, ffmpeg)
+
+
+# --- Voice activity detection ---
+def speech_segments(pcm, sample_rate=SAMPLE_RATE, frame_ms=30, min_silence_ms=400, pad_ms=200,
+                    threshold_db=12.0, floor_dbfs=-55.0):
+    """
+    Energy-based VAD over 16-bit mono PCM. A frame counts as speech when its
+    energy is `threshold_db` above the recording's noise floor (10th percentile
+    frame energy) and above `floor_dbfs`. Speech runs separated by less than
+    min_silence_ms are merged and each run is padded by pad_ms.
+    Returns [(start_sample, end_sample), ...]; empty when there's no speech.
+    """
+    samples = np.frombuffer(pcm, dtype="<i2")
+    frame = sample_rate * frame_ms // 1000
+    count = len(samples) // frame
+    if count == 0:
+        return [(0, len(samples))] if len(samples) else []
+
+    frames = samples[:count * frame].astype(np.float32).reshape(count, frame) / 32768
+    energy = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    noise_floor, loud = np.percentile(energy, [10, 90])
+    if loud - noise_floor < threshold_db and loud > floor_dbfs:
+        # No quiet stretch to tell speech from silence: keep everything
+        return [(0, len(samples))]
+    threshold = max(noise_floor + threshold_db, floor_dbfs)
+    voiced = energy > threshold
+    if not voiced.any():
+        return []
+
+    # Rising/falling edges of the voiced mask -> [start, end) frame runs
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+    runs = edges.reshape(-1, 2)
+
+    gap = min_silence_ms // frame_ms
+    pad = pad_ms // frame_ms
+    segments = []
+    for start, end in runs:
+        if segments and start - segments[-1][1] < gap:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+    return [
+        (max(start - pad, 0) * frame, min((end + pad) * frame, len(samples)))
+        for start, end in segments
+    ]
+
+
+def split_long(segment, sample_rate, max_seconds):
+    """Cut a segment longer than max_seconds into equal pieces (no silence to cut at)"""
+    start, end = segment
+    limit = int(max_seconds * sample_rate)
+    pieces = -(-(end - start) // limit)
+    step = -(-(end - start) // pieces)
+    return [(s, min(s + step, end)) for s in range(start, end, step)]
+
+
+def vad_chunks(pcm, sample_rate=SAMPLE_RATE, target_seconds=15, max_seconds=50, **vad_options):
+    """
+    Split PCM at silences into chunks of speech that can be transcribed
+    independently. Silence between speech segments is dropped; consecutive
+    segments are packed into one chunk up to target_seconds, and no chunk is
+    longer than max_seconds (so it stays under sync recognize limits).
+    """
+    segments = []
+    for segment in speech_segments(pcm, sample_rate, **vad_options):
+        segments.extend(split_long(segment, sample_rate, max_seconds))
+
+    target = target_seconds * sample_rate
+    chunks, current, current_len = [], [], 0
+    for start, end in segments:
+        if current and current_len + (end - start) > target:
+            chunks.append(b"".join(current))
+            current, current_len = [], 0
+        current.append(pcm[start * 2:end * 2])
+        current_len += end - start
+    if current:
+        chunks.append(b"".join(current))
+    return chunks
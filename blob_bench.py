@@ -0,0 +1,95 @@
+"""
+Concurrent upload throughput for the journal audio blob store.
+
+Uploads `--count` random blobs (a `--duplicates` fraction repeating earlier
+content, like a re-submitted recording) from 1..N threads, checks every key
+reads back byte-identical, runs garbage collection with nothing referenced,
+and prints a JSON report.
+
+    python blob_bench.py --root /tmp/blobs
+    python blob_bench.py --backend s3 --bucket bench --endpoint-url http://localhost:9000
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from blob_store import LocalBlobStore, S3BlobStore, collect_garbage
+
+
+def run(store, payloads, threads):
+    latencies = []
+
+    def upload(data):
+        start = time.perf_counter()
+        key = store.put(data)
+        latencies.append(time.perf_counter() - start)
+        return key
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        keys = list(pool.map(upload, payloads))
+    elapsed = time.perf_counter() - start
+
+    corrupt = sum(
+        1 for key, data in zip(keys, payloads)
+        if key != hashlib.sha256(data).hexdigest() or store.get(key) != data
+    )
+    ordered = sorted(latencies)
+    total = sum(len(data) for data in payloads)
+    return {
+        "threads": threads,
+        "uploads_per_s": round(len(payloads) / elapsed, 1),
+        "mb_per_s": round(total / elapsed / 1e6, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 2),
+        "unique_blobs": len(set(keys)),
+        "corrupt": corrupt,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent uploads to the blob store")
+    parser.add_argument("--backend", choices=["local", "s3"], default="local")
+    parser.add_argument("--root", help="local store directory (default: a temp dir)")
+    parser.add_argument("--bucket", default="blob-bench")
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {"backend": args.backend, "count": args.count, "size_kb": args.size_kb, "runs": []}
+    for threads in args.threads:
+        payloads = []
+        for _ in range(args.count):
+            if payloads and rng.random() < args.duplicates:
+                payloads.append(rng.choice(payloads))
+            else:
+                payloads.append(rng.randbytes(args.size_kb * 1024))
+
+        if args.backend == "s3":
+            store = S3BlobStore(args.bucket, prefix=f"bench-{threads}", endpoint_url=args.endpoint_url)
+            buckets = [b["Name"] for b in store.client.list_buckets().get("Buckets", [])]
+            if args.bucket not in buckets:
+                store.client.create_bucket(Bucket=args.bucket)
+        else:
+            store = LocalBlobStore(os.path.join(args.root or tempfile.mkdtemp(prefix="blobs-"), f"t{threads}"))
+
+        result = run(store, payloads, threads)
+        result["gc"] = collect_garbage(store, referenced=set(), grace_seconds=0)
+        report["runs"].append(result)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
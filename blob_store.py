@@ -0,0 +1,250 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+    ClientError = Exception
+
+logger = logging.getLogger("blob_store")
+
+CHUNK_BYTES = 1024 * 1024
+
+
+def _chunks(data):
+    """Bytes or a readable file object -> iterator of byte chunks"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield bytes(data)
+        return
+    while True:
+        chunk = data.read(CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+def shard_path(key):
+    """ab12cd... -> ab/12/ab12cd...; two levels of 256 directories keep each one small"""
+    return f"{key[:2]}/{key[2:4]}/{key}"
+
+
+class BlobStore:
+    """
+    Content-addressed storage: a blob's key is the SHA-256 of its bytes, so the
+    same recording uploaded twice is stored once and a key never changes meaning.
+    """
+
+    def put(self, data):
+        """Store bytes or a file object and return its key"""
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def open(self, key):
+        """Readable binary file object for the blob"""
+        raise NotImplementedError
+
+    def size(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def keys(self):
+        """Yield (key, last_modified_timestamp) for every blob"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Filesystem path when the blob is on local disk, else None"""
+        return None
+
+    def url(self, key, expires=300):
+        """Short-lived URL the client can fetch the blob from directly, else None"""
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blobs under root/ab/12/<sha256>. Writes go to a temp file in root/tmp while
+    the hash is computed, are fsynced, then renamed into place, so readers never
+    see a partial file and concurrent uploads of the same content are harmless.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def local_path(self, key):
+        return os.path.join(self.root, shard_path(key))
+
+    def put(self, data):
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in _chunks(data):
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            key = digest.hexdigest()
+            path = self.local_path(key)
+            try:
+                # Already stored: refresh mtime so garbage collection treats it as new
+                os.utime(path)
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return key
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def open(self, key):
+        return open(self.local_path(key), "rb")
+
+    def size(self, key):
+        return os.path.getsize(self.local_path(key))
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def keys(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d != "tmp"]
+                continue
+            for name in filenames:
+                yield name, os.path.getmtime(os.path.join(dirpath, name))
+
+    def clean_tmp(self, older_than=3600):
+        """Remove temp files left behind by crashed writers"""
+        removed = 0
+        cutoff = time.time() - older_than
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+class S3BlobStore(BlobStore):
+    """
+    Blobs in an S3-compatible bucket (AWS, MinIO, ...) under prefix/ab/12/<sha256>.
+    Data is spooled to a temp file while hashing (in memory up to 8 MB) and
+    uploaded once the key is known; an existing key is not uploaded again.
+    """
+
+    def __init__(self, bucket, prefix="journal-audio", client=None, endpoint_url=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("S3 blob storage needs boto3 (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{shard_path(key)}" if self.prefix else shard_path(key)
+
+    def put(self, data):
+        digest = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+            for chunk in _chunks(data):
+                digest.update(chunk)
+                spool.write(chunk)
+            key = digest.hexdigest()
+            object_key = self._object_key(key)
+            if self.exists(key):
+                # Already stored; copy onto itself to refresh LastModified for garbage collection
+                self.client.copy_object(Bucket=self.bucket, Key=object_key, MetadataDirective="REPLACE",
+                                        CopySource={"Bucket": self.bucket, "Key": object_key})
+            else:
+                spool.seek(0)
+                self.client.upload_fileobj(spool, self.bucket, object_key)
+        return key
+
+    def get(self, key):
+        return self.open(key).read()
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))["ContentLength"]
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    def url(self, key, expires=300):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object_key(key)}, ExpiresIn=expires)
+
+    def keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/" if self.prefix else ""):
+            for obj in page.get("Contents", []):
+                yield obj["Key"].rsplit("/", 1)[-1], obj["LastModified"].timestamp()
+
+
+def make_blob_store():
+    """BLOB_STORE=local (default, under BLOB_ROOT) or s3 (S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)"""
+    backend = os.getenv("BLOB_STORE", "local").lower()
+    if backend == "s3":
+        return S3BlobStore(os.environ["S3_BUCKET"], os.getenv("S3_PREFIX", "journal-audio"),
+                           endpoint_url=os.getenv("S3_ENDPOINT_URL"))
+    return LocalBlobStore(os.getenv("BLOB_ROOT", os.path.join("data", "blobs")))
+
+
+def collect_garbage(store, referenced, grace_seconds=3600):
+    """
+    Delete blobs no longer referenced by any document. Blobs younger than
+    grace_seconds are kept, since an upload is stored before the document
+    that points at it is inserted.
+    """
+    cutoff = time.time() - grace_seconds
+    deleted = kept = 0
+    for key, modified in store.keys():
+        if key in referenced or modified > cutoff:
+            kept += 1
+            continue
+        store.delete(key)
+        deleted += 1
+    if isinstance(store, LocalBlobStore):
+        store.clean_tmp(grace_seconds)
+    logger.info("Blob GC: deleted %d, kept %d", deleted, kept)
+    return {"deleted": deleted, "kept": kept}
@@ -0,0 +1,85 @@
+"""
+Concurrency check and throughput benchmark for the chart renderer.
+
+Renders `--count` distinct sentiment charts (plus every one of them again
+from a second request thread, as concurrent requests for the same chart
+would) from `--threads` request threads through ChartRenderer, with process
+and thread workers, in PNG and SVG. Every output file is checked to be a
+complete image, and a JSON report with charts/s and file sizes is printed.
+
+    python chart_bench.py --count 300 --threads 16 --workers 4
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sentiment_analysis as sa
+from chart_render import ChartRenderer
+
+
+def complete(path, fmt):
+    with open(path, "rb") as f:
+        data = f.read()
+    if fmt == "png":
+        return data.startswith(b"\x89PNG\r\n\x1a\n") and data.endswith(b"IEND\xaeB`\x82")
+    return data.lstrip().startswith(b"<?xml") and data.rstrip().endswith(b"</svg>")
+
+
+def run(renderer, specs, fmt, threads):
+    requests = specs + specs     # each chart asked for twice, concurrently
+    random.Random(0).shuffle(requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        paths = list(pool.map(lambda spec: sa.cached_chart(spec, fmt, timeout=300), requests))
+    elapsed = time.perf_counter() - start
+
+    unique = set(paths)
+    sizes = [os.path.getsize(p) for p in unique]
+    return {
+        "format": fmt,
+        "workers": renderer.workers,
+        "processes": renderer.processes,
+        "requests": len(requests),
+        "charts": len(unique),
+        "charts_per_s": round(len(unique) / elapsed, 1),
+        "incomplete": sum(1 for p in unique if not complete(p, fmt)),
+        "leftover_tmp": sum(1 for name in os.listdir(sa.CHART_CACHE_DIR) if name.endswith(".tmp")),
+        "median_bytes": int(statistics.median(sizes)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render many charts in parallel through the chart renderer")
+    parser.add_argument("--count", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent request threads")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    specs = []
+    for i in range(args.count):
+        counts = {s: rng.randint(0, 500) for s in sa.SENTIMENTS}
+        specs.append(sa.user_chart_spec(f"bench{i}", counts) if i % 2 else sa.admin_chart_spec(counts))
+
+    report = []
+    for processes in (False, True):
+        renderer = ChartRenderer(workers=args.workers, processes=processes)
+        sa.chart_renderer = renderer
+        for fmt in ("png", "svg"):
+            cache_dir = tempfile.mkdtemp(prefix="charts-")
+            sa.CHART_CACHE_DIR = cache_dir
+            report.append(run(renderer, specs, fmt, args.threads))
+            shutil.rmtree(cache_dir)
+        renderer.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")   # no GUI backend lookup, in this process or in the render workers
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Keep SVG text as <text> instead of outlined glyph paths (several times smaller)
+matplotlib.rcParams["svg.fonttype"] = "none"
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def draw(spec):
+    """
+    Build a Figure from a chart spec without touching pyplot's global state:
+    {"kind": "bar" | "pie", "title": str, "labels": [...], "values": [...], "colors": [...]}
+    """
+    fig = Figure(figsize=spec.get("size", (6, 4)))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    labels, values, colors = spec["labels"], spec["values"], spec.get("colors")
+    if spec["kind"] == "bar":
+        ax.bar(labels, values, color=colors)
+    elif spec["kind"] == "pie":
+        if sum(values) > 0:
+            ax.pie(values, labels=labels, autopct="%1.1f%%", colors=colors)
+        else:
+            ax.text(0.5, 0.5, "No data yet", ha="center", va="center")
+            ax.set_axis_off()
+    else:
+        raise ValueError(f"Unknown chart kind: {spec['kind']}")
+    ax.set_title(spec["title"])
+    return fig
+
+
+def render_to_file(spec, path, fmt="png"):
+    """Draw spec into `path`, via a temp file in the same directory so readers never see half a chart"""
+    if os.path.exists(path):
+        return path
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            draw(spec).savefig(f, format=fmt)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+class ChartRenderer:
+    """
+    Renders chart specs to files on a small worker pool. Processes by default,
+    so rasterizing doesn't hold the web workers' GIL; workers are spawned
+    (not forked from a threaded server) on first use and stay warm.
+    processes=False uses threads, which is safe because draw() never
+    touches pyplot.
+    """
+
+    def __init__(self, workers=2, processes=True):
+        self.workers = workers
+        self.processes = processes
+        if processes:
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chart")
+
+    def submit(self, spec, path, fmt="png"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported chart format: {fmt}")
+        return self._executor.submit(render_to_file, spec, path, fmt)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def make_chart_renderer(processes=True):
+    """CHART_RENDER_WORKERS (default 2); CHART_RENDER_PROCESSES=0/1 overrides `processes`"""
+    setting = os.getenv("CHART_RENDER_PROCESSES")
+    return ChartRenderer(
+        workers=int(os.getenv("CHART_RENDER_WORKERS", "2")),
+        processes=processes if setting is None else setting != "0"
+    )
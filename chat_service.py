@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChatService:
+    """
+    Runs EmotionalChatbot calls on a background asyncio loop so a /chat request
+    never waits longer than its deadline. At most max_concurrency LLM calls are
+    in flight at once; a request that can't get a slot, or whose LLM calls run
+    past the deadline, gets the chatbot's canned fallback reply straight away.
+    Fallbacks the chatbot itself serves (provider errors, open circuit) are
+    flagged the same way.
+    """
+
+    def __init__(self, chatbot, max_concurrency=8, timeout=12.0):
+        self.chatbot = chatbot
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="chat-service", daemon=True)
+        self._thread.start()
+        # The semaphore has to be created on the loop that uses it
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self._loop).result()
+        self.stats = {"requests": 0, "timeouts": 0, "rejected": 0, "in_flight": 0}
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrency)
+
+    async def _call(self, func, *args):
+        return await self._loop.run_in_executor(self._executor, func, *args)
+
+    async def _run(self, message, context, state):
+        """Both LLM calls for one message, -> (response, is_fallback); holds its concurrency slot until the LLM is done"""
+        self.stats["in_flight"] += 1
+        try:
+            state["emotion"] = await self._call(self.chatbot.classify_emotion, message)
+            return await self._call(self.chatbot.generate_reply, message, state["emotion"], context)
+        finally:
+            self.stats["in_flight"] -= 1
+            self._semaphore.release()
+
+    async def _chat(self, message, context, deadline):
+        self.stats["requests"] += 1
+        state = {"emotion": "neutral"}
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            return self.chatbot.fallback_response(state["emotion"]), True
+
+        job = self._loop.create_task(self._run(message, context, state))
+        try:
+            # shield() so a timeout only stops the wait; the job still frees its slot when the LLM returns
+            return await asyncio.wait_for(asyncio.shield(job), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            return self.chatbot.fallback_response(state["emotion"]), True
+
+    def chat(self, message, context=None):
+        """
+        Blocking entry point for Flask views.
+        Returns (response, is_fallback).
+        """
+        deadline = time.monotonic() + self.timeout
+        future = asyncio.run_coroutine_threadsafe(self._chat(message, context, deadline), self._loop)
+        return future.result()
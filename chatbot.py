@@ -2,68 +2,66 @@ import os
 from crewai import Agent, Task, Crew
 from crewai.llm import LLM
 from dotenv import load_dotenv
+from circuit_breaker import CircuitBreaker
+from stigma_filter import filter_stigmatized_words
+
+try:
+    import httpx
+    import litellm
+except ImportError:
+    litellm = None
 
 load_dotenv(dotenv_path="d:/SIH/SoulAce-main/SoulAce/.env")
 api_key = os.getenv("GROQ_API_KEY")
 
 class EmotionalChatbot:
-    def __init__(self, api_key):
+    def __init__(self, api_key, breaker=None, backend=None):
+        """
+        backend: optional callable(agent, description, expected_output) -> str that
+        replaces the crewai/Groq call, e.g. a local stub for offline benchmarks.
+        """
         os.environ["GROQ_API_KEY"] = api_key
         self.llm = LLM(
             model="groq/llama-3.1-8b-instant",
             api_key=api_key,
             max_tokens=512
         )
+        if litellm is not None:
+            # One keep-alive connection pool to the provider shared by every call,
+            # instead of a new TLS handshake per request
+            litellm.client_session = httpx.Client(
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+                timeout=httpx.Timeout(30.0, connect=5.0)
+            )
+        # Trips after repeated provider errors/slow calls so we serve fallbacks instantly
+        self.breaker = breaker or CircuitBreaker(hedge=os.getenv("LLM_HEDGE") == "1")
+        self.backend = backend
         self.setup_agents()
 
+    def run_agent(self, agent, description, expected_output):
+        """Run one task on one agent through the circuit breaker and return the raw text"""
+        backend = self.backend or self.crew_backend
+        return str(self.breaker.call(backend, agent, description, expected_output))
+
+    def crew_backend(self, agent, description, expected_output):
+        """Default backend: a one-task crewai crew on the Groq LLM"""
+        task = Task(
+            description=description,
+            agent=agent,
+            expected_output=expected_output
+        )
+
+        crew = Crew(
+            agents=[agent],
+            tasks=[task],
+            verbose=False
+        )
+
+        return crew.kickoff()
+
     def filter_stigmatized_words(self, text):
-        """Remove stigmatized words from response text"""
-        stigmatized_words = {
-            'crazy', 'insane', 'lunatic', 'psycho', 'psychotic', 'maniac', 'nuts', 'cuckoo', 
-            'loony', 'mad', 'mental', 'deranged', 'unstable', 'unhinged', 'bonkers', 
-            'off their rocker', 'screw loose', 'fruitcake', 'nutjob', 'crackpot', 
-            'basket case', 'headcase', 'freak', 'weirdo', 'oddball', 'spazz', 'lazy', 
-            'unmotivated', 'weak', 'fragile', 'hopeless', 'sad sack', 'moody', 'emo', 
-            'downer', 'dramatic', 'failure', 'quitter', 'pathetic', 'gloomy gus', 
-            'pessimist', 'miserable', 'overreacting', 'worrier', 'paranoid', 'control freak', 
-            'nervous wreck', 'jittery', 'overly sensitive', 'snowflake', 'jumpy', 'fidgety', 
-            'neurotic', 'obsessive', 'nitpicky', 'high-strung', 'stress-head', 'damaged', 
-            'broken', 'weak-minded', 'overly emotional', 'baggage', 'victim mentality', 
-            'drama queen', 'triggered', 'meltdown', 'unstable survivor', 'attention-seeker', 
-            'manipulative', 'selfish', 'cowardly', 'lost cause', 'dangerous', 'schizo', 
-            'split personality', 'split mind', 'delusional', 'hallucinating', 'out of touch', 
-            'space cadet', 'freaked out', 'manic', 'mood swingy', 'unpredictable', 
-            'jekyll and hyde', 'two-faced', 'hysterical', 'perfectionist', 'neat freak', 
-            'anal', 'rigid', 'fussy', 'over-the-top', 'uptight', 'compulsive', 'anorexic', 
-            'bulimic', 'skeleton', 'stick', 'twig', 'fatty', 'whale', 'pig', 'glutton', 
-            'greedy', 'disgusting', 'gross', 'vain', 'retarded', 'slow', 'dumb', 'stupid', 
-            'idiot', 'moron', 'imbecile', 'simpleton', 'thick', 'handicapped', 'sped', 
-            'special', 'window-licker', 'shrink', 'quack', 'pill-popper', 'druggie', 
-            'medicated', 'institutionalized', 'asylum case', 'padded room', 'straitjacket', 
-            'shock therapy', 'lobotomized', 'labelled', 'disordered'
-        }
-        
-        words = text.split()
-        filtered_words = []
-        
-        for word in words:
-            # Clean word for comparison (remove punctuation)
-            clean_word = word.lower().strip('.,!?;:"()[]{}')
-            if clean_word not in stigmatized_words:
-                filtered_words.append(word)
-            else:
-                # Replace with supportive alternative
-                if clean_word in ['crazy', 'insane', 'nuts', 'mad']:
-                    filtered_words.append('overwhelming')
-                elif clean_word in ['weak', 'fragile']:
-                    filtered_words.append('human')
-                elif clean_word in ['failure', 'hopeless']:
-                    filtered_words.append('capable')
-                elif clean_word in ['broken', 'damaged']:
-                    filtered_words.append('healing')
-                # For other words, just skip them
-        
-        return ' '.join(filtered_words)
+        """Remove stigmatized words and phrases from response text"""
+        return filter_stigmatized_words(text)
 
     def setup_agents(self):
         # Classifier Agent
@@ -132,8 +130,7 @@ class EmotionalChatbot:
         )
 
     def classify_emotion(self, message):
-        task = Task(
-            description=f'''Analyze this message and classify the emotional state: "{message}"
+        description = f'''Analyze this message and classify the emotional state: "{message}"
 
             Respond with exactly one word:
             - "anxiety" if the message shows worry, fear, nervousness, or panic
@@ -141,19 +138,19 @@ class EmotionalChatbot:
             - "stress" if the message shows overwhelm, pressure, or being burnt out
             - "neutral" if none of the above apply
 
-            Message to classify: {message}''',
-            agent=self.classifier_agent,
-            expected_output="One word: anxiety, depression, stress, or neutral"
-        )
+            Message to classify: {message}'''
 
-        crew = Crew(
-            agents=[self.classifier_agent],
-            tasks=[task],
-            verbose=False
-        )
-
-        result = crew.kickoff()
-        emotion = str(result).strip().lower()
+        try:
+            result = self.run_agent(
+                self.classifier_agent,
+                description,
+                "One word: anxiety, depression, stress, or neutral"
+            )
+        except Exception:
+            # Provider error or open circuit; go on with the neutral reply path,
+            # where generate_reply serves (and flags) the fallback
+            return 'neutral'
+        emotion = result.strip().lower()
 
         # Clean up the result to extract just the emotion word
         for word in ['anxiety', 'depression', 'stress', 'neutral']:
@@ -204,7 +201,16 @@ class EmotionalChatbot:
         
         return None
 
-    def generate_response(self, message, emotion):
+    def generate_response(self, message, emotion, context=None):
+        return self.generate_reply(message, emotion, context)[0]
+
+    def generate_reply(self, message, emotion, context=None):
+        """
+        Returns (response, is_fallback). is_fallback is True when the reply is one
+        of the canned ones rather than the LLM's (provider error, open circuit, or
+        nothing usable left after cleaning), so callers can tell and keep it out
+        of conversation memory.
+        """
         if emotion == "anxiety":
             agent = self.anxiety_agent
             prompt = f'''The user is feeling anxious and said: "{message}"
@@ -260,52 +266,50 @@ class EmotionalChatbot:
             Don't be overly formal or structured. Just be a warm, authentic human-like friend 
             having a real conversation. Keep it natural and engaging.'''
 
-        task = Task(
-            description=prompt,
-            agent=agent,
-            expected_output="A natural, conversational response"
-        )
+        if context:
+            prompt = f'''Recent conversation with this user, for context:
+            {context}
 
-        crew = Crew(
-            agents=[agent],
-            tasks=[task],
-            verbose=False
-        )
+            {prompt}'''
 
         try:
-            result = crew.kickoff()
-            response = str(result).strip()
+            result = self.run_agent(agent, prompt, "A natural, conversational response")
+            response = result.strip()
             
             # Clean the response
             cleaned_response = self.clean_response(response)
             
             if cleaned_response and len(cleaned_response.strip()) > 10:
-                return cleaned_response
+                return cleaned_response, False
             else:
                 # Only use fallback if cleaning completely failed
                 if emotion == "neutral":
-                    return "I'd love to hear more about that! What's been going well for you today?"
+                    return "I'd love to hear more about that! What's been going well for you today?", True
                 elif emotion == "depression":
-                    return "I hear you, and I want you to know that what you're feeling is valid. Depression can feel so heavy and overwhelming. You're not alone in this, and reaching out shows real strength. Would you like to talk about what's been weighing on you lately?"
+                    return "I hear you, and I want you to know that what you're feeling is valid. Depression can feel so heavy and overwhelming. You're not alone in this, and reaching out shows real strength. Would you like to talk about what's been weighing on you lately?", True
                 elif emotion == "anxiety":
-                    return "I can sense you're feeling anxious right now. That's completely understandable - anxiety can feel so overwhelming. Let's take this one moment at a time. Can you try taking a slow, deep breath with me?"
+                    return "I can sense you're feeling anxious right now. That's completely understandable - anxiety can feel so overwhelming. Let's take this one moment at a time. Can you try taking a slow, deep breath with me?", True
                 else:  # stress
-                    return "It sounds like you're dealing with a lot right now. Stress can feel so overwhelming when everything piles up. You're handling more than you think you are. What's feeling most pressing for you today?"
+                    return "It sounds like you're dealing with a lot right now. Stress can feel so overwhelming when everything piles up. You're handling more than you think you are. What's feeling most pressing for you today?", True
                     
         except Exception as e:
-            # Silent fallback without showing errors
-            if emotion == "neutral":
-                return "That sounds interesting! Tell me more about what's on your mind."
-            elif emotion == "depression":
-                return "I hear you, and I want you to know that what you're feeling is valid. Depression can feel so heavy and overwhelming. You're not alone in this."
-            elif emotion == "anxiety":
-                return "I can sense you're feeling anxious right now. That's completely understandable. Let's take this one moment at a time."
-            else:  # stress
-                return "It sounds like you're dealing with a lot right now. You're handling more than you think you are."
-
-    def chat(self, message):
+            # Silent fallback without showing errors (CircuitOpenError included)
+            return self.fallback_response(emotion), True
+
+    def fallback_response(self, emotion):
+        """Canned reply used when the LLM call fails or runs out of time"""
+        if emotion == "neutral":
+            return "That sounds interesting! Tell me more about what's on your mind."
+        elif emotion == "depression":
+            return "I hear you, and I want you to know that what you're feeling is valid. Depression can feel so heavy and overwhelming. You're not alone in this."
+        elif emotion == "anxiety":
+            return "I can sense you're feeling anxious right now. That's completely understandable. Let's take this one moment at a time."
+        else:  # stress
+            return "It sounds like you're dealing with a lot right now. You're handling more than you think you are."
+
+    def chat(self, message, context=None):
         emotion = self.classify_emotion(message)
-        response = self.generate_response(message, emotion)
+        response = self.generate_response(message, emotion, context)
         return response
 
 def main():
@@ -0,0 +1,211 @@
+"""
+Offline evaluation and latency benchmark for EmotionalChatbot.
+
+Replays a labelled corpus through classify_emotion, generate_response and chat,
+and prints a JSON report (per-stage latency percentiles, classification
+confusion matrix, fallback rate, stigmatized-term filter hits) that can be
+diffed between runs.
+
+    python chatbot_bench.py                          # deterministic local stub
+    python chatbot_bench.py --stub-latency 0.2 --stub-error-rate 0.05
+    python chatbot_bench.py --backend groq --limit 10 --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import zlib
+from collections import Counter
+
+from chatbot import EmotionalChatbot
+from stigma_filter import STIGMATIZED_REPLACEMENTS, find_stigmatized_terms
+
+EMOTIONS = ['anxiety', 'depression', 'stress', 'neutral']
+
+STUB_KEYWORDS = {
+    'anxiety': ['worry', 'worrying', 'panic', 'nervous', 'scared', 'fear', 'racing', 'anxious'],
+    'depression': ['sad', 'empty', 'hopeless', 'alone', 'low', 'cry', 'worth'],
+    'stress': ['overwhelmed', 'deadline', 'pressure', 'burnt out', 'piling', "can't keep up", 'juggling'],
+}
+
+STUB_REPLIES = [
+    "That sounds really hard, and it makes sense you feel this way. Let's take it one step at a time.",
+    "Thought: the user needs support\nFinal Answer: You're not crazy for feeling this. Try a slow breath in for four counts.",
+    "It's okay to feel weak sometimes, it doesn't make you a failure. What's one small thing you could do today?",
+    "You're not a drama queen for reacting like this. Breaking the work into smaller pieces might help.",
+    "I'd love to hear more about that! What made it stand out for you?",
+]
+
+
+class StubBackend:
+    """
+    Deterministic stand-in for the Groq LLM: keyword classification and canned
+    replies picked by a hash of the prompt. Latency and errors are optional and
+    seeded, so two runs with the same flags give the same report.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, agent, description, expected_output):
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise ConnectionError("stub LLM error")
+
+        if agent.role == 'Emotion Classifier':
+            message = description.rsplit('Message to classify:', 1)[-1].lower()
+            for emotion, keywords in STUB_KEYWORDS.items():
+                if any(keyword in message for keyword in keywords):
+                    return emotion
+            return 'neutral'
+        return STUB_REPLIES[zlib.crc32(description.encode('utf-8')) % len(STUB_REPLIES)]
+
+
+class RecordingBackend:
+    """Wraps the chatbot's backend to keep the raw reply of the last response task"""
+
+    def __init__(self, bot, inner):
+        self.bot = bot
+        self.inner = inner
+        self.last_raw = None
+
+    def __call__(self, agent, description, expected_output):
+        is_response = agent is not self.bot.classifier_agent
+        if is_response:
+            self.last_raw = None
+        raw = str(self.inner(agent, description, expected_output))
+        if is_response:
+            self.last_raw = raw
+        return raw
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def run_benchmark(bot, corpus, repeat=1):
+    original_backend = bot.backend
+    recorder = RecordingBackend(bot, original_backend or bot.crew_backend)
+    bot.backend = recorder
+
+    timings = {"classify_emotion": [], "generate_response": [], "chat": []}
+    confusion = {expected: {predicted: 0 for predicted in EMOTIONS} for expected in EMOTIONS}
+    filter_hits = Counter()
+    fallbacks = 0
+    responses = 0
+    errors = 0
+
+    for _ in range(repeat):
+        for item in corpus:
+            message = item["message"]
+
+            start = time.perf_counter()
+            try:
+                emotion = bot.classify_emotion(message)
+            except Exception:
+                # classify_emotion falls back to neutral on provider errors, so this is a bug
+                errors += 1
+                emotion = 'neutral'
+            timings["classify_emotion"].append(time.perf_counter() - start)
+            if item.get("emotion") in confusion:
+                confusion[item["emotion"]][emotion] += 1
+
+            start = time.perf_counter()
+            _, is_fallback = bot.generate_reply(message, emotion)
+            timings["generate_response"].append(time.perf_counter() - start)
+
+            responses += 1
+            raw = recorder.last_raw
+            if is_fallback:
+                fallbacks += 1
+            if raw:
+                # Terms without their punctuation, so "failure." counts as "failure"
+                filter_hits.update(term.lower() for term in find_stigmatized_terms(raw))
+
+            start = time.perf_counter()
+            try:
+                bot.chat(message)
+            except Exception:
+                errors += 1
+            timings["chat"].append(time.perf_counter() - start)
+
+    bot.backend = original_backend
+    labelled = sum(sum(row.values()) for row in confusion.values())
+    correct = sum(confusion[emotion][emotion] for emotion in EMOTIONS)
+    return {
+        "messages": len(corpus) * repeat,
+        "latency": {stage: percentiles(samples) for stage, samples in timings.items()},
+        "classification": {
+            "accuracy": round(correct / labelled, 4) if labelled else None,
+            "confusion_matrix": confusion,
+        },
+        "fallback_rate": round(fallbacks / responses, 4) if responses else 0.0,
+        "errors": errors,
+        "filter": {
+            "hits": sum(filter_hits.values()),
+            "replaced": sum(n for term, n in filter_hits.items() if term in STIGMATIZED_REPLACEMENTS),
+            "by_term": dict(filter_hits.most_common()),
+        },
+        "breaker": bot.breaker.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EmotionalChatbot against a labelled message corpus")
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_corpus.json"))
+    parser.add_argument("--backend", choices=["stub", "groq"], default="stub")
+    parser.add_argument("--limit", type=int, default=None, help="only replay the first N messages")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds of simulated latency per stub call")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)[:args.limit]
+
+    if args.backend == "stub":
+        bot = EmotionalChatbot("stub-key", backend=StubBackend(args.stub_latency, args.stub_error_rate, args.seed))
+    else:
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            parser.error("GROQ_API_KEY is required for --backend groq")
+        bot = EmotionalChatbot(api_key)
+
+    report = run_benchmark(bot, corpus, args.repeat)
+    report["backend"] = args.backend
+    report["corpus"] = os.path.basename(args.corpus)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to the LLM provider.
+
+    closed    -> calls go through; the last `window` outcomes are tracked, and a
+                 call counts as failed if it raised or took longer than slow_call_seconds
+    open      -> once the failure rate reaches failure_rate (with at least min_calls
+                 recorded), calls fail fast with CircuitOpenError for reset_timeout seconds
+    half_open -> one probe call is let through; success closes the breaker, failure re-opens it
+
+    With hedging on, a call still running after the hedge_percentile latency of recent
+    successful calls gets a second attempt in parallel, and whichever returns first wins.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, slow_call_seconds=10.0,
+                 reset_timeout=30.0, hedge=False, hedge_percentile=0.95, hedge_min_delay=1.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._latencies = deque(maxlen=200)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge") if hedge else None
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "slow_calls": 0,
+            "short_circuited": 0, "opened": 0, "hedged": 0, "hedge_wins": 0
+        }
+
+    def _before_call(self):
+        """Admit a call or raise CircuitOpenError; True if the call is the half-open probe"""
+        with self._lock:
+            self.counters["calls"] += 1
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.counters["short_circuited"] += 1
+                    raise CircuitOpenError("LLM provider circuit is open")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.counters["short_circuited"] += 1
+                    raise CircuitOpenError("LLM provider circuit is half-open; probe in flight")
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def _after_call(self, ok, elapsed, probe):
+        with self._lock:
+            slow = elapsed > self.slow_call_seconds
+            failed = not ok or slow
+            if ok:
+                self.counters["successes"] += 1
+                self._latencies.append(elapsed)
+            else:
+                self.counters["failures"] += 1
+            if slow:
+                self.counters["slow_calls"] += 1
+
+            if probe:
+                self._probe_in_flight = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            if self.state != self.CLOSED:
+                # Let through while closed but finished after the breaker opened:
+                # only the probe decides what happens next
+                return
+
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.counters["opened"] += 1
+
+    def _hedge_delay(self):
+        if len(self._latencies) < self.min_calls:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(int(len(ordered) * self.hedge_percentile), len(ordered) - 1)
+        return max(ordered[index], self.hedge_min_delay)
+
+    def _call_hedged(self, func, *args):
+        delay = self._hedge_delay()
+        first = self._hedge_pool.submit(func, *args)
+        if delay is None:
+            return first.result()
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        with self._lock:
+            self.counters["hedged"] += 1
+        second = self._hedge_pool.submit(func, *args)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        with self._lock:
+                            self.counters["hedge_wins"] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, func, *args):
+        probe = self._before_call()
+        start = time.monotonic()
+        try:
+            # The probe is a single attempt, not hedged
+            if self._hedge_pool is not None and not probe:
+                result = self._call_hedged(func, *args)
+            else:
+                result = func(*args)
+        except Exception:
+            self._after_call(False, time.monotonic() - start, probe)
+            raise
+        self._after_call(True, time.monotonic() - start, probe)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "state": self.state,
+                "failure_rate": round(sum(self._outcomes) / len(self._outcomes), 3) if self._outcomes else 0.0,
+                "window_size": len(self._outcomes),
+                "p50_latency": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "p95_latency": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3) if latencies else None,
+                "hedging": self.hedge,
+                "seconds_until_probe": round(max(self.reset_timeout - (time.monotonic() - self._opened_at), 0), 1)
+                                       if self.state == self.OPEN else None,
+                "counters": dict(self.counters)
+            }
@@ -0,0 +1,88 @@
+"""
+Memory and prompt-size benchmark for the chat conversation store.
+
+Feeds `--sessions` sessions `--turns` turns each of generated chat (user
+messages and bot replies of realistic length) through ConversationStore, then
+prints a JSON report: memory held by the store (tracemalloc), the estimated
+token size of the context each session would add to the prompt, and the time
+per add_turn/get_context pair. With `--mongo-uri` the turns go through a
+scratch collection, so the time includes the read and versioned save each turn
+makes; the collection is dropped afterwards.
+
+    python conversation_bench.py --sessions 5000 --turns 20
+    python conversation_bench.py --sessions 200 --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from conversation_memory import ConversationStore, estimate_tokens
+
+WORDS = (
+    "i have been feeling anxious about work and i cannot sleep well lately my family "
+    "keeps asking what is wrong but i do not know how to explain it to them"
+).split()
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def run(store, sessions, turns, rng):
+    timings = []
+    for turn in range(turns):
+        for n in range(sessions):
+            session_id = f"bench-{n}"
+            start = time.perf_counter()
+            store.get_context(session_id)
+            store.add_turn(session_id, sentence(rng, 5, 60), sentence(rng, 30, 120))
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure conversation memory size and prompt context length")
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--mongo-uri", help="store turns in a scratch collection on this server")
+    args = parser.parse_args()
+
+    collection = None
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        collection = MongoClient(args.mongo_uri)["conversation_bench"]["conversations"]
+        collection.drop()
+
+    store = ConversationStore(collection, max_sessions=max(args.sessions, 1))
+    if collection is not None:
+        store.ensure_indexes()
+    rng = random.Random(0)
+
+    tracemalloc.start()
+    timings = run(store, args.sessions, args.turns, rng)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    context_tokens = [estimate_tokens(store.get_context(f"bench-{n}")) for n in range(args.sessions)]
+    print(json.dumps({
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "backend": "mongo" if collection is not None else "memory",
+        "held_mb": round(held / 2 ** 20, 1),
+        "peak_mb": round(peak / 2 ** 20, 1),
+        "context_tokens_median": statistics.median(context_tokens),
+        "context_tokens_max": max(context_tokens),
+        "context_token_budget": store.context_tokens,
+        "turn_ms_median": round(statistics.median(timings) * 1000, 3),
+        "turn_ms_p95": round(sorted(timings)[int(len(timings) * 0.95)] * 1000, 3),
+    }, indent=2))
+
+    if collection is not None:
+        collection.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import deque, OrderedDict
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) used for prompt budgeting"""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a word boundary"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(' ', 1)[0]
+    return cut + '…'
+
+
+class Conversation:
+    """
+    Recent turns of one chat session plus a rolling summary of older ones.
+    `version` counts saves to Mongo: None for a session with no document yet.
+    """
+
+    __slots__ = ('turns', 'summary', 'version', 'last_active')
+
+    def __init__(self, max_turns, turns=(), summary='', version=None):
+        self.turns = deque(turns, maxlen=max_turns)
+        self.summary = summary
+        self.version = version
+        self.last_active = time.monotonic()
+
+
+class ConversationStore:
+    """
+    Per-session chat memory: the last N turns with a rolling summary of
+    everything older, stored in MongoDB so sessions survive restarts and are
+    shared by every worker process. Each turn reads the conversation from
+    Mongo and saves it back only if its `version` is unchanged, re-reading and
+    retrying if another worker or thread saved a turn in between. The copy kept
+    in memory is served when Mongo can't be read, and is the only copy without
+    a collection; idle sessions are dropped from it. Mongo deletes
+    conversations once they have been idle for `retention` seconds (see
+    ensure_indexes).
+    """
+
+    def __init__(self, collection=None, max_turns=6, summary_tokens=200,
+                 context_tokens=600, idle_timeout=30 * 60, max_sessions=5000,
+                 retention=30 * 24 * 3600, max_save_attempts=5):
+        self.collection = collection
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self.context_tokens = context_tokens
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.retention = retention
+        self.max_save_attempts = max_save_attempts
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def ensure_indexes(self):
+        """
+        One conversation per session_id (two workers starting the same session
+        can't both insert it), and let Mongo expire conversations idle for
+        `retention` seconds
+        """
+        try:
+            self.collection.create_index("session_id", unique=True)
+        except OperationFailure:
+            # Replace the non-unique index earlier versions created
+            self.collection.drop_index("session_id_1")
+            self.collection.create_index("session_id", unique=True)
+        self.collection.create_index("updated_at", expireAfterSeconds=self.retention)
+
+    def _fetch(self, session_id):
+        """Read a conversation from Mongo; None if the read failed"""
+        try:
+            doc = self.collection.find_one({"session_id": session_id}, {"_id": 0})
+        except Exception as e:
+            print(f"Conversation load failed: {e}")
+            return None
+        if doc is None:
+            return Conversation(self.max_turns)
+        turns = [(t["user"], t["bot"]) for t in doc.get("turns", [])]
+        # Documents saved before versioning count as version 0
+        return Conversation(self.max_turns, turns[-self.max_turns:], doc.get("summary", ""), doc.get("version", 0))
+
+    def _cache(self, session_id, conversation=None):
+        """
+        Make `conversation` the copy kept in memory and return it; without one,
+        return the copy already kept, or a new empty conversation
+        """
+        with self._lock:
+            if conversation is None:
+                conversation = self._sessions.get(session_id) or Conversation(self.max_turns)
+            self._sessions[session_id] = conversation
+            self._sessions.move_to_end(session_id)
+            conversation.last_active = time.monotonic()
+            self._evict()
+            return conversation
+
+    def _load(self, session_id):
+        """
+        Return the conversation as Mongo has it, falling back to the copy in
+        memory when there is no collection or the read fails. Call without
+        holding the lock: the Mongo read runs outside it so a request only
+        waits on its own round trip.
+        """
+        loaded = self._fetch(session_id) if self.collection is not None else None
+        return self._cache(session_id, loaded)
+
+    def _evict(self):
+        """Drop idle sessions, and the least recently used ones past max_sessions"""
+        now = time.monotonic()
+        if now - self._last_sweep >= 60:
+            self._last_sweep = now
+            idle = [sid for sid, c in self._sessions.items() if now - c.last_active > self.idle_timeout]
+            for sid in idle:
+                del self._sessions[sid]
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _fold_into_summary(self, summary, user_message):
+        """Keep a short trail of what the user talked about in turns that fell out of the window"""
+        points = [summary] if summary else []
+        points.append(truncate_to_tokens(' '.join(user_message.split()), 40))
+        summary = ' | '.join(points)
+        # Drop the oldest points first once the summary outgrows its budget
+        while estimate_tokens(summary) > self.summary_tokens and ' | ' in summary:
+            summary = summary.split(' | ', 1)[1]
+        return truncate_to_tokens(summary, self.summary_tokens)
+
+    def _with_turn(self, conversation, user_message, bot_response):
+        """A copy of conversation with the turn added, one save later"""
+        summary = conversation.summary
+        if len(conversation.turns) == self.max_turns:
+            summary = self._fold_into_summary(summary, conversation.turns[0][0])
+        turns = [*conversation.turns, (user_message, bot_response)]
+        return Conversation(self.max_turns, turns[-self.max_turns:], summary, (conversation.version or 0) + 1)
+
+    def _save(self, session_id, previous_version, conversation):
+        """
+        Write conversation over the version it was built from. False if another
+        save got there first.
+        """
+        doc = {
+            "turns": [{"user": user, "bot": bot} for user, bot in conversation.turns],
+            "summary": conversation.summary,
+            "version": conversation.version,
+            # UTC, as the TTL index compares against it
+            "updated_at": datetime.utcnow()
+        }
+        if previous_version is None:
+            try:
+                self.collection.insert_one({"session_id": session_id, **doc})
+            except DuplicateKeyError:
+                return False
+            return True
+        # Version 0 is a document from before versioning, with no version field (matched by None)
+        query = {"session_id": session_id, "version": previous_version or None}
+        return self.collection.update_one(query, {"$set": doc}).matched_count == 1
+
+    def add_turn(self, session_id, user_message, bot_response):
+        if self.collection is None:
+            conversation = self._load(session_id)
+            with self._lock:
+                updated = self._with_turn(conversation, user_message, bot_response)
+                conversation.turns, conversation.summary = updated.turns, updated.summary
+                conversation.last_active = time.monotonic()
+            return
+
+        # Usually read by get_context moments ago; if it has gone stale the save fails and it is re-read
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+        if conversation is None:
+            conversation = self._load(session_id)
+        for _ in range(self.max_save_attempts):
+            updated = self._with_turn(conversation, user_message, bot_response)
+            try:
+                if self._save(session_id, conversation.version, updated):
+                    self._cache(session_id, updated)
+                    return
+            except Exception as e:
+                print(f"Conversation save failed: {e}")
+                # Keep the turn in memory at least
+                self._cache(session_id, updated)
+                return
+            # Someone else saved a turn in between: build on theirs
+            conversation = self._load(session_id)
+        print(f"Conversation save for {session_id} gave up after {self.max_save_attempts} conflicting saves")
+
+    def get_context(self, session_id):
+        """
+        Build the conversation context for the next prompt: the rolling summary,
+        then as many of the newest turns as fit in context_tokens. Returns '' for
+        a new session.
+        """
+        conversation = self._load(session_id)
+        with self._lock:
+            conversation.last_active = time.monotonic()
+            turns = list(conversation.turns)
+            summary = conversation.summary
+
+        summary_line = f"Earlier the user talked about: {summary}" if summary else ""
+        budget = self.context_tokens - estimate_tokens(summary_line)
+        lines = []
+        for user_message, bot_response in reversed(turns):
+            turn = f"User: {user_message}\nYou: {bot_response}"
+            cost = estimate_tokens(turn)
+            if cost > budget:
+                break
+            lines.append(turn)
+            budget -= cost
+        lines.reverse()
+
+        if summary_line:
+            lines.insert(0, summary_line)
+        return '\n'.join(lines)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.collection is not None:
+            try:
+                self.collection.delete_one({"session_id": session_id})
+            except Exception as e:
+                print(f"Conversation clear failed: {e}")
+
+    def __len__(self):
+        return len(self._sessions)
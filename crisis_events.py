@@ -0,0 +1,129 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("crisis_events")
+
+
+def event_key(event):
+    """What makes two events the same, for dropping the copy that arrives both ways"""
+    if event["type"] == "notification":
+        return event["type"], event["id"], event["notification"]
+    return event["type"], event["id"]
+
+
+class CrisisEventBroker:
+    """
+    Fan-out of crisis events to connected admin streams.
+
+    Events published in this process reach this process's streams straight
+    away through a bounded queue per subscriber (a subscriber that stops
+    reading just misses those instead of blocking publishers). With `poll`,
+    each stream also asks Mongo every poll_interval seconds for what changed
+    since its last look, so crises logged or resolved by other worker
+    processes arrive within a few seconds too. Polls look back `overlap`
+    seconds further to cover late writes and clock differences between
+    workers; events seen twice are only sent once.
+
+    poll: callable(since: datetime) -> iterable of events, comparing against
+    the datetime.now() stamps the app writes.
+    """
+
+    def __init__(self, max_queued=100, poll=None, poll_interval=2.0, overlap=10.0):
+        self.max_queued = max_queued
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.overlap = overlap
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queued)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def _changes(self, since):
+        """Polled events since `since` (less the overlap), or None if Mongo couldn't be read"""
+        try:
+            return list(self.poll(since - timedelta(seconds=self.overlap)))
+        except Exception as e:
+            logger.warning("Crisis event poll failed: %s", e)
+            return None
+
+    def stream(self, heartbeat=15, since=None, max_age=None):
+        """
+        Generator of Server-Sent Events for one admin connection. Each event's
+        id is the time of the poll it was read after; pass it back as `since`
+        (the browser sends it as Last-Event-ID when it reconnects) to pick up
+        what happened while the connection was down.
+
+        With max_age the stream ends after that many seconds, so a dashboard
+        left open doesn't hold a worker thread forever; the browser reconnects
+        on its own, and resumes from the id sent just before closing.
+        """
+        q = self.subscribe()
+        seen = OrderedDict()    # event_key -> monotonic time first sent
+        cursor = since or datetime.now()
+        next_poll = time.monotonic() if self.poll else float("inf")
+        last_sent = time.monotonic()
+        close_at = last_sent + max_age if max_age else float("inf")
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                wait = min(next_poll, last_sent + heartbeat, close_at) - time.monotonic()
+                events = []
+                try:
+                    events.append(q.get(timeout=max(wait, 0)))
+                    while True:
+                        events.append(q.get_nowait())
+                except queue.Empty:
+                    pass
+                if time.monotonic() >= next_poll:
+                    polled_at = datetime.now()
+                    changes = self._changes(cursor)
+                    if changes is not None:
+                        events.extend(changes)
+                        cursor = polled_at
+                    next_poll = time.monotonic() + self.poll_interval
+
+                now = time.monotonic()
+                while seen and now - next(iter(seen.values())) > 3 * (self.overlap + self.poll_interval):
+                    seen.popitem(last=False)
+                for event in events:
+                    key = event_key(event)
+                    if key in seen:
+                        continue
+                    seen[key] = now
+                    last_sent = now
+                    yield f"id: {cursor.isoformat()}\nevent: crisis\ndata: {json.dumps(event, default=str)}\n\n"
+                if now >= close_at:
+                    # An id with no data moves the browser's Last-Event-ID on without firing an event
+                    yield f"id: {cursor.isoformat()}\n\n"
+                    return
+                if now - last_sent >= heartbeat:
+                    # Comment line keeps proxies from closing an idle connection
+                    last_sent = now
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(q)
+
+    def __len__(self):
+        return len(self._subscribers)
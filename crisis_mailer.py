@@ -0,0 +1,312 @@
+import heapq
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger("crisis_mailer")
+
+
+class CrisisMailer:
+    """
+    Sends crisis alert emails from a background worker so the request thread
+    never waits on SMTP.
+
+    Alerts live in an outbox collection (`queue_col`). The worker claims one due
+    alert at a time with a lease, so several app processes can drain the same
+    outbox without sending twice, and an alert whose worker died is picked up
+    again once its lease expires. Failed sends are retried with exponential
+    backoff capped at max_delay, for as long as it takes: an alert is never
+    given up on, but after max_attempts its status becomes "failing" (and each
+    further failure is logged as an error) so the admin dashboard can flag it.
+    Every status change is passed to `on_update` (used to write delivery
+    receipts back onto the crisis log). `sweep(mailer)` is called every
+    poll_interval to enqueue anything that was logged but never made it into
+    the outbox. Without a collection alerts are kept in memory only.
+
+    The worker keeps one authenticated connection open (SSL on 465, falling back
+    to STARTTLS on 587), sends a NOOP every `keepalive` seconds while idle, and
+    reconnects when the server drops it.
+    """
+
+    # Statuses the worker still has to send
+    PENDING = ["queued", "retrying", "failing"]
+
+    def __init__(self, sender, password, receiver, queue_col=None, host="smtp.gmail.com",
+                 timeout=20, keepalive=60, max_attempts=6, base_delay=5,
+                 max_delay=15 * 60, poll_interval=5, lease_seconds=120, on_update=None, sweep=None):
+        self.sender = sender
+        self.password = password
+        self.receiver = receiver
+        self.queue_col = queue_col
+        self.host = host
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.on_update = on_update
+        self.sweep = sweep
+
+        self._wake = threading.Event()
+        self._memory = {}       # tracking_id -> alert, when there is no queue_col
+        self._due = []          # heap of (next_attempt_at, tracking_id) for the in-memory queue
+        self._dedupe = {}       # dedupe_key -> tracking_id for the in-memory queue
+        self._memory_lock = threading.Lock()
+        self._smtp = None
+        self._last_used = 0.0
+        self._last_sweep = 0.0
+
+        if self.queue_col is not None:
+            self.queue_col.create_index("tracking_id", unique=True)
+            self.queue_col.create_index("dedupe_key", unique=True, sparse=True)
+            self.queue_col.create_index([("status", 1), ("next_attempt_at", 1)])
+
+        self._thread = threading.Thread(target=self._run, name="crisis-mailer", daemon=True)
+        self._thread.start()
+
+    # --- Public API ---
+    def new_alert(self, subject, body, dedupe_key=None, **extra):
+        """Build an outbox document; insert it yourself (e.g. inside a transaction) and call wake()"""
+        now = datetime.now()
+        alert = {
+            "tracking_id": uuid.uuid4().hex,
+            "subject": subject,
+            "body": body,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+            **extra
+        }
+        if dedupe_key is not None:
+            alert["dedupe_key"] = dedupe_key
+        return alert
+
+    def send_alert(self, subject, body, dedupe_key=None, **extra):
+        """
+        Queue an alert and return its tracking id straight away.
+        A second alert with the same dedupe_key returns the first one's tracking id.
+        """
+        alert = self.new_alert(subject, body, dedupe_key, **extra)
+        if self.queue_col is not None:
+            if dedupe_key is None:
+                self.queue_col.insert_one(dict(alert))
+            else:
+                alert.pop("dedupe_key")
+                alert = self.queue_col.find_one_and_update(
+                    {"dedupe_key": dedupe_key},
+                    {"$setOnInsert": alert},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+        else:
+            with self._memory_lock:
+                if dedupe_key is not None and dedupe_key in self._dedupe:
+                    return self._dedupe[dedupe_key]
+                self._dedupe[dedupe_key] = alert["tracking_id"]
+                self._memory[alert["tracking_id"]] = alert
+                heapq.heappush(self._due, (alert["next_attempt_at"], alert["tracking_id"]))
+        self.wake()
+        return alert["tracking_id"]
+
+    def wake(self):
+        self._wake.set()
+
+    def status(self, tracking_id):
+        if self.queue_col is not None:
+            alert = self.queue_col.find_one({"tracking_id": tracking_id}, {"_id": 0, "body": 0})
+        else:
+            alert = self._memory.get(tracking_id)
+        if alert is None:
+            return None
+        return {k: v for k, v in alert.items() if k not in ("body", "_id", "lease_until")}
+
+    # --- Outbox ---
+    def _claim(self):
+        """Take the next due alert, marking it as being sent and counting the attempt"""
+        now = datetime.now()
+        if self.queue_col is not None:
+            return self.queue_col.find_one_and_update(
+                {"$or": [
+                    {"status": {"$in": self.PENDING}, "next_attempt_at": {"$lte": now}},
+                    {"status": "sending", "lease_until": {"$lt": now}}
+                ]},
+                {
+                    "$set": {"status": "sending", "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+
+        with self._memory_lock:
+            if not self._due or self._due[0][0] > now:
+                return None
+            alert = self._memory[heapq.heappop(self._due)[1]]
+            alert["status"] = "sending"
+            alert["attempts"] += 1
+            return alert
+
+    def _save(self, alert, **fields):
+        alert.update(fields)
+        if self.queue_col is not None:
+            try:
+                self.queue_col.update_one({"tracking_id": alert["tracking_id"]}, {"$set": fields})
+            except Exception as e:
+                logger.warning("Could not update crisis alert %s: %r", alert["tracking_id"], e)
+        elif alert["status"] in self.PENDING:
+            with self._memory_lock:
+                heapq.heappush(self._due, (alert["next_attempt_at"], alert["tracking_id"]))
+
+        if self.on_update is not None:
+            try:
+                self.on_update(alert)
+            except Exception as e:
+                logger.warning("Crisis alert receipt failed for %s: %r", alert["tracking_id"], e)
+
+    def _next_due_in(self):
+        """Seconds until the earliest scheduled retry, capped at poll_interval"""
+        if self.queue_col is None:
+            with self._memory_lock:
+                if not self._due:
+                    return self.poll_interval
+                due = self._due[0][0]
+        else:
+            doc = self.queue_col.find_one(
+                {"status": {"$in": self.PENDING}},
+                {"next_attempt_at": 1},
+                sort=[("next_attempt_at", 1)]
+            )
+            if doc is None:
+                return self.poll_interval
+            due = doc["next_attempt_at"]
+        return min(max((due - datetime.now()).total_seconds(), 0), self.poll_interval)
+
+    # --- SMTP connection ---
+    def _connect(self):
+        try:
+            smtp = smtplib.SMTP_SSL(self.host, 465, timeout=self.timeout)
+            smtp.login(self.sender, self.password)
+            logger.info("Crisis mailer connected via 465")
+        except Exception as e465:
+            logger.warning("465 attempt failed: %r", e465)
+            smtp = smtplib.SMTP(self.host, 587, timeout=self.timeout)
+            smtp.ehlo()
+            smtp.starttls()
+            smtp.ehlo()
+            smtp.login(self.sender, self.password)
+            logger.info("Crisis mailer connected via 587")
+        self._smtp = smtp
+        self._last_used = time.monotonic()
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _keepalive(self):
+        if self._smtp is None or time.monotonic() - self._last_used < self.keepalive:
+            return
+        try:
+            self._smtp.noop()
+            self._last_used = time.monotonic()
+        except Exception:
+            logger.info("Crisis mailer connection went stale; will reconnect on next send")
+            self._disconnect()
+
+    def _deliver(self, alert):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = self.receiver
+        msg["Subject"] = alert["subject"]
+        msg.set_content(alert["body"])
+
+        for attempt in range(2):
+            if self._smtp is None:
+                self._connect()
+            try:
+                self._smtp.send_message(msg)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                # Server closed an idle connection; reconnect once and resend
+                self._smtp = None
+                if attempt:
+                    raise
+
+    # --- Worker ---
+    def _run(self):
+        while True:
+            try:
+                if self.sweep is not None and time.monotonic() - self._last_sweep >= self.poll_interval:
+                    self._last_sweep = time.monotonic()
+                    self.sweep(self)
+
+                alert = self._claim()
+                if alert is not None:
+                    self._process(alert)
+                    continue
+
+                self._wake.wait(timeout=self._next_due_in())
+                self._wake.clear()
+                self._keepalive()
+            except Exception as e:
+                # Mongo hiccup etc. - never let the worker thread die
+                logger.exception("Crisis mailer worker error: %r", e)
+                time.sleep(self.poll_interval)
+
+    def _retry_delay(self, attempts):
+        """Seconds to wait after the `attempts`th failed send"""
+        # Past max_delay the exponent no longer matters; cap it so it can't overflow
+        return min(self.base_delay * 2 ** min(attempts - 1, 32), self.max_delay)
+
+    def _process(self, alert):
+        attempts = alert["attempts"]
+        try:
+            self._deliver(alert)
+        except Exception as e:
+            self._disconnect()
+            delay = self._retry_delay(attempts)
+            if attempts >= self.max_attempts:
+                logger.error("Crisis alert %s still failing after %d attempts, retrying in %ss: %r",
+                             alert["tracking_id"], attempts, delay, e)
+                status = "failing"
+            else:
+                logger.warning("Crisis alert %s failed (attempt %d), retrying in %ss: %r",
+                               alert["tracking_id"], attempts, delay, e)
+                status = "retrying"
+            self._save(alert, status=status, last_error=repr(e), lease_until=None,
+                       next_attempt_at=datetime.now() + timedelta(seconds=delay))
+            return
+
+        logger.info("Crisis alert %s sent", alert["tracking_id"])
+        self._save(alert, status="sent", sent_at=datetime.now(), lease_until=None)
+
+
+def enqueue_unsent(mailer, log_col, build_alert, grace_seconds=30, limit=100):
+    """
+    Sweep for CrisisMailer: queue alerts for logs in `log_col` that say a
+    notification was queued ("notification.status": "queued") but whose outbox
+    insert never happened, e.g. the process died between the two writes on a
+    Mongo without transactions. `build_alert(mailer, log)` makes the outbox
+    document; logs younger than grace_seconds are left to their own request.
+    """
+    cutoff = datetime.now() - timedelta(seconds=grace_seconds)
+    unsent = {"notification.status": "queued", "notification.swept": {"$exists": False}, "timestamp": {"$lt": cutoff}}
+    for log in log_col.find(unsent).limit(limit):
+        alert = build_alert(mailer, log)
+        alert["tracking_id"] = log["notification"]["tracking_id"]
+        # No-op when the alert is already in the outbox and just hasn't been attempted yet
+        mailer.queue_col.update_one({"dedupe_key": alert.pop("dedupe_key")}, {"$setOnInsert": alert}, upsert=True)
+        log_col.update_one({"_id": log["_id"]}, {"$set": {"notification.swept": True}})
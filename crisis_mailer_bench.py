@@ -0,0 +1,156 @@
+"""
+Burst and throughput benchmark for the crisis alert mailer.
+
+Fires `--alerts` alerts from `--threads` threads at once, spread over
+`--distinct` crisis dedupe keys (so some are repeats of the same crisis, as
+with a double-pressed button), and waits for the mailer's worker to drain
+them into an SMTP server. Prints a JSON report: emails received (should equal
+--distinct), enqueue latency, time to the first and the last delivery, and
+how many SMTP connections were opened.
+
+By default a minimal SMTP sink runs in-process and the mailer talks plain SMTP
+to it (no TLS or login), so the numbers are for the queue, the worker and
+connection reuse, not for Gmail. Point --smtp-port at another local server
+(e.g. `python -m aiosmtpd -n -l localhost:8025`) to use that instead; delivery
+is then not counted. With --mongo-uri the outbox is a scratch collection
+(dropped afterwards) instead of the in-memory queue.
+
+    python crisis_mailer_bench.py --alerts 300 --distinct 200
+    python crisis_mailer_bench.py --mongo-uri mongodb://localhost:27017 --threads 16
+"""
+import argparse
+import json
+import smtplib
+import socketserver
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from crisis_mailer import CrisisMailer
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages: every command is answered 250"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b"QUIT":
+                self.reply("221 bye")
+                return
+            if command == b"DATA":
+                self.reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.delivered.append(time.perf_counter())
+            self.reply("250 ok")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SinkHandler)
+        self.connections = 0
+        self.delivered = []
+        self.lock = threading.Lock()
+
+
+class PlainMailer(CrisisMailer):
+    """CrisisMailer talking plain SMTP to a local server"""
+
+    def __init__(self, *args, port, **kwargs):
+        self.port = port
+        super().__init__(*args, **kwargs)
+
+    def _connect(self):
+        self._smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        self._last_used = time.monotonic()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Burst-test the crisis alert outbox and SMTP worker")
+    parser.add_argument("--alerts", type=int, default=300)
+    parser.add_argument("--distinct", type=int, default=200, help="distinct crises among the alerts")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--smtp-port", type=int, help="use the SMTP server on this local port")
+    parser.add_argument("--mongo-uri", help="keep the outbox in a scratch collection on this server")
+    parser.add_argument("--timeout", type=float, default=60, help="give up waiting for the drain after this")
+    args = parser.parse_args()
+
+    sink = None
+    port = args.smtp_port
+    if port is None:
+        sink = SinkServer()
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        port = sink.server_address[1]
+
+    outbox = None
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        outbox = MongoClient(args.mongo_uri)["crisis_mailer_bench"]["outbox"]
+        outbox.drop()
+
+    finished = {}
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def on_update(alert):
+        if alert["status"] == "sent":
+            with lock:
+                finished[alert["tracking_id"]] = time.perf_counter()
+                if len(finished) == args.distinct:
+                    done.set()
+
+    mailer = PlainMailer("bench@localhost", "", "team@localhost", outbox, host="127.0.0.1", port=port,
+                         poll_interval=0.5, on_update=on_update)
+
+    enqueue_times = []
+
+    def send(n):
+        started = time.perf_counter()
+        mailer.send_alert("Crisis Alert", f"Crisis button pressed ({n % args.distinct})",
+                          dedupe_key=f"crisis:{n % args.distinct}")
+        enqueue_times.append(time.perf_counter() - started)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(send, range(args.alerts)))
+    enqueued = time.perf_counter() - start
+    drained = done.wait(args.timeout)
+
+    report = {
+        "alerts": args.alerts,
+        "distinct": args.distinct,
+        "threads": args.threads,
+        "backend": "mongo" if outbox is not None else "memory",
+        "drained": drained,
+        "sent": len(finished),
+        "enqueue_ms_median": round(statistics.median(enqueue_times) * 1000, 3),
+        "enqueue_all_s": round(enqueued, 3),
+        "first_sent_s": round(min(finished.values()) - start, 3) if finished else None,
+        "all_sent_s": round(max(finished.values()) - start, 3) if finished else None,
+        "sent_per_s": round(len(finished) / (max(finished.values()) - start), 1) if finished else None,
+    }
+    if sink is not None:
+        report["emails_received"] = len(sink.delivered)
+        report["smtp_connections"] = sink.connections
+    print(json.dumps(report, indent=2))
+
+    if outbox is not None:
+        outbox.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Memory and throughput benchmark for history exports.
+
+Seeds a scratch database with `--rows` mood logs for a single user, then
+exports them with the old /download_moods approach (whole history in a
+list, CSV in a StringIO, copied into a BytesIO) and with HistoryExporter
+as CSV, Parquet and Arrow, reading the streamed chunks and throwing them
+away as a client would. Each export runs twice: once for wall time, once
+under tracemalloc for peak Python memory. max_rss_mb is the process's peak
+RSS so far (it only grows, so the old approach runs last). Prints a JSON
+report.
+
+    python export_bench.py --uri mongodb://localhost:27017/ --rows 1000000
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import resource
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+import history_export
+import mood_registry
+from history_export import HistoryExporter
+
+USER_ID = "bench-user"
+
+
+def seed(col, rows, rng, batch=10000):
+    col.drop()
+    start = datetime(2020, 1, 1)
+    docs = []
+    for i in range(rows):
+        docs.append({
+            "mood_id": i + 1,
+            "user_id": USER_ID,
+            "datetime": start + timedelta(minutes=5 * i),
+            **mood_registry.mood_document(rng.choice(mood_registry.ACTIVE_LABELS)),
+        })
+        if len(docs) == batch:
+            col.insert_many(docs)
+            docs = []
+    if docs:
+        col.insert_many(docs)
+
+
+def old_download(col):
+    """What /download_moods did before streaming"""
+    moods = list(col.find({"user_id": USER_ID}).sort("datetime", 1))
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Date", "Time", "Mood"])
+    for mood in moods:
+        dt = mood["datetime"]
+        writer.writerow([dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M:%S"), mood["mood"]])
+    output.seek(0)
+    file_data = io.BytesIO()
+    file_data.write(output.getvalue().encode("utf-8"))
+    file_data.seek(0)
+    yield file_data.getvalue()
+
+
+def consume(chunks):
+    total = largest = count = 0
+    for chunk in chunks:
+        total += len(chunk)
+        largest = max(largest, len(chunk))
+        count += 1
+    return total, largest, count
+
+
+def measure(name, make_chunks):
+    start = time.perf_counter()
+    total, largest, count = consume(make_chunks())
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    consume(make_chunks())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "export": name,
+        "seconds": round(elapsed, 2),
+        "bytes": total,
+        "chunks": count,
+        "largest_chunk_bytes": largest,
+        "peak_python_mb": round(peak / 2 ** 20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run(col, exporter):
+    report = []
+    formats = ["csv"] + (["parquet", "arrow"] if history_export.pa else [])
+    for fmt in formats:
+        report.append(measure(f"stream {fmt}", lambda fmt=fmt: exporter.stream("moods", USER_ID, fmt)))
+    report.append(measure("old csv", lambda: old_download(col)))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-memory and streamed history exports")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="soulace_export_bench")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the rows from a previous run")
+    args = parser.parse_args()
+
+    col = MongoClient(args.uri)[args.db]["moods"]
+    if not args.skip_seed:
+        seed(col, args.rows, random.Random(0))
+    exporter = HistoryExporter({"moods": col, "journals": col.database["journals"],
+                                "assessments": col.database["assessments"]})
+    exporter.ensure_indexes()
+
+    print(json.dumps({"rows": col.count_documents({"user_id": USER_ID}), "results": run(col, exporter)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import csv
+import io
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import mood_registry
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# One exported column: its name, type ("timestamp", "string", "int", "float",
+# "bool") and where its value comes from (a document field, or a function of
+# the document)
+Column = namedtuple("Column", "name type source")
+# utc: the collection stores datetime.utcnow() stamps rather than the
+# datetime.now() ones the rest of the app writes. Date ranges are read and
+# timestamps exported in local time either way.
+Dataset = namedtuple("Dataset", "collection time_field columns utc", defaults=(False,))
+
+
+def _mood_score(doc):
+    return mood_registry.SCORE_TABLE[doc.get("mood_code") or mood_registry.UNKNOWN_CODE]
+
+
+DATASETS = {
+    "moods": Dataset("moods", "datetime", (
+        Column("datetime", "timestamp", "datetime"),
+        Column("mood", "string", "mood"),
+        Column("mood_code", "int", "mood_code"),
+        Column("score", "int", _mood_score),
+    )),
+    "journals": Dataset("journals", "datetime", (
+        Column("datetime", "timestamp", "datetime"),
+        Column("journal_id", "int", "journal_id"),
+        Column("type", "string", "type"),
+        Column("title", "string", "title"),
+        Column("entry", "string", "entry"),
+        Column("transcript", "string", "transcript"),
+        Column("audio_duration", "float", "audio_duration"),
+        Column("is_edited", "bool", "is_edited"),
+    )),
+    "assessments": Dataset("assessments", "timestamp", (
+        Column("timestamp", "timestamp", "timestamp"),
+        Column("test_type", "string", "test_type"),
+        Column("gadTotal", "int", "gadTotal"),
+        Column("gadSeverity", "string", "gadSeverity"),
+        Column("phqTotal", "int", "phqTotal"),
+        Column("phqSeverity", "string", "phqSeverity"),
+        Column("ghqLikertTotal", "int", "ghqLikertTotal"),
+        Column("ghqBimodalTotal", "int", "ghqBimodalTotal"),
+        Column("ghqSeverity", "string", "ghqSeverity"),
+    ), utc=True),
+}
+
+# /download_moods keeps the layout it has always had
+MOOD_DOWNLOAD = Dataset("moods", "datetime", (
+    Column("Date", "string", lambda doc: doc["datetime"].strftime("%Y-%m-%d")),
+    Column("Time", "string", lambda doc: doc["datetime"].strftime("%H:%M:%S")),
+    Column("Mood", "string", "mood"),
+))
+
+
+def _local_to_utc(dt):
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _utc_to_local(dt):
+    return dt.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def _arrow_type(column_type):
+    return {
+        "timestamp": pa.timestamp("ms"),
+        "string": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+    }[column_type]
+
+
+class _Drain:
+    """Write-only file object for pyarrow writers; take() hands over what was written so far"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class HistoryExporter:
+    """
+    Streams a user's mood, journal or assessment history out of MongoDB as
+    CSV, Parquet or an Arrow IPC stream, oldest first, optionally limited to
+    a date range. Rows come straight off the cursor and leave as chunks of
+    `chunk_rows` (CSV) or record batches of `batch_rows` (Parquet row groups,
+    Arrow batches), so memory stays flat however long the history is.
+    Parquet and Arrow need pyarrow.
+    """
+
+    def __init__(self, collections, chunk_rows=1000, batch_rows=50000):
+        self.collections = collections     # Dataset.collection -> pymongo collection
+        self.chunk_rows = chunk_rows
+        self.batch_rows = batch_rows
+
+    def ensure_indexes(self):
+        """(user_id, time field) per dataset, so an export walks the index in order instead of sorting"""
+        for dataset in DATASETS.values():
+            self.collections[dataset.collection].create_index([("user_id", 1), (dataset.time_field, 1)])
+
+    def documents(self, dataset, user_id, start=None, end=None):
+        """Cursor over the user's documents, start and end dates (local time) inclusive"""
+        return self._find(DATASETS[dataset], user_id, start, end)
+
+    def _find(self, spec, user_id, start=None, end=None):
+        if start and end and start > end:
+            raise ValueError("start must not be after end")
+        bound = _local_to_utc if spec.utc else (lambda dt: dt)
+        query = {"user_id": user_id}
+        if start or end:
+            query[spec.time_field] = {}
+        if start:
+            query[spec.time_field]["$gte"] = bound(datetime.combine(start, datetime.min.time()))
+        if end:
+            query[spec.time_field]["$lt"] = bound(datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        projection = {"_id": 0, spec.time_field: 1}
+        projection.update((c.source, 1) for c in spec.columns if isinstance(c.source, str))
+        return (self.collections[spec.collection].find(query, projection)
+                .sort(spec.time_field, 1).batch_size(self.chunk_rows))
+
+    @staticmethod
+    def _rows(spec, docs):
+        getters = [c.source if callable(c.source) else (lambda doc, f=c.source: doc.get(f)) for c in spec.columns]
+        timestamps = [i for i, c in enumerate(spec.columns) if c.type == "timestamp"] if spec.utc else []
+        for doc in docs:
+            row = [get(doc) for get in getters]
+            for i in timestamps:
+                if row[i] is not None:
+                    row[i] = _utc_to_local(row[i])
+            yield row
+
+    def stream(self, dataset, user_id, fmt="csv", start=None, end=None):
+        """
+        Generator of bytes for a response body. Raises ValueError (bad
+        dataset, format or range) or RuntimeError (no pyarrow) before the
+        first chunk, so callers can still answer with an error status.
+        """
+        if dataset not in DATASETS:
+            raise ValueError(f"dataset must be one of {', '.join(DATASETS)}")
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if fmt != "csv" and pa is None:
+            raise RuntimeError(f"{fmt} export needs pyarrow")
+        docs = self.documents(dataset, user_id, start, end)
+        if fmt == "csv":
+            return self._csv(DATASETS[dataset], docs)
+        return self._arrow(DATASETS[dataset], docs, fmt)
+
+    def mood_download(self, user_id):
+        """The user's moods as the Date,Time,Mood CSV /download_moods has always served, streamed"""
+        return self._csv(MOOD_DOWNLOAD, self._find(MOOD_DOWNLOAD, user_id))
+
+    def _csv(self, spec, docs):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow([c.name for c in spec.columns])
+        timestamps = [i for i, c in enumerate(spec.columns) if c.type == "timestamp"]
+        for n, row in enumerate(self._rows(spec, docs), 1):
+            for i in timestamps:
+                if row[i] is not None:
+                    row[i] = row[i].strftime("%Y-%m-%d %H:%M:%S")
+            writer.writerow(row)
+            if n % self.chunk_rows == 0:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode("utf-8")
+
+    def _arrow(self, spec, docs, fmt):
+        schema = pa.schema([(c.name, _arrow_type(c.type)) for c in spec.columns])
+        sink = _Drain()
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+            write = writer.write_table
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+            write = writer.write_batch
+
+        def flush(columns):
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema)
+            write(pa.Table.from_batches([batch]) if fmt == "parquet" else batch)
+
+        columns = [[] for _ in spec.columns]
+        rows = 0
+        for row in self._rows(spec, docs):
+            for values, value in zip(columns, row):
+                values.append(value)
+            rows += 1
+            if rows == self.batch_rows:
+                flush(columns)
+                columns = [[] for _ in spec.columns]
+                rows = 0
+                yield sink.take()
+        if rows:
+            flush(columns)
+        writer.close()
+        yield sink.take()
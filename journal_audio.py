@@ -0,0 +1,155 @@
+import logging
+import os
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_preprocess import FFMPEG
+
+logger = logging.getLogger("journal_audio")
+
+OPUS_MIMETYPE = "audio/ogg"
+
+
+def sniff_audio_mimetype(head):
+    """Container type from the first bytes of a recording (browsers label webm blobs as audio/wav)"""
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "audio/webm"
+    if head[:4] == b"OggS":
+        return OPUS_MIMETYPE
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[4:8] == b"ftyp":
+        return "audio/mp4"
+    if head[:3] == b"ID3" or head[:2] == b"\xff\xfb":
+        return "audio/mpeg"
+    return "application/octet-stream"
+
+
+def ogg_opus_duration(data):
+    """
+    Duration in seconds of Ogg Opus bytes, read from the granule position of
+    the last page (always counted at 48 kHz) minus the pre-skip in the header.
+    """
+    head, tail = data[:64], data[-65536:]
+    marker = head.find(b"OpusHead")
+    last_page = tail.rfind(b"OggS")
+    if marker < 0 or last_page < 0 or len(tail) < last_page + 14:
+        return None
+    pre_skip = struct.unpack_from("<H", head, marker + 10)[0]
+    granule = struct.unpack_from("<q", tail, last_page + 6)[0]
+    return round(max(granule - pre_skip, 0) / 48000, 2)
+
+
+class JournalAudioTranscoder:
+    """
+    Background transcoder for voice journal uploads.
+
+    add_journal stores the upload as-is in the blob store (so it plays straight
+    away) and marks the entry audio_status "pending"; a worker then re-encodes
+    it to mono Opus in Ogg at a speech bitrate, stores that as a new blob,
+    swaps the entry over to it with its duration and size, and releases the
+    original. Entries still pending after a restart are picked up again by
+    resume_pending(). Entries from before the blob store (`audio_file` under
+    legacy_dir) are read from there.
+    """
+
+    def __init__(self, journals_col, store, legacy_dir, bitrate="24k", workers=1, ffmpeg=FFMPEG):
+        self.journals_col = journals_col
+        self.store = store
+        self.legacy_dir = legacy_dir
+        self.bitrate = bitrate
+        self.ffmpeg = ffmpeg
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="journal-audio")
+
+    @property
+    def enabled(self):
+        return self.ffmpeg.can_encode("libopus")
+
+    def submit(self, journal_id):
+        return self._executor.submit(self._transcode, journal_id)
+
+    def resume_pending(self):
+        pending = [e["journal_id"] for e in self.journals_col.find({"audio_status": "pending"}, {"journal_id": 1})]
+        for journal_id in pending:
+            self.submit(journal_id)
+        return len(pending)
+
+    def release(self, entry):
+        """Remove an entry's audio once nothing references it (call after the entry is gone or switched)"""
+        if entry.get("audio_blob"):
+            key = entry["audio_blob"]
+            if self.journals_col.count_documents({"audio_blob": key}, limit=1) == 0:
+                self.store.delete(key)
+        elif entry.get("audio_file"):
+            try:
+                os.remove(os.path.join(self.legacy_dir, entry["audio_file"]))
+            except FileNotFoundError:
+                pass
+
+    def ensure_stored(self, key, data):
+        """
+        Re-store data whose blob was released by a concurrent delete of another
+        entry with the same content between put() and our insert
+        """
+        if not self.store.exists(key):
+            self.store.put(data)
+
+    def _source(self, entry):
+        if entry.get("audio_blob"):
+            return self.store.get(entry["audio_blob"])
+        with open(os.path.join(self.legacy_dir, entry["audio_file"]), "rb") as f:
+            return f.read()
+
+    def _encode(self, data):
+        cmd = [
+            self.ffmpeg.binary, "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-vn", "-ac", "1",
+            "-c:a", "libopus", "-b:a", self.bitrate,
+            "-application", "voip",     # tuned for speech
+            "-f", "ogg", "pipe:1"
+        ]
+        return subprocess.run(cmd, input=data, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+
+    def _transcode(self, journal_id):
+        entry = self.journals_col.find_one({"journal_id": journal_id, "audio_status": "pending"})
+        if not entry:
+            return None
+        original = {"audio_blob": entry.get("audio_blob"), "audio_file": entry.get("audio_file")}
+
+        try:
+            data = self._source(entry)
+            encoded = self._encode(data)
+            key = self.store.put(encoded)
+        except Exception as e:
+            stderr = getattr(e, "stderr", None)
+            logger.error("Transcoding journal %s failed: %s", journal_id,
+                         stderr.decode(errors="replace").strip() if stderr else repr(e))
+            # Keep serving the original upload
+            self.journals_col.update_one({"journal_id": journal_id, "audio_status": "pending"},
+                                         {"$set": {"audio_status": "original"}})
+            return None
+
+        fields = {
+            "audio_blob": key,
+            "audio_mimetype": OPUS_MIMETYPE,
+            "audio_status": "ready",
+            "audio_size": len(encoded),
+            "audio_original_size": len(data),
+            "audio_duration": ogg_opus_duration(encoded),
+        }
+        res = self.journals_col.update_one(
+            {"journal_id": journal_id, "audio_status": "pending"},
+            {"$set": fields, "$unset": {"audio_file": ""}}
+        )
+        if res.matched_count == 0:
+            # Entry was deleted while we were encoding
+            self.release({"audio_blob": key})
+            return None
+
+        self.ensure_stored(key, encoded)
+        self.release(original)
+        logger.info("Journal %s audio: %d -> %d bytes, %ss", journal_id,
+                    fields["audio_original_size"], fields["audio_size"], fields["audio_duration"])
+        return fields
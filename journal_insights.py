@@ -0,0 +1,315 @@
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+try:
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+except ImportError:
+    torch = None
+
+logger = logging.getLogger("journal_insights")
+
+SENTIMENTS = ("positive", "neutral", "negative")
+
+# Topic tags by keyword, matched as whole words plus a plural or -ed/-ing ending
+# ("exam" hits "exams", "work" hits "working" but not "workout" or "homework")
+TOPICS = {
+    "work": ("work", "job", "boss", "office", "deadline", "meeting", "colleague", "coworker", "shift", "career"),
+    "studies": ("exam", "class", "lecture", "assignment", "homework", "college", "school", "study", "studies",
+                "studied", "grade"),
+    "family": ("family", "mom", "mother", "dad", "father", "parent", "sister", "brother", "home"),
+    "relationships": ("partner", "boyfriend", "girlfriend", "husband", "wife", "relationship", "breakup",
+                      "dating", "first date", "date night"),
+    "friends": ("friend", "party", "parties", "hang out", "hanging out", "lonely", "loneliness", "alone"),
+    "sleep": ("sleep", "slept", "insomnia", "tired", "nap", "napped", "napping", "nightmare", "exhausted"),
+    "health": ("sick", "pain", "doctor", "headache", "gym", "workout", "exercise", "exercising", "eating", "diet"),
+    "money": ("money", "rent", "bills", "debt", "salary", "afford"),
+    "anxiety": ("anxious", "anxiety", "panic", "worry", "worries", "worried", "nervous", "overthink",
+                "stress"),
+}
+TOPIC_PATTERNS = {
+    topic: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")(?:s|es|ed|ing)?\b", re.IGNORECASE)
+    for topic, keywords in TOPICS.items()
+}
+
+
+def tag_topics(text, limit=3):
+    """Up to `limit` topics with the most keyword hits"""
+    hits = {topic: len(pattern.findall(text)) for topic, pattern in TOPIC_PATTERNS.items()}
+    ranked = sorted((count, topic) for topic, count in hits.items() if count)
+    return [topic for _, topic in reversed(ranked[-limit:])]
+
+
+class SentimentModel:
+    """
+    Sequence-classification sentiment model run on the CPU in batches.
+    Loaded once on first use and reused for every batch after that.
+    score is P(positive) - P(negative), from -1 to 1.
+    """
+
+    def __init__(self, model_name=None, batch_size=16, max_length=256, threads=None):
+        self.model_name = model_name or os.getenv(
+            "JOURNAL_SENTIMENT_MODEL", "cardiffnlp/twitter-roberta-base-sentiment-latest")
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.threads = threads or int(os.getenv("JOURNAL_SENTIMENT_THREADS", "0")) or None
+        self._tokenizer = None
+        self._model = None
+        self._labels = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                if torch is None:
+                    raise RuntimeError("Journal sentiment needs torch and transformers")
+                if self.threads:
+                    torch.set_num_threads(self.threads)
+                start = time.monotonic()
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+                model.eval()
+                self._labels = [
+                    "positive" if "pos" in label.lower() else "negative" if "neg" in label.lower() else "neutral"
+                    for _, label in sorted(model.config.id2label.items())
+                ]
+                self._model = model
+                logger.info("Loaded sentiment model %s in %.1fs", self.model_name, time.monotonic() - start)
+        return self._tokenizer, self._model
+
+    def predict(self, texts):
+        """texts -> [{"label": "positive"|"neutral"|"negative", "score": float}, ...] in the same order"""
+        tokenizer, model = self._load()
+        results = [None] * len(texts)
+        # Similar lengths in a batch means less padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            inputs = tokenizer([texts[i] for i in batch], return_tensors="pt", padding=True,
+                               truncation=True, max_length=self.max_length)
+            with torch.inference_mode():
+                probs = torch.softmax(model(**inputs).logits, dim=-1).tolist()
+            for i, row in zip(batch, probs):
+                by_label = {}
+                for label, p in zip(self._labels, row):
+                    by_label[label] = by_label.get(label, 0.0) + p
+                results[i] = {
+                    "label": max(by_label, key=by_label.get),
+                    "score": round(by_label.get("positive", 0.0) - by_label.get("negative", 0.0), 4),
+                }
+        return results
+
+    def health(self):
+        return {"model": self.model_name, "loaded": self._model is not None}
+
+
+class JournalInsightIndexer:
+    """
+    Background worker that scores journal entries for sentiment and topic tags.
+
+    New entries are found through a high-water mark on journal_id kept in
+    `state_col`; entries whose text changed after scoring (a voice journal's
+    transcript arriving) are flagged with `insights_stale` by the writer. Each
+    scored entry gets an `insights` field, and its contribution is added to a
+    per-user, per-day document in `daily_col` (count, score_sum, sentiment and
+    topic counts), so trends are read from those instead of re-scoring history.
+    Re-scoring an entry first subtracts its old contribution; retract() does
+    the same for a deleted entry.
+
+    Only one process at a time indexes: the worker holds a lease on the state
+    document and renews it every cycle.
+    """
+
+    STATE_ID = "journal_insights"
+
+    def __init__(self, journals_col, state_col, daily_col, model, batch_size=32,
+                 poll_interval=60, lease_seconds=300, settle_seconds=30):
+        self.journals_col = journals_col
+        self.state_col = state_col
+        self.daily_col = daily_col
+        self.model = model
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.settle_seconds = settle_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stats = {"indexed": 0, "batches": 0, "failed": 0, "last_run": None}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def ensure_indexes(self):
+        self.journals_col.create_index("journal_id")
+        self.journals_col.create_index("insights_stale", sparse=True)
+        self.daily_col.create_index([("user_id", 1), ("date", 1)], unique=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="journal-insights", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    # --- Lease / high-water mark ---
+    def _acquire(self):
+        now = datetime.now()
+        try:
+            return self.state_col.find_one_and_update(
+                {"_id": self.STATE_ID, "$or": [{"lease_until": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                 "$setOnInsert": {"high_water": 0}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None     # someone else holds the lease
+
+    def _advance(self, high_water):
+        self.state_col.update_one({"_id": self.STATE_ID, "owner": self.owner},
+                                  {"$set": {"high_water": high_water, "updated_at": datetime.now()}})
+
+    # --- Aggregates ---
+    @staticmethod
+    def _contribution(insights, sign):
+        """$inc for one scored entry's share of its day, or None if it has no sentiment"""
+        if not insights or insights.get("sentiment") is None:
+            return None
+        inc = {"count": sign, "score_sum": sign * insights["score"], insights["sentiment"]: sign}
+        for topic in insights.get("topics", []):
+            inc[f"topics.{topic}"] = sign
+        return inc
+
+    def _daily_update(self, entry, inc):
+        return UpdateOne({"user_id": entry["user_id"], "date": entry["date"]}, {"$inc": inc}, upsert=True)
+
+    def retract(self, entry):
+        """Remove a deleted entry's contribution from the daily aggregates"""
+        inc = self._contribution(entry.get("insights"), -1)
+        if inc and entry.get("date"):
+            self.daily_col.bulk_write([self._daily_update(entry, inc)])
+
+    # --- Scoring ---
+    @staticmethod
+    def _text(entry):
+        body = entry.get("entry") if entry.get("type", "text") == "text" else entry.get("transcript")
+        return " ".join(part for part in (entry.get("title"), body) if part).strip()
+
+    def _fetch(self, high_water):
+        fields = {"journal_id": 1, "user_id": 1, "date": 1, "datetime": 1, "type": 1, "title": 1,
+                  "entry": 1, "transcript": 1, "insights": 1, "insights_stale": 1}
+        new = list(self.journals_col.find(
+            {"journal_id": {"$gt": high_water}, "insights": {"$exists": False}}, fields
+        ).sort("journal_id", 1).limit(self.batch_size))
+        stale = list(self.journals_col.find({"insights_stale": {"$exists": True}}, fields).limit(self.batch_size))
+        entries = {e["journal_id"]: e for e in new + stale}
+        more = len(new) == self.batch_size or len(stale) == self.batch_size
+        return list(entries.values()), new, more
+
+    def index_batch(self, high_water):
+        """Score one batch; returns (entries scored, new high-water mark, more waiting)"""
+        entries, new, more = self._fetch(high_water)
+        if not entries:
+            return 0, high_water, False
+
+        texts = [self._text(e) for e in entries]
+        scorable = [i for i, text in enumerate(texts) if text]
+        predictions = dict(zip(scorable, self.model.predict([texts[i] for i in scorable]))) if scorable else {}
+
+        now = datetime.now()
+        daily = []
+        scored = 0
+        for i, entry in enumerate(entries):
+            prediction = predictions.get(i)
+            insights = {
+                "sentiment": prediction["label"] if prediction else None,
+                "score": prediction["score"] if prediction else None,
+                "topics": tag_topics(texts[i]) if prediction else [],
+                "model": self.model.model_name,
+                "indexed_at": now,
+            }
+            # Only count it if nothing rewrote the entry while we were scoring
+            res = self.journals_col.update_one(
+                {"journal_id": entry["journal_id"], "insights_stale": entry.get("insights_stale")},
+                {"$set": {"insights": insights}, "$unset": {"insights_stale": ""}}
+            )
+            if res.matched_count == 0 or not entry.get("date"):
+                continue
+            scored += 1
+            for inc in (self._contribution(entry.get("insights"), -1), self._contribution(insights, 1)):
+                if inc:
+                    daily.append(self._daily_update(entry, inc))
+        if daily:
+            self.daily_col.bulk_write(daily, ordered=False)
+
+        # Move the mark past new entries old enough that no lower journal_id can still be
+        # mid-insert; newer ones are already scored and skipped by the insights filter
+        settled = now - timedelta(seconds=self.settle_seconds)
+        for entry in new:
+            if entry.get("datetime") and entry["datetime"] > settled:
+                break
+            high_water = entry["journal_id"]
+        return scored, high_water, more
+
+    def run_once(self):
+        """Index until caught up; returns entries scored, or None without the lease"""
+        state = self._acquire()
+        if state is None:
+            return None
+        high_water = state.get("high_water", 0)
+        total = 0
+        while True:
+            scored, new_mark, more = self.index_batch(high_water)
+            if new_mark != high_water:
+                self._advance(new_mark)
+                high_water = new_mark
+            total += scored
+            self.stats["batches"] += 1
+            if not more or not self._acquire():     # renew the lease between batches
+                break
+        self.stats["indexed"] += total
+        self.stats["last_run"] = datetime.now()
+        return total
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.warning("Journal insight indexing failed: %r", e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    # --- Reading ---
+    def trends(self, user_id, days=30):
+        """Daily sentiment for the last `days` days plus topic counts over the window"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        rows = self.daily_col.find({"user_id": user_id, "date": {"$gte": since}}, {"_id": 0, "user_id": 0}).sort("date", 1)
+        daily, topics = [], {}
+        for row in rows:
+            if row.get("count", 0) <= 0:
+                continue
+            daily.append({
+                "date": row["date"],
+                "entries": row["count"],
+                "avg_score": round(row["score_sum"] / row["count"], 3),
+                **{s: row.get(s, 0) for s in SENTIMENTS},
+            })
+            for topic, count in row.get("topics", {}).items():
+                topics[topic] = topics.get(topic, 0) + count
+        return {
+            "days": days,
+            "daily": daily,
+            "topics": dict(sorted(((t, c) for t, c in topics.items() if c > 0), key=lambda tc: -tc[1])),
+        }
+
+    def health(self):
+        return {**self.model.health(), **self.stats}
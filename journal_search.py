@@ -0,0 +1,137 @@
+import html
+import re
+
+TEXT_INDEX_NAME = "journal_text"
+MAX_QUERY_CHARS = 200
+
+# Rough English suffix stripping so highlights line up with MongoDB's stemmed
+# matches (a search for "walking" also finds "walked", "walks")
+SUFFIXES = ("ingly", "edly", "iness", "ness", "ing", "ies", "ied", "ed", "es", "ly", "s", "y")
+
+
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def parse_query(query):
+    """
+    Split a search string the way MongoDB $text reads it: "quoted phrases",
+    -excluded words and plain words. Returns (words, phrases, excluded).
+    """
+    words, phrases, excluded = [], [], []
+    for phrase, negated, word in re.findall(r'"([^"]+)"|(-?)(\w+)', query.lower()):
+        if phrase:
+            phrases.append(phrase.strip())
+        elif len(word) < 2:
+            continue    # the "s" of "friend's" would highlight every word starting with s
+        elif negated:
+            excluded.append(word)
+        else:
+            words.append(word)
+    return words, phrases, excluded
+
+
+def highlight_pattern(words, phrases):
+    """Regex matching any query word (by stem, as a word prefix) or phrase, or None"""
+    parts = [re.escape(p) for p in sorted(phrases, key=len, reverse=True)]
+    parts += [rf"\b{re.escape(stem(w))}\w*" for w in sorted(set(words), key=len, reverse=True)]
+    return re.compile("|".join(parts), re.IGNORECASE) if parts else None
+
+
+def mark(text, pattern):
+    """HTML-escape text and wrap every match in <mark>"""
+    if not pattern:
+        return html.escape(text)
+    out, last = [], 0
+    for m in pattern.finditer(text):
+        out.append(html.escape(text[last:m.start()]))
+        out.append(f"<mark>{html.escape(m.group())}</mark>")
+        last = m.end()
+    out.append(html.escape(text[last:]))
+    return "".join(out)
+
+
+def snippet(text, pattern, width=160):
+    """
+    About `width` characters of text around the first match, cut at word
+    boundaries with an ellipsis where shortened, highlighted with mark()
+    """
+    m = pattern.search(text) if pattern else None
+    if len(text) <= width:
+        return mark(text, pattern)
+    start = max(m.start() - width // 3, 0) if m else 0
+    end = min(start + width, len(text))
+    start = max(end - width, 0)
+    if start > 0:
+        space = text.find(" ", start)
+        start = space + 1 if 0 <= space < (m.start() if m else end) else start
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > (m.end() if m else start) else end
+    return ("…" if start > 0 else "") + mark(text[start:end], pattern) + ("…" if end < len(text) else "")
+
+
+class JournalSearch:
+    """
+    Full-text search over a user's journal entries: title, text entries and
+    the transcripts of voice entries, through one MongoDB text index.
+
+    The index is compound with user_id as its prefix, so a search only walks
+    that user's index keys (and every query must pass user_id, which ours
+    always do). Results are ranked by textScore with titles weighted highest,
+    returned a page at a time, with a highlighted title and snippet.
+    """
+
+    WEIGHTS = {"title": 5, "entry": 1, "transcript": 1}
+
+    def __init__(self, journals_col, snippet_chars=160):
+        self.journals_col = journals_col
+        self.snippet_chars = snippet_chars
+
+    def ensure_index(self):
+        self.journals_col.create_index(
+            [("user_id", 1), ("title", "text"), ("entry", "text"), ("transcript", "text")],
+            name=TEXT_INDEX_NAME, weights=self.WEIGHTS, default_language="english"
+        )
+
+    def search(self, user_id, query, page=1, per_page=20):
+        query = query.strip()[:MAX_QUERY_CHARS]
+        words, phrases, _ = parse_query(query)
+        result = {"query": query, "page": page, "per_page": per_page, "total": 0, "has_more": False, "results": []}
+        if not words and not phrases:
+            return result
+
+        match = {"user_id": user_id, "$text": {"$search": query}}
+        result["total"] = self.journals_col.count_documents(match)
+        if result["total"] <= (page - 1) * per_page:
+            return result
+
+        score = {"$meta": "textScore"}
+        docs = self.journals_col.find(match, {
+            "_id": 0, "journal_id": 1, "title": 1, "entry": 1, "transcript": 1, "type": 1,
+            "date": 1, "time": 1, "is_edited": 1, "audio_duration": 1, "audio_mimetype": 1,
+            "score": score
+        }).sort([("score", score), ("journal_id", -1)]).skip((page - 1) * per_page).limit(per_page)
+
+        pattern = highlight_pattern(words, phrases)
+        for doc in docs:
+            entry_type = doc.get("type", "text")
+            body = doc.get("entry") if entry_type == "text" else doc.get("transcript")
+            result["results"].append({
+                "id": doc["journal_id"],
+                "title": doc.get("title", ""),
+                "title_highlight": mark(doc.get("title", ""), pattern),
+                "snippet": snippet(body or "", pattern, self.snippet_chars),
+                "type": entry_type,
+                "date": doc.get("date"),
+                "time": doc.get("time"),
+                "is_edited": doc.get("is_edited", False),
+                "audio_duration": doc.get("audio_duration"),
+                "audio_mimetype": doc.get("audio_mimetype"),
+                "score": round(doc["score"], 3),
+            })
+        result["has_more"] = page * per_page < result["total"]
+        return result
@@ -0,0 +1,133 @@
+"""
+Latency benchmark for journal search.
+
+Seeds a scratch database with `--entries` journal entries spread over
+`--users` users (a fifth of them voice entries with transcripts), builds the
+search index, then times JournalSearch.search for a mix of common, rare,
+multi-word and phrase queries against the old approach of loading all of a
+user's entries and filtering them in Python. Prints a JSON report.
+
+    python journal_search_bench.py --uri mongodb://localhost:27017/ --entries 100000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from pymongo import MongoClient
+
+from journal_search import JournalSearch, parse_query
+
+VOCABULARY = (
+    "today felt calm anxious tired hopeful grateful lonely stressed happy sad angry relieved "
+    "work exam class friend family mother father sister brother partner sleep walk run gym "
+    "coffee dinner lunch morning evening night weekend meeting deadline project therapy "
+    "breathing meditation music movie book rain sunshine park beach trip home office "
+    "argument conversation laughed cried panic overwhelmed proud motivated bored focus"
+).split()
+RARE = ("saxophone", "volcano", "origami", "lighthouse", "marathon")
+QUERIES = ("sleep", "panic attack", "work deadline stress", '"felt calm"', "saxophone", "lighthouse -rain")
+
+
+def seed(col, entries, users, rng, batch=5000):
+    col.drop()
+    docs = []
+    for journal_id in range(1, entries + 1):
+        text = " ".join(rng.choices(VOCABULARY, k=rng.randint(40, 400)))
+        if rng.random() < 0.01:
+            text += " " + rng.choice(RARE)
+        doc = {
+            "journal_id": journal_id,
+            "user_id": f"user{rng.randrange(users)}",
+            "title": " ".join(rng.choices(VOCABULARY, k=rng.randint(2, 6))),
+            "date": "2026-01-01",
+            "time": "09:00:00",
+            "is_edited": False,
+        }
+        if journal_id % 5 == 0:
+            doc.update(type="audio", transcript=text, audio_duration=round(len(text) / 15, 1))
+        else:
+            doc.update(type="text", entry=text)
+        docs.append(doc)
+        if len(docs) == batch:
+            col.insert_many(docs)
+            docs = []
+    if docs:
+        col.insert_many(docs)
+
+
+def scan_filter(col, user_id, query):
+    """What the journal page had to do before: fetch everything, filter client-side"""
+    words, phrases, _ = parse_query(query)
+    needles = words + phrases
+    return [
+        e for e in col.find({"user_id": user_id}).sort("journal_id", -1)
+        if any(n in (e.get("title", "") + " " + e.get("entry", e.get("transcript", ""))).lower() for n in needles)
+    ]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return out, {"p50_ms": round(statistics.median(samples), 2), "max_ms": round(max(samples), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark journal full-text search")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="soulace_search_bench")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="don't drop the scratch database afterwards")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = MongoClient(args.uri)
+    col = client[args.db]["journals"]
+    search = JournalSearch(col)
+
+    start = time.perf_counter()
+    seed(col, args.entries, args.users, rng)
+    seed_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    search.ensure_index()
+    col.create_index([("user_id", 1), ("journal_id", -1)])
+    index_seconds = time.perf_counter() - start
+    stats = client[args.db].command("collStats", "journals")
+
+    user_id = "user0"
+    report = {
+        "entries": args.entries,
+        "users": args.users,
+        "user_entries": col.count_documents({"user_id": user_id}),
+        "seed_seconds": round(seed_seconds, 1),
+        "index_build_seconds": round(index_seconds, 1),
+        "index_mb": {name: round(size / 1e6, 1) for name, size in stats["indexSizes"].items()},
+        "queries": [],
+    }
+    for query in QUERIES:
+        first, page1 = timed(lambda: search.search(user_id, query, 1, 20), args.repeat)
+        _, page5 = timed(lambda: search.search(user_id, query, 5, 20), args.repeat)
+        scanned, scan = timed(lambda: scan_filter(col, user_id, query), args.repeat)
+        report["queries"].append({
+            "query": query,
+            "matches": first["total"],
+            "scan_matches": len(scanned),
+            "search_page1": page1,
+            "search_page5": page5,
+            "load_all_and_filter": scan,
+        })
+
+    if not args.keep:
+        client.drop_database(args.db)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+Mood = namedtuple("Mood", "code label score active journaling_prompt", defaults=(None,))
+
+_DIFFICULT_PROMPT = (
+    "I'm sorry you're feeling this way. "
+    "What do you think contributed to this feeling? "
+    "Would you like to write about what might help you feel better?"
+)
+
+# The one list of moods: the label shown to users, the compact integer code stored
+# in Mongo, a score from 0 (worst) to 4 (best) that sentiment follows
+# (3-4 positive, 2 neutral, 0-1 negative), and the journaling prompt suggested
+# after logging it. Moods only found in older logs stay, inactive, so their
+# history still counts; new logs must use an active mood.
+# Code 0 is for labels we don't recognise: no score (so $avg skips it), neutral.
+MOODS = (
+    Mood(1, "Happy", 4, True,
+         "That's wonderful! What made you feel this way today? "
+         "Would you like to write it down so you can revisit it later?"),
+    Mood(2, "Calm", 3, True,
+         "It's great that you're feeling peaceful. "
+         "What helped you achieve this sense of calm today?"),
+    Mood(3, "Void", 2, True,
+         "Sometimes feeling neutral is perfectly okay. "
+         "Would you like to explore what's on your mind right now?"),
+    Mood(4, "Sad", 1, True, _DIFFICULT_PROMPT),
+    Mood(5, "Angry", 0, True, _DIFFICULT_PROMPT),
+    # Older mood picker
+    Mood(6, "Very Happy", 4, False),
+    Mood(7, "Feeling Blessed", 4, False),
+    Mood(8, "Mind Blown", 2, False),
+    Mood(9, "Frustrated", 1, False),
+    Mood(10, "Crying", 0, False),
+)
+UNKNOWN_CODE = 0
+MAX_SCORE = 4
+SENTIMENTS = ("positive", "neutral", "negative")
+
+BY_CODE = {mood.code: mood for mood in MOODS}
+BY_LABEL = {mood.label: mood for mood in MOODS}
+ACTIVE_LABELS = [mood.label for mood in MOODS if mood.active]
+
+
+def sentiment_of_score(score):
+    if score is None or score == 2:
+        return "neutral"
+    return "positive" if score > 2 else "negative"
+
+
+# Lookup tables indexed by code, for NumPy and for $arrayElemAt in pipelines
+SCORE_TABLE = [None] * (max(BY_CODE) + 1)
+SENTIMENT_TABLE = ["neutral"] * (max(BY_CODE) + 1)
+for _mood in MOODS:
+    SCORE_TABLE[_mood.code] = _mood.score
+    SENTIMENT_TABLE[_mood.code] = sentiment_of_score(_mood.score)
+
+SENTIMENT_BY_LABEL = {mood.label: SENTIMENT_TABLE[mood.code] for mood in MOODS}
+
+
+def code_for(label):
+    mood = BY_LABEL.get(label)
+    return mood.code if mood else UNKNOWN_CODE
+
+
+def label_for(code):
+    mood = BY_CODE.get(code)
+    return mood.label if mood else None
+
+
+def journaling_prompt(code):
+    """Prompt to suggest after a mood is logged, None for moods without one"""
+    mood = BY_CODE.get(code)
+    return mood.journaling_prompt if mood else None
+
+
+def is_active(label):
+    mood = BY_LABEL.get(label)
+    return bool(mood and mood.active)
+
+
+def mood_document(label):
+    """The mood fields of a mood log: the label for display plus its code"""
+    return {"mood": label, "mood_code": code_for(label)}
+
+
+# --- Aggregation expressions ---
+def code_field(field="$mood_code"):
+    """Mood code of a document, 0 when it has none (a log migrate_mood_codes hasn't reached yet)"""
+    return {"$ifNull": [field, UNKNOWN_CODE]}
+
+
+def score_expr(field="$mood_code"):
+    """Numeric score of a document's mood, null for unknown codes so $avg leaves them out"""
+    return {"$arrayElemAt": [SCORE_TABLE, code_field(field)]}
+
+
+def sentiment_expr(field="$mood_code"):
+    return {"$arrayElemAt": [SENTIMENT_TABLE, code_field(field)]}
+
+
+# --- Migration ---
+def migrate_mood_codes(moodtracking_col):
+    """
+    Give every mood log without a mood_code the code for its label (0 for
+    labels we don't know). Meant to run on every startup, so logs written
+    without a code by anything else are picked up too: with none missing it
+    is a single distinct() query. Returns the number of documents updated.
+    """
+    missing = {"mood_code": {"$exists": False}}
+    updated = 0
+    for label in moodtracking_col.distinct("mood", missing):
+        res = moodtracking_col.update_many({**missing, "mood": label}, {"$set": {"mood_code": code_for(label)}})
+        updated += res.modified_count
+    # Logs with no label at all
+    res = moodtracking_col.update_many(missing, {"$set": {"mood_code": UNKNOWN_CODE}})
+    return updated + res.modified_count
@@ -1,62 +1,278 @@
 import os
-import matplotlib.pyplot as plt
-from datetime import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+import numpy as np
+from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from flask import current_app
+from chart_render import make_chart_renderer
+import mood_registry
 
 CHART_DIR = "static/charts"
 os.makedirs(CHART_DIR, exist_ok=True)
 
-# Mood → Sentiment categories
-mood_sentiment_map = {
-    "Very Happy": "positive",
-    "Feeling Blessed": "positive",
-    "Happy": "positive",
-    "Mind Blown": "neutral",
-    "Frustrated": "negative",
-    "Sad": "negative",
-    "Angry": "negative",
-    "Crying": "negative"
-}
-
-def generate_user_chart(user_id, moodtracking_col):
+# Rendered charts are named by a hash of what they show, so an unchanged chart is never redrawn
+CHART_CACHE_DIR = os.path.join(CHART_DIR, "cache")
+os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+CHART_CACHE_MAX_AGE = 7 * 24 * 3600     # unused charts are pruned after a week
+CHART_VERSION = 2                       # bump when the drawing code changes
+
+# Mood → Sentiment categories (see mood_registry)
+mood_sentiment_map = mood_registry.SENTIMENT_BY_LABEL
+SENTIMENTS = mood_registry.SENTIMENTS
+
+# mood_code -> SENTIMENTS index, for the NumPy path
+SENTIMENT_LOOKUP = np.array([SENTIMENTS.index(s) for s in mood_registry.SENTIMENT_TABLE], dtype=np.intp)
+
+# --- Counting ---
+def mood_counts(moodtracking_col, user_id=None):
+    """
+    {mood: number of logs}, counted by MongoDB. Only mood_code is read, so with
+    the (user_id, mood_code) index a per-user count never touches the documents.
+    Unrecognised moods are counted under None.
+    """
+    pipeline = [{"$match": {"user_id": user_id}}] if user_id is not None else []
+    pipeline += [
+        {"$project": {"_id": 0, "mood_code": 1}},
+        {"$group": {"_id": mood_registry.code_field(), "count": {"$sum": 1}}}
+    ]
+    counts = {}
+    for row in moodtracking_col.aggregate(pipeline):
+        label = mood_registry.label_for(row["_id"])
+        counts[label] = counts.get(label, 0) + row["count"]
+    return counts
+
+def sentiment_counts(counts_by_mood):
+    """{mood: count} -> {"positive": n, "neutral": n, "negative": n}"""
+    sentiments = dict.fromkeys(SENTIMENTS, 0)
+    for mood, count in counts_by_mood.items():
+        sentiments[mood_sentiment_map.get(mood, "neutral")] += count
+    return sentiments
+
+def count_moods(moods):
+    """Mood labels already in memory -> {mood: count}"""
+    return dict(Counter(moods))
+
+def mood_codes(moods):
+    """Mood labels -> int array of mood codes (0 for unknown moods)"""
+    return np.fromiter((mood_registry.code_for(mood) for mood in moods), dtype=np.intp)
+
+def sentiment_counts_from_codes(codes):
+    """Vectorized sentiment counts for an array of mood codes (e.g. mood_code values read from Mongo)"""
+    counts = np.bincount(SENTIMENT_LOOKUP[codes], minlength=len(SENTIMENTS))
+    return {sentiment: int(n) for sentiment, n in zip(SENTIMENTS, counts)}
+
+# $dateToString format and Python strftime for each bucket size (ISO weeks: 2026-W03)
+BUCKET_FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m"}
+MAX_BUCKETS = 400
+
+def bucket_labels(start, end, bucket):
+    """Every bucket label from start to end (inclusive dates), in order"""
+    fmt = BUCKET_FORMATS[bucket]
+    labels = []
+    day = start
+    while day <= end:
+        label = day.strftime(fmt)
+        if not labels or labels[-1] != label:
+            labels.append(label)
+        day += timedelta(days=1)
+    return labels
+
+def sentiment_series(moodtracking_col, user_id=None, start=None, end=None, bucket="day"):
+    """
+    Sentiment counts per day/week/month for chart data. start and end are
+    dates (end inclusive); without start the series covers every bucket that
+    has logs, with start every bucket in the range is listed, empty ones as 0.
+    MongoDB groups by (bucket, sentiment), so at most buckets x 3 rows come back.
+    """
+    if bucket not in BUCKET_FORMATS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKET_FORMATS)}")
+    end = end or datetime.now().date()
+    if start and start > end:
+        raise ValueError("start must not be after end")
+    if start and len(bucket_labels(start, end, bucket)) > MAX_BUCKETS:
+        raise ValueError(f"range has more than {MAX_BUCKETS} {bucket} buckets")
+
+    match = {"datetime": {"$lt": datetime.combine(end + timedelta(days=1), datetime.min.time())}}
+    if start:
+        match["datetime"]["$gte"] = datetime.combine(start, datetime.min.time())
+    if user_id is not None:
+        match["user_id"] = user_id
+    rows = moodtracking_col.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "bucket": {"$dateToString": {"format": BUCKET_FORMATS[bucket], "date": "$datetime"}},
+                "sentiment": mood_registry.sentiment_expr()
+            },
+            "count": {"$sum": 1}
+        }}
+    ])
+
+    by_bucket = {}
+    for row in rows:
+        counts = by_bucket.setdefault(row["_id"]["bucket"], dict.fromkeys(SENTIMENTS, 0))
+        counts[row["_id"]["sentiment"]] += row["count"]
+    labels = bucket_labels(start, end, bucket) if start else sorted(by_bucket)
+    if not start and len(labels) > MAX_BUCKETS:
+        raise ValueError(f"more than {MAX_BUCKETS} {bucket} buckets; pass a start date or a larger bucket")
+
+    series = {s: [by_bucket.get(label, {}).get(s, 0) for label in labels] for s in SENTIMENTS}
+    return {
+        "bucket": bucket,
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat(),
+        "labels": list(SENTIMENTS),
+        "totals": [sum(series[s]) for s in SENTIMENTS],
+        "buckets": labels,
+        "series": series,
+    }
+
+def mood_trends(moodtracking_col):
+    """
+    Per day: how many logs of each picker mood and the average mood score.
+    Counts and averages come from one $facet, grouped on mood_code in MongoDB.
+    """
+    day = {"$dateToString": {"format": "%Y-%m-%d", "date": "$datetime"}}
+    pipeline = [
+        {"$facet": {
+            "counts": [
+                {"$group": {"_id": {"date": day, "code": mood_registry.code_field()}, "count": {"$sum": 1}}}
+            ],
+            "averages": [
+                {"$group": {"_id": day, "avg": {"$avg": mood_registry.score_expr()}}}
+            ]
+        }}
+    ]
+    result = next(moodtracking_col.aggregate(pipeline))
+
+    # Reshape into { date: {mood: count, ...}, ... }
+    mood_data = {}
+    for r in result["counts"]:
+        label = mood_registry.label_for(r["_id"]["code"])
+        mood_data.setdefault(r["_id"]["date"], {})[label] = r["count"]
+    day_averages = {r["_id"]: r["avg"] for r in result["averages"]}
+
+    dates = sorted(mood_data.keys())
+    # Picker moods, best first (keep consistent order)
+    moods = sorted(mood_registry.ACTIVE_LABELS, key=lambda m: -mood_registry.BY_LABEL[m].score)
+    return {
+        "dates": dates,
+        "moods": moods,
+        "distribution": [[mood_data[date].get(m, 0) for m in moods] for date in dates],
+        "averages": [round(day_averages.get(date) or 0, 2) for date in dates],
+    }
+
+def daily_average_scores(moodtracking_col, days=30):
+    """(dates, averages): the average mood score (0-4) for each of the last `days` days, 0 without logs"""
+    since = datetime.now() - timedelta(days=days)
+    pipeline = [
+        {"$match": {"datetime": {"$gte": since}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$datetime"}},
+            "avg": {"$avg": mood_registry.score_expr()}
+        }}
+    ]
+    day_averages = {r["_id"]: r["avg"] for r in moodtracking_col.aggregate(pipeline)}
+    dates = [(datetime.now() - timedelta(days=days - 1 - i)).strftime("%Y-%m-%d") for i in range(days)]
+    averages = [round(day_averages[date], 1) if day_averages.get(date) is not None else 0 for date in dates]
+    return dates, averages
+
+def user_sentiment_counts(user_id, moodtracking_col):
+    return sentiment_counts(mood_counts(moodtracking_col, user_id))
+
+def admin_sentiment_counts(moodtracking_col):
+    return sentiment_counts(mood_counts(moodtracking_col))
+
+# --- Rendering ---
+chart_renderer = None   # ChartRenderer; app.py sets one up, otherwise created on first use
+_rendering = {}         # key -> Future, so concurrent requests for one chart render it once
+_rendering_lock = threading.Lock()
+_last_prune = 0.0
+
+def get_chart_renderer():
+    global chart_renderer
+    with _rendering_lock:
+        if chart_renderer is None:
+            chart_renderer = make_chart_renderer()
+        return chart_renderer
+
+def chart_key(*parts):
+    """Hash of everything that decides how a chart looks"""
+    return hashlib.sha256(json.dumps([CHART_VERSION, *parts], sort_keys=True).encode()).hexdigest()[:32]
+
+def prune_chart_cache(max_age=CHART_CACHE_MAX_AGE):
+    """Delete cached charts nobody has asked for in max_age seconds"""
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(CHART_CACHE_DIR):
+        path = os.path.join(CHART_CACHE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def cached_chart(spec, fmt="png", timeout=30):
+    """
+    Path of the rendered chart for `spec`, drawn by the chart renderer if it
+    isn't cached yet. Waits for the render.
+    """
+    global _last_prune
+    key = chart_key(spec, fmt)
+    path = os.path.join(CHART_CACHE_DIR, f"{key}.{fmt}")
+    try:
+        os.utime(path)      # keep charts in use from being pruned
+        return path
+    except FileNotFoundError:
+        pass
+    renderer = get_chart_renderer()
+    with _rendering_lock:
+        future = _rendering.get(key)
+        if future is None:
+            future = renderer.submit(spec, path, fmt)
+            _rendering[key] = future
+            future.add_done_callback(lambda _: _rendering.pop(key, None))
+    if time.time() - _last_prune > 3600:
+        _last_prune = time.time()
+        prune_chart_cache()
+    return future.result(timeout=timeout)
+
+def user_chart_spec(user_id, sentiments):
+    return {
+        "kind": "bar",
+        "title": f"Sentiment Analysis for User {user_id}",
+        "labels": list(sentiments.keys()),
+        "values": list(sentiments.values()),
+        "colors": ["green", "blue", "red"],
+    }
+
+def admin_chart_spec(sentiments):
+    return {
+        "kind": "pie",
+        "title": "All Users' Sentiment Distribution",
+        "labels": list(sentiments.keys()),
+        "values": list(sentiments.values()),
+        "colors": ["green", "blue", "red"],
+    }
+
+def render_user_chart(user_id, sentiments, fmt="png"):
+    """Bar chart of one user's sentiment counts; returns the cached file path"""
+    return cached_chart(user_chart_spec(user_id, sentiments), fmt)
+
+def render_admin_chart(sentiments, fmt="png"):
+    """Pie chart of everyone's sentiment counts; returns the cached file path"""
+    return cached_chart(admin_chart_spec(sentiments), fmt)
+
+def generate_user_chart(user_id, moodtracking_col, fmt="png"):
     """Generate sentiment chart for one user."""
-    logs = list(moodtracking_col.find({"user_id": user_id}))
-    sentiments = {"positive": 0, "neutral": 0, "negative": 0}
-
-    for log in logs:
-        mood = log.get("mood")
-        category = mood_sentiment_map.get(mood, "neutral")
-        sentiments[category] += 1
-
-    labels = list(sentiments.keys())
-    values = list(sentiments.values())
-
-    plt.figure(figsize=(6, 4))
-    plt.bar(labels, values, color=["green", "blue", "red"])
-    plt.title(f"Sentiment Analysis for User {user_id}")
-    file_path = os.path.join(CHART_DIR, f"user_{user_id}_sentiment.png")
-    plt.savefig(file_path)
-    plt.close()
-    return file_path
-
-def generate_admin_chart(moodtracking_col):
+    return render_user_chart(user_id, user_sentiment_counts(user_id, moodtracking_col), fmt)
+
+def generate_admin_chart(moodtracking_col, fmt="png"):
     """Generate sentiment chart for all users combined."""
-    logs = list(moodtracking_col.find())
-    sentiments = {"positive": 0, "neutral": 0, "negative": 0}
-
-    for log in logs:
-        mood = log.get("mood")
-        category = mood_sentiment_map.get(mood, "neutral")
-        sentiments[category] += 1
-
-    labels = list(sentiments.keys())
-    values = list(sentiments.values())
-
-    plt.figure(figsize=(6, 4))
-    plt.pie(values, labels=labels, autopct="%1.1f%%", colors=["green", "blue", "red"])
-    plt.title("All Users' Sentiment Distribution")
-    file_path = os.path.join(CHART_DIR, "admin_sentiment.png")
-    plt.savefig(file_path)
-    plt.close()
-    return file_path
+    return render_admin_chart(admin_sentiment_counts(moodtracking_col), fmt)
@@ -0,0 +1,158 @@
+from itertools import compress, count
+
+# Terms filtered out of every bot response (single words and multi-word phrases)
+STIGMATIZED_WORDS = frozenset({
+    'crazy', 'insane', 'lunatic', 'psycho', 'psychotic', 'maniac', 'nuts', 'cuckoo',
+    'loony', 'mad', 'mental', 'deranged', 'unstable', 'unhinged', 'bonkers',
+    'off their rocker', 'screw loose', 'fruitcake', 'nutjob', 'crackpot',
+    'basket case', 'headcase', 'freak', 'weirdo', 'oddball', 'spazz', 'lazy',
+    'unmotivated', 'weak', 'fragile', 'hopeless', 'sad sack', 'moody', 'emo',
+    'downer', 'dramatic', 'failure', 'quitter', 'pathetic', 'gloomy gus',
+    'pessimist', 'miserable', 'overreacting', 'worrier', 'paranoid', 'control freak',
+    'nervous wreck', 'jittery', 'overly sensitive', 'snowflake', 'jumpy', 'fidgety',
+    'neurotic', 'obsessive', 'nitpicky', 'high-strung', 'stress-head', 'damaged',
+    'broken', 'weak-minded', 'overly emotional', 'baggage', 'victim mentality',
+    'drama queen', 'triggered', 'meltdown', 'unstable survivor', 'attention-seeker',
+    'manipulative', 'selfish', 'cowardly', 'lost cause', 'dangerous', 'schizo',
+    'split personality', 'split mind', 'delusional', 'hallucinating', 'out of touch',
+    'space cadet', 'freaked out', 'manic', 'mood swingy', 'unpredictable',
+    'jekyll and hyde', 'two-faced', 'hysterical', 'perfectionist', 'neat freak',
+    'anal', 'rigid', 'fussy', 'over-the-top', 'uptight', 'compulsive', 'anorexic',
+    'bulimic', 'skeleton', 'stick', 'twig', 'fatty', 'whale', 'pig', 'glutton',
+    'greedy', 'disgusting', 'gross', 'vain', 'retarded', 'slow', 'dumb', 'stupid',
+    'idiot', 'moron', 'imbecile', 'simpleton', 'thick', 'handicapped', 'sped',
+    'special', 'window-licker', 'shrink', 'quack', 'pill-popper', 'druggie',
+    'medicated', 'institutionalized', 'asylum case', 'padded room', 'straitjacket',
+    'shock therapy', 'lobotomized', 'labelled', 'disordered'
+})
+
+# Supportive alternatives for the terms that get replaced instead of dropped
+STIGMATIZED_REPLACEMENTS = {
+    'crazy': 'overwhelming', 'insane': 'overwhelming', 'nuts': 'overwhelming', 'mad': 'overwhelming',
+    'weak': 'human', 'fragile': 'human',
+    'failure': 'capable', 'hopeless': 'capable',
+    'broken': 'healing', 'damaged': 'healing',
+}
+
+# Punctuation a term may have around it and still match (what the original
+# word-by-word filter stripped before comparing), and the part of it kept when
+# a term is dropped. No term contains any of it.
+PUNCTUATION = '.,!?;:"()[]{}'
+SENTENCE_PUNCTUATION = '.,!?;:'
+
+
+def index_terms(terms):
+    """
+    Split terms into a set of single words and a map from the first word of each
+    phrase to the rest of its words, longest phrase first, so a scan does one set
+    lookup per word and only looks ahead at the few words that can start a phrase
+    """
+    words, phrases = set(), {}
+    for term in terms:
+        first, *rest = term.lower().split()
+        if rest:
+            phrases.setdefault(first, []).append(tuple(rest))
+        else:
+            words.add(first)
+    for rests in phrases.values():
+        rests.sort(key=len, reverse=True)
+    return frozenset(words), phrases
+
+
+STIGMATIZED_SINGLE, STIGMATIZED_PHRASES = index_terms(STIGMATIZED_WORDS)
+_FIRST_WORDS = STIGMATIZED_SINGLE | STIGMATIZED_PHRASES.keys()
+_DROP_PUNCTUATION = str.maketrans('', '', PUNCTUATION)
+_DROP_ENCLOSING = str.maketrans('', '', ''.join(set(PUNCTUATION) - set(SENTENCE_PUNCTUATION)))
+
+
+def _scan(text, words):
+    """
+    (first, last, lead, trail) for each stigmatized term in text, in order: the
+    indices in `words` (text.split()) of the first and last word it spans, and
+    the punctuation in front of it and after it. A term matches a whole word,
+    or for phrases whole consecutive words, give or take the punctuation the
+    old word-by-word filter stripped in front of the first word and after the
+    last; the longest term wins.
+
+    Words are checked against the terms in bulk (lower-cased, punctuation
+    deleted, one set lookup each, all in C); only the few candidates are looked
+    at in Python, and text without any is done after one set intersection.
+    """
+    keys = text.lower().translate(_DROP_PUNCTUATION).split()
+    if _FIRST_WORDS.isdisjoint(keys):
+        return
+    if len(keys) != len(words):
+        # Some word is all punctuation and vanished; strip word by word so keys line up
+        keys = [word.strip(PUNCTUATION) for word in text.lower().split()]
+    resume = 0      # first word not covered by the previous match
+    for k in compress(count(), map(_FIRST_WORDS.__contains__, keys)):
+        if k < resume:
+            continue
+        word = words[k]
+        key = keys[k]
+        if word == key:
+            lead = trail = ''
+        else:
+            core = word.strip(PUNCTUATION)
+            if core.lower() != key:
+                continue    # punctuation inside the word, not around it
+            lead = word[:word.find(core)]
+            trail = word[len(lead) + len(key):]
+        # A phrase starts at a word with no punctuation after it; its last word
+        # is the last word of the phrase plus nothing but punctuation
+        if key in STIGMATIZED_PHRASES and not trail:
+            for rest in STIGMATIZED_PHRASES[key]:
+                last = k + len(rest)
+                if last < len(words) and keys[last] == rest[-1] and words[last].lower().startswith(rest[-1]) and \
+                        all(words[k + j].lower() == w for j, w in enumerate(rest[:-1], 1)):
+                    resume = last + 1
+                    yield k, last, lead, words[last][len(rest[-1]):]
+                    break
+            else:
+                if key in STIGMATIZED_SINGLE:
+                    yield k, k, lead, trail
+        elif key in STIGMATIZED_SINGLE:
+            yield k, k, lead, trail
+
+
+def _term(words, first, last, lead, trail):
+    term = ' '.join(words[first:last + 1])
+    return term[len(lead):len(term) - len(trail)]
+
+
+def find_stigmatized_terms(text):
+    """Each stigmatized term in text, in order, single-spaced but otherwise as written"""
+    words = text.split()
+    return [_term(words, *match) for match in _scan(text, words)]
+
+
+def filter_stigmatized_words(text):
+    """
+    Remove stigmatized words and phrases from text, or swap in a supportive
+    alternative. Runs of whitespace come back as single spaces, as they always
+    have (clean_response joins the reply's lines with spaces anyway).
+    """
+    words = text.split()
+    kept = -1           # index of the last word whose text is kept
+    previous = -1       # index of the last word of the previous match
+    for first, last, lead, trail in _scan(text, words):
+        if first - 1 > previous:
+            kept = first - 1
+        previous = last
+        term = _term(words, first, last, lead, trail)
+        replacement = STIGMATIZED_REPLACEMENTS.get(term.lower())
+        if replacement is None:
+            # Drop the term with any quotes or brackets around it; a full stop or
+            # comma after it stays, on the word before, if that ends in a letter
+            for j in range(first, last + 1):
+                words[j] = ''
+            if trail and kept >= 0:
+                trail = trail.translate(_DROP_ENCLOSING)
+                if trail and (words[kept][-1].isalnum() or words[kept][-1] == '_'):
+                    words[kept] += trail
+        else:
+            # Replace with supportive alternative
+            words[first] = lead + (replacement.capitalize() if term[0].isupper() else replacement) + trail
+            kept = first
+
+    return ' '.join(filter(None, words))
@@ -0,0 +1,89 @@
+"""
+Speed benchmark for the stigmatized-term filter.
+
+Times filter_stigmatized_words (one set lookup per word, phrases looked ahead
+from their first word) against the per-word loop it replaced, on generated bot
+replies of `--sizes` characters with about one stigmatized term in every
+`--term-every` words. Prints a JSON report with the median time per call for
+each.
+
+    python stigma_filter_bench.py --sizes 300 2000 18000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from stigma_filter import STIGMATIZED_WORDS, filter_stigmatized_words
+
+FILLER = (
+    "it sounds like you have been carrying a lot lately and that is completely understandable "
+    "try to take a deep breath notice how you feel and be gentle with yourself today"
+).split()
+
+
+def legacy_filter(text):
+    """What EmotionalChatbot.filter_stigmatized_words did before stigma_filter"""
+    words = text.split()
+    filtered_words = []
+
+    for word in words:
+        # Clean word for comparison (remove punctuation)
+        clean_word = word.lower().strip('.,!?;:"()[]{}')
+        if clean_word not in STIGMATIZED_WORDS:
+            filtered_words.append(word)
+        else:
+            # Replace with supportive alternative
+            if clean_word in ['crazy', 'insane', 'nuts', 'mad']:
+                filtered_words.append('overwhelming')
+            elif clean_word in ['weak', 'fragile']:
+                filtered_words.append('human')
+            elif clean_word in ['failure', 'hopeless']:
+                filtered_words.append('capable')
+            elif clean_word in ['broken', 'damaged']:
+                filtered_words.append('healing')
+            # For other words, just skip them
+
+    return ' '.join(filtered_words)
+
+
+def make_text(chars, term_every, rng):
+    terms = sorted(STIGMATIZED_WORDS)
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        word = rng.choice(terms) if rng.randrange(term_every) == 0 else rng.choice(FILLER)
+        words.append(word + rng.choice(["", "", "", ",", "."]))
+    return " ".join(words)[:chars]
+
+
+def median_ms(fn, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the stigmatized-term filter against the old word loop")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[300, 2000, 18000])
+    parser.add_argument("--term-every", type=int, default=25, help="about one term per this many words")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    report = []
+    for size in args.sizes:
+        text = make_text(size, args.term_every, rng)
+        report.append({
+            "chars": len(text),
+            "filter_ms": median_ms(filter_stigmatized_words, text, args.repeat),
+            "legacy_loop_ms": median_ms(legacy_filter, text, args.repeat),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from audio_preprocess import (
+    AudioError, SAMPLE_RATE, decode_wav, read_limited, resample, speech_segments, to_pcm16, vad_chunks,
+)
+
+
+def tone(seconds, rate, freq=440.0, amplitude=0.5):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def make_wav(samples, rate, width=2, channels=1):
+    """WAV bytes for float samples in [-1, 1], written with the wave module"""
+    scale = {1: 127, 2: 32767, 4: 2 ** 31 - 1}[width]
+    ints = np.round(np.repeat(samples[:, None], channels, axis=1) * scale).astype(np.int64)
+    if width == 1:
+        frames = (ints + 128).astype(np.uint8).tobytes()
+    else:
+        frames = ints.astype(f"<i{width}").tobytes()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("width, tolerance", [(1, 1 / 100), (2, 1 / 30000), (4, 1e-6)])
+def test_decode_wav_round_trips_each_sample_width(width, tolerance):
+    samples = tone(0.1, 8000)
+    decoded, rate = decode_wav(make_wav(samples, 8000, width=width))
+    assert rate == 8000
+    assert decoded.dtype == np.float32 and len(decoded) == len(samples)
+    assert np.max(np.abs(decoded - samples)) < tolerance
+
+
+def test_decode_wav_downmixes_stereo():
+    samples = tone(0.05, 16000)
+    decoded, _ = decode_wav(make_wav(samples, 16000, channels=2))
+    assert len(decoded) == len(samples)
+    assert np.max(np.abs(decoded - samples)) < 1 / 30000
+
+
+def test_decode_wav_rejects_garbage():
+    with pytest.raises(AudioError):
+        decode_wav(b"RIFF\0\0\0\0WAVEnot really")
+
+
+@pytest.mark.parametrize("src_rate", [8000, 22050, 44100, 48000])
+def test_resample_length_and_rate(src_rate):
+    samples = tone(1.0, src_rate, freq=440)
+    out = resample(samples, src_rate, SAMPLE_RATE)
+    assert len(out) == SAMPLE_RATE
+    # Still a 440 Hz tone at the new rate
+    spectrum = np.abs(np.fft.rfft(out))
+    assert abs(np.argmax(spectrum) * SAMPLE_RATE / len(out) - 440) <= 1
+
+
+def test_resample_filters_what_the_new_rate_cannot_hold():
+    # 12 kHz is above the 8 kHz Nyquist limit at 16 kHz: it must not alias down to 4 kHz
+    out = resample(tone(1.0, 48000, freq=12000), 48000, SAMPLE_RATE)
+    assert np.sqrt(np.mean(out[200:-200] ** 2)) < 0.05
+
+
+def test_resample_same_rate_is_a_no_op():
+    samples = tone(0.01, SAMPLE_RATE)
+    assert resample(samples, SAMPLE_RATE) is samples
+    assert len(resample(np.zeros(0, dtype=np.float32), 44100)) == 0
+
+
+def test_to_pcm16_converts_wav_in_process():
+    pcm = to_pcm16(make_wav(tone(0.5, 44100), 44100), ffmpeg=None)
+    assert len(pcm) == SAMPLE_RATE // 2 * 2
+
+
+def test_read_limited_reads_up_to_the_cap():
+    data = b"x" * 1000
+    assert read_limited(io.BytesIO(data), limit=1000) == data
+
+
+def test_read_limited_stops_past_the_cap():
+    stream = io.BytesIO(b"x" * (1 << 20))
+    with pytest.raises(AudioError) as too_big:
+        read_limited(stream, limit=100 * 1024)
+    assert too_big.value.status == 413
+    # Gave up within a chunk of the limit instead of reading the whole stream
+    assert stream.tell() < 200 * 1024
+
+
+FRAME = SAMPLE_RATE * 30 // 1000        # speech_segments' default 30 ms frame
+PAD = 200 // 30 * FRAME                 # and its default 200 ms padding, in whole frames
+
+
+def pcm_of(*parts):
+    """16-bit PCM of (kind, frames) parts: quiet noise for "silence", a 300 Hz tone for "speech" """
+    rng = np.random.default_rng(0)
+    samples = []
+    for kind, frames in parts:
+        if kind == "speech":
+            samples.append(tone(frames * FRAME / SAMPLE_RATE, SAMPLE_RATE, freq=300))
+        else:
+            samples.append((rng.standard_normal(frames * FRAME) * 0.001).astype(np.float32))
+    return (np.concatenate(samples) * 32767).astype("<i2").tobytes()
+
+
+def test_speech_segments_finds_the_tone_between_silences():
+    pcm = pcm_of(("silence", 32), ("speech", 48), ("silence", 40))
+    assert speech_segments(pcm) == [(32 * FRAME - PAD, 80 * FRAME + PAD)]
+
+
+def test_short_pauses_merge_and_long_ones_split():
+    # 210 ms is under min_silence_ms (400): one segment
+    pcm = pcm_of(("silence", 20), ("speech", 20), ("silence", 7), ("speech", 20), ("silence", 20))
+    assert speech_segments(pcm) == [(20 * FRAME - PAD, 67 * FRAME + PAD)]
+
+    # 1.2 s is not
+    pcm = pcm_of(("silence", 20), ("speech", 20), ("silence", 40), ("speech", 20), ("silence", 20))
+    assert speech_segments(pcm) == [(20 * FRAME - PAD, 40 * FRAME + PAD), (80 * FRAME - PAD, 100 * FRAME + PAD)]
+
+
+def test_padding_stops_at_the_ends_of_the_recording():
+    pcm = pcm_of(("speech", 10), ("silence", 40), ("speech", 10))
+    assert speech_segments(pcm) == [(0, 10 * FRAME + PAD), (50 * FRAME - PAD, 60 * FRAME)]
+
+
+def test_silence_and_unbroken_sound():
+    assert speech_segments(pcm_of(("silence", 50))) == []
+    # Nothing quiet to compare against: all of it is kept
+    pcm = pcm_of(("speech", 50))
+    assert speech_segments(pcm) == [(0, 50 * FRAME)]
+    assert speech_segments(b"") == []
+
+
+def chunk_seconds(chunk):
+    return len(chunk) / 2 / SAMPLE_RATE
+
+
+def test_vad_chunks_pack_segments_and_drop_silence():
+    # Ten 3 s bursts, a second of silence apart
+    parts = [("silence", 34)]
+    for _ in range(10):
+        parts += [("speech", 100), ("silence", 34)]
+    pcm = pcm_of(*parts)
+    segments = speech_segments(pcm)
+    assert len(segments) == 10
+
+    chunks = vad_chunks(pcm, target_seconds=10, max_seconds=12)
+    assert all(chunk_seconds(chunk) <= 12 for chunk in chunks)
+    # Packed up to the target, not one chunk per burst
+    assert len(chunks) < len(segments)
+    # Exactly the padded speech, in order, with the silence between segments gone
+    assert b"".join(chunks) == b"".join(pcm[start * 2:end * 2] for start, end in segments)
+    assert sum(map(len, chunks)) < len(pcm)
+
+
+def test_vad_chunks_cut_long_speech_under_max_seconds():
+    pcm = pcm_of(("silence", 34), ("speech", 2500), ("silence", 34))    # 75 s without a pause
+    chunks = vad_chunks(pcm, target_seconds=15, max_seconds=20)
+    assert len(chunks) == 4
+    assert all(chunk_seconds(chunk) <= 20 for chunk in chunks)
+    start, end = speech_segments(pcm)[0]
+    assert sum(map(len, chunks)) == (end - start) * 2
@@ -0,0 +1,154 @@
+import hashlib
+import io
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import blob_store
+from blob_store import LocalBlobStore, S3BlobStore, collect_garbage, shard_path
+
+AUDIO = b"OggS" + os.urandom(3000)
+KEY = hashlib.sha256(AUDIO).hexdigest()
+
+
+def not_found():
+    """What head_object raises for a missing object, with or without botocore installed"""
+    error = {"Error": {"Code": "404", "Message": "Not Found"}}
+    if blob_store.boto3 is not None:
+        return blob_store.ClientError(error, "HeadObject")
+    e = blob_store.ClientError("Not Found")
+    e.response = error
+    return e
+
+
+class FakeS3:
+    """The S3 client calls S3BlobStore makes, over a dict"""
+
+    def __init__(self):
+        self.objects = {}       # (bucket, key) -> [bytes, last_modified]
+        self.uploads = 0
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise not_found()
+        return {"ContentLength": len(self.objects[Bucket, Key][0])}
+
+    def upload_fileobj(self, fileobj, bucket, key):
+        self.uploads += 1
+        self.objects[bucket, key] = [fileobj.read(), datetime.now(timezone.utc)]
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective):
+        assert CopySource == {"Bucket": Bucket, "Key": Key}
+        self.objects[Bucket, Key][1] = datetime.now(timezone.utc)
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[Bucket, Key][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [{"Key": key, "LastModified": modified}
+                                    for (bucket, key), (_, modified) in objects.items()
+                                    if bucket == Bucket and key.startswith(Prefix)]}
+        return Paginator()
+
+
+@pytest.fixture(params=["local", "s3"])
+def store(request, tmp_path):
+    if request.param == "local":
+        return LocalBlobStore(str(tmp_path / "blobs"))
+    return S3BlobStore("bucket", "journal-audio", client=FakeS3())
+
+
+def age(store, key, seconds):
+    """Make a blob look `seconds` old"""
+    then = time.time() - seconds
+    if isinstance(store, LocalBlobStore):
+        os.utime(store.local_path(key), (then, then))
+    else:
+        store.client.objects["bucket", store._object_key(key)][1] = datetime.fromtimestamp(then, timezone.utc)
+
+
+def test_put_is_content_addressed(store):
+    assert store.put(AUDIO) == KEY
+    assert store.get(KEY) == AUDIO
+    assert store.open(KEY).read() == AUDIO
+    assert store.size(KEY) == len(AUDIO)
+    assert store.exists(KEY)
+    assert not store.exists(hashlib.sha256(b"other").hexdigest())
+    # A file object hashes to the same key as its bytes
+    assert store.put(io.BytesIO(AUDIO)) == KEY
+
+
+def test_same_content_is_stored_once(store):
+    store.put(AUDIO)
+    age(store, KEY, 7200)
+    store.put(io.BytesIO(AUDIO))
+    other = store.put(b"another recording")
+
+    assert sorted(key for key, _ in store.keys()) == sorted([KEY, other])
+    # Re-uploading refreshed the age, so GC treats it as a new upload
+    assert dict(store.keys())[KEY] > time.time() - 60
+    if isinstance(store, S3BlobStore):
+        assert store.client.uploads == 2
+
+
+def test_local_layout_and_temp_files(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    store.put(AUDIO)
+    assert os.path.isfile(tmp_path / shard_path(KEY))
+    assert shard_path(KEY).startswith(f"{KEY[:2]}/{KEY[2:4]}/")
+    assert os.listdir(store.tmp_dir) == []
+
+    # A crashed writer's leftover isn't a blob, and is cleaned up once old
+    leftover = os.path.join(store.tmp_dir, "partial")
+    with open(leftover, "wb") as f:
+        f.write(b"half an upload")
+    assert [key for key, _ in store.keys()] == [KEY]
+    assert store.clean_tmp(older_than=3600) == 0
+    os.utime(leftover, (time.time() - 7200,) * 2)
+    assert store.clean_tmp(older_than=3600) == 1
+
+
+def test_delete(store):
+    store.put(AUDIO)
+    assert store.delete(KEY)
+    assert not store.exists(KEY)
+    assert list(store.keys()) == []
+
+
+def test_s3_keys_urls_and_prefix():
+    client = FakeS3()
+    store = S3BlobStore("bucket", "/audio/", client=client)
+    store.put(AUDIO)
+    assert ("bucket", f"audio/{shard_path(KEY)}") in client.objects
+    assert store.url(KEY, expires=60).endswith(f"/bucket/audio/{shard_path(KEY)}?expires=60")
+    assert store.local_path(KEY) is None
+
+
+def test_collect_garbage_honours_grace_seconds(store):
+    referenced_old = store.put(b"still in a journal")
+    orphan_old = store.put(b"journal deleted long ago")
+    orphan_new = store.put(b"uploaded, journal not inserted yet")
+    age(store, referenced_old, 7200)
+    age(store, orphan_old, 7200)
+    age(store, orphan_new, 60)
+
+    assert collect_garbage(store, {referenced_old}, grace_seconds=3600) == {"deleted": 1, "kept": 2}
+    assert not store.exists(orphan_old)
+    assert store.exists(referenced_old) and store.exists(orphan_new)
+
+    # Once it is past the grace period too, it goes
+    assert collect_garbage(store, {referenced_old}, grace_seconds=30) == {"deleted": 1, "kept": 1}
+    assert not store.exists(orphan_new)
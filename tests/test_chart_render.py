@@ -0,0 +1,70 @@
+import matplotlib
+import matplotlib.pyplot as plt
+import pytest
+
+from chart_render import ChartRenderer, draw, render_to_file
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+
+def spec(n):
+    if n % 2:
+        return {"kind": "pie", "title": f"Moods {n}", "labels": ["happy", "sad"], "values": [n, 1],
+                "colors": ["#4caf50", "#2196f3"]}
+    return {"kind": "bar", "title": f"Entries {n}", "labels": ["Mon", "Tue", "Wed"], "values": [n, 2, 3]}
+
+
+@pytest.fixture
+def pyplot_state():
+    """pyplot's figures and rcParams, to check nothing rendered through it"""
+    before = (plt.get_fignums(), dict(matplotlib.rcParams))
+    yield
+    assert (plt.get_fignums(), dict(matplotlib.rcParams)) == before
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_concurrent_renders_write_valid_pngs(tmp_path, pyplot_state, processes):
+    renderer = ChartRenderer(workers=4, processes=processes)
+    try:
+        futures = [renderer.submit(spec(n), str(tmp_path / f"chart{n}.png")) for n in range(12)]
+        paths = [future.result(timeout=120) for future in futures]
+    finally:
+        renderer.shutdown()
+
+    assert paths == [str(tmp_path / f"chart{n}.png") for n in range(12)]
+    for path in paths:
+        with open(path, "rb") as f:
+            assert f.read(8) == PNG_MAGIC
+    # Each chart is its own figure: no two of them came out the same
+    assert len({open(path, "rb").read() for path in paths}) == 12
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f"chart{n}.png" for n in range(12))
+
+
+def test_empty_pie_and_svg(tmp_path, pyplot_state):
+    path = render_to_file({"kind": "pie", "title": "Moods", "labels": ["happy"], "values": [0]},
+                          str(tmp_path / "empty.svg"), fmt="svg")
+    svg = open(path).read()
+    assert svg.lstrip().startswith("<?xml") and "No data yet" in svg
+
+
+def test_existing_file_is_not_redrawn(tmp_path):
+    path = tmp_path / "chart.png"
+    path.write_bytes(b"cached")
+    render_to_file(spec(0), str(path))
+    assert path.read_bytes() == b"cached"
+
+
+def test_bad_specs_are_refused(tmp_path, pyplot_state):
+    with pytest.raises(ValueError):
+        draw({"kind": "line", "title": "", "labels": [], "values": []})
+    renderer = ChartRenderer(workers=1, processes=False)
+    try:
+        with pytest.raises(ValueError):
+            renderer.submit(spec(0), str(tmp_path / "chart.gif"), fmt="gif")
+        with pytest.raises(ValueError):
+            renderer.submit({"kind": "line", "title": "", "labels": [], "values": []},
+                            str(tmp_path / "line.png")).result(timeout=30)
+    finally:
+        renderer.shutdown()
+    # The failed render left no temp file behind
+    assert list(tmp_path.iterdir()) == []
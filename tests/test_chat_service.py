@@ -0,0 +1,91 @@
+import os
+import threading
+
+import pytest
+
+from chat_service import ChatService
+from circuit_breaker import CircuitBreaker
+
+# No network from the chatbot's imports: local litellm cost map, no telemetry
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+
+
+def make_chatbot(backend, breaker=None):
+    pytest.importorskip("crewai")
+    from chatbot import EmotionalChatbot
+    return EmotionalChatbot("test-key", breaker=breaker, backend=backend)
+
+
+def failing_backend(agent, description, expected_output):
+    raise ConnectionError("provider down")
+
+
+def test_provider_error_is_a_fallback():
+    bot = make_chatbot(failing_backend)
+    service = ChatService(bot, timeout=5)
+
+    response, is_fallback = service.chat("I can't stop worrying about tomorrow")
+    assert is_fallback
+    assert response == bot.fallback_response("neutral")
+
+
+def test_open_circuit_is_a_fallback():
+    breaker = CircuitBreaker(min_calls=1, failure_rate=0.5, reset_timeout=60)
+    bot = make_chatbot(failing_backend, breaker)
+    service = ChatService(bot, timeout=5)
+    service.chat("hello")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    response, is_fallback = service.chat("hello again")
+    assert is_fallback
+    assert breaker.counters["short_circuited"] >= 1
+
+
+def test_llm_reply_is_not_a_fallback():
+    def backend(agent, description, expected_output):
+        if agent is bot.classifier_agent:
+            return "stress"
+        return "That sounds like a lot to carry. What feels most urgent right now?"
+
+    bot = make_chatbot(backend)
+    response, is_fallback = ChatService(bot, timeout=5).chat("Deadlines everywhere")
+    assert not is_fallback
+    assert response == "That sounds like a lot to carry. What feels most urgent right now?"
+
+
+class StubChatbot:
+    """Stands in for EmotionalChatbot: generate_reply waits on `release`"""
+
+    def __init__(self, reply=("Thanks for telling me.", False)):
+        self.reply = reply
+        self.release = threading.Event()
+        self.release.set()
+
+    def classify_emotion(self, message):
+        return "neutral"
+
+    def generate_reply(self, message, emotion, context=None):
+        self.release.wait(5)
+        return self.reply
+
+    def fallback_response(self, emotion):
+        return "canned"
+
+
+def test_chatbot_fallback_flag_passes_through():
+    assert ChatService(StubChatbot(("canned", True)), timeout=5).chat("hi") == ("canned", True)
+    assert ChatService(StubChatbot(), timeout=5).chat("hi") == ("Thanks for telling me.", False)
+
+
+def test_deadline_and_full_slots_are_fallbacks():
+    bot = StubChatbot()
+    bot.release.clear()
+    service = ChatService(bot, max_concurrency=1, timeout=0.2)
+    try:
+        assert service.chat("slow") == ("canned", True)        # past the deadline
+        assert service.chat("queued") == ("canned", True)      # the one slot is still taken
+        assert service.stats["timeouts"] == 1 and service.stats["rejected"] == 1
+    finally:
+        bot.release.set()
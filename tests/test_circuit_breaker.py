@@ -0,0 +1,203 @@
+import threading
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def ok():
+    return "ok"
+
+
+def boom():
+    raise RuntimeError("provider down")
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        with pytest.raises(RuntimeError):
+            breaker.call(boom)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_trips_once_the_failure_rate_is_reached(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5)
+    for func in (ok, boom, ok):
+        try:
+            breaker.call(func)
+        except RuntimeError:
+            pass
+    # 1 failure in 3: not enough calls yet, and under the rate
+    assert breaker.state == CircuitBreaker.CLOSED
+    with pytest.raises(RuntimeError):
+        breaker.call(boom)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+    counters = breaker.snapshot()["counters"]
+    assert counters["opened"] == 1 and counters["short_circuited"] == 1 and counters["failures"] == 2
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = CircuitBreaker(min_calls=2, slow_call_seconds=5)
+
+    def slow():
+        clock.now += 6
+        return "late"
+
+    assert breaker.call(slow) == "late"
+    assert breaker.call(slow) == "late"
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()["counters"]["slow_calls"] == 2
+
+
+def test_half_open_after_reset_timeout_and_a_good_probe_closes(clock):
+    breaker = CircuitBreaker(min_calls=2, reset_timeout=30)
+    trip(breaker)
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+
+    clock.now += 1
+    assert breaker.call(ok) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+    # The window starts over: one failure doesn't re-open it
+    with pytest.raises(RuntimeError):
+        breaker.call(boom)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_for_another_reset_timeout(clock):
+    breaker = CircuitBreaker(min_calls=2, reset_timeout=30)
+    trip(breaker)
+    clock.now += 30
+    with pytest.raises(RuntimeError):
+        breaker.call(boom)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()["seconds_until_probe"] == 30
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+
+
+def test_only_one_probe_at_a_time(clock):
+    breaker = CircuitBreaker(min_calls=2, reset_timeout=30)
+    trip(breaker)
+    clock.now += 30
+
+    started, release = threading.Event(), threading.Event()
+
+    def probe():
+        started.set()
+        assert release.wait(5)
+        return "probe"
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(breaker.call(probe)))
+    thread.start()
+    assert started.wait(5)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError, match="probe in flight"):
+        breaker.call(ok)
+    release.set()
+    thread.join(5)
+    assert results == ["probe"]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_call_admitted_while_closed_is_not_the_probe(clock):
+    breaker = CircuitBreaker(min_calls=2, reset_timeout=30)
+    started, release = threading.Event(), threading.Event()
+
+    def straggler():
+        started.set()
+        assert release.wait(5)
+        return "late"
+
+    # Let a call through while closed, then trip the breaker behind it
+    thread = threading.Thread(target=breaker.call, args=(straggler,))
+    thread.start()
+    assert started.wait(5)
+    trip(breaker)
+    clock.now += 30
+
+    probe_started, probe_release = threading.Event(), threading.Event()
+
+    def probe():
+        probe_started.set()
+        assert probe_release.wait(5)
+        raise RuntimeError("still down")
+
+    errors = []
+
+    def run_probe():
+        try:
+            breaker.call(probe)
+        except RuntimeError as e:
+            errors.append(e)
+
+    probe_thread = threading.Thread(target=run_probe)
+    probe_thread.start()
+    assert probe_started.wait(5)
+
+    # The straggler succeeding neither closes the breaker nor frees the probe slot
+    release.set()
+    thread.join(5)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError, match="probe in flight"):
+        breaker.call(ok)
+
+    probe_release.set()
+    probe_thread.join(5)
+    assert len(errors) == 1
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_slow_call_gets_a_hedged_second_attempt():
+    breaker = CircuitBreaker(min_calls=3, hedge=True, hedge_min_delay=0.05)
+    for _ in range(3):
+        breaker.call(ok)
+
+    release = threading.Event()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            # The first attempt hangs until the test is done with it
+            release.wait(5)
+            return "first"
+        return "second"
+
+    try:
+        assert breaker.call(flaky) == "second"
+    finally:
+        release.set()
+    counters = breaker.snapshot()["counters"]
+    assert counters["hedged"] == 1 and counters["hedge_wins"] == 1
+
+    # A fast call returns before the hedge delay and isn't hedged
+    assert breaker.call(ok) == "ok"
+    assert breaker.snapshot()["counters"]["hedged"] == 1
+
+
+def test_no_hedging_without_enough_latency_history():
+    breaker = CircuitBreaker(min_calls=3, hedge=True, hedge_min_delay=0.01)
+    assert breaker.call(ok) == "ok"
+    assert breaker.snapshot()["counters"]["hedged"] == 0
@@ -0,0 +1,195 @@
+import copy
+import threading
+from types import SimpleNamespace
+
+from pymongo.errors import DuplicateKeyError
+
+import conversation_memory
+from conversation_memory import ConversationStore, estimate_tokens
+
+
+class FakeCollection:
+    """
+    Just enough of a pymongo collection for ConversationStore, with session_id
+    unique; find_one can be made to block
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.indexes = []
+        self.block = {}     # session_id -> Event find_one waits on
+
+    def find_one(self, query, projection=None):
+        release = self.block.get(query["session_id"])
+        if release is not None:
+            assert release.wait(5)
+        doc = self.docs.get(query["session_id"])
+        return copy.deepcopy(doc)
+
+    def insert_one(self, doc):
+        if doc["session_id"] in self.docs:
+            raise DuplicateKeyError("session_id")
+        self.docs[doc["session_id"]] = copy.deepcopy(doc)
+
+    def update_one(self, query, update):
+        doc = self.docs.get(query["session_id"])
+        if doc is None or doc.get("version") != query["version"]:
+            return SimpleNamespace(matched_count=0)
+        doc.update(copy.deepcopy(update["$set"]))
+        return SimpleNamespace(matched_count=1)
+
+    def delete_one(self, query):
+        self.docs.pop(query["session_id"], None)
+
+    def create_index(self, keys, **options):
+        self.indexes.append((keys, options))
+
+
+def test_cache_miss_does_not_block_other_sessions():
+    col = FakeCollection()
+    store = ConversationStore(col)
+    store.add_turn("fast", "hi", "hello")
+
+    col.block["slow"] = threading.Event()
+    slow = threading.Thread(target=store.get_context, args=("slow",))
+    slow.start()
+    try:
+        # Another session's cached context and a new session's load go ahead
+        # while "slow" is still waiting on Mongo
+        done = threading.Event()
+        threading.Thread(target=lambda: (store.get_context("fast"), store.add_turn("other", "a", "b"), done.set())).start()
+        assert done.wait(2)
+    finally:
+        col.block["slow"].set()
+        slow.join(5)
+    assert store.get_context("fast") == "User: hi\nYou: hello"
+
+
+def test_concurrent_misses_share_one_conversation():
+    col = FakeCollection()
+    col.docs["s"] = {"turns": [{"user": "old", "bot": "reply"}], "summary": ""}
+    col.block["s"] = threading.Event()
+    store = ConversationStore(col)
+
+    threads = [threading.Thread(target=store.add_turn, args=("s", f"m{i}", f"r{i}")) for i in range(4)]
+    for t in threads:
+        t.start()
+    col.block["s"].set()
+    for t in threads:
+        t.join(5)
+
+    # Every turn landed in the one cached conversation, none in a discarded copy
+    context = store.get_context("s")
+    assert context.startswith("User: old")
+    assert all(f"User: m{i}" in context for i in range(4))
+    assert len(store) == 1
+
+
+def test_clear_and_retention_index():
+    col = FakeCollection()
+    store = ConversationStore(col, retention=3600)
+    store.ensure_indexes()
+    assert ("updated_at", {"expireAfterSeconds": 3600}) in col.indexes
+
+    store.add_turn("s", "hi", "hello")
+    store.clear("s")
+    assert "s" not in col.docs
+    assert store.get_context("s") == ""
+
+
+def test_ring_keeps_the_last_max_turns_and_folds_older_ones_into_the_summary():
+    col = FakeCollection()
+    store = ConversationStore(col, max_turns=3)
+    for i in range(5):
+        store.add_turn("s", f"question {i}", f"answer {i}")
+
+    assert [t["user"] for t in col.docs["s"]["turns"]] == ["question 2", "question 3", "question 4"]
+    assert col.docs["s"]["summary"] == "question 0 | question 1"
+    context = store.get_context("s").split("\n")
+    assert context[0] == "Earlier the user talked about: question 0 | question 1"
+    assert context[1:] == ["User: question 2", "You: answer 2", "User: question 3", "You: answer 3",
+                           "User: question 4", "You: answer 4"]
+
+
+def test_summary_is_trimmed_to_summary_tokens_oldest_first():
+    store = ConversationStore(max_turns=1, summary_tokens=10)
+    for word in ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot"]:
+        store.add_turn("s", f"{word} " * 3, "ok")
+
+    summary = store.get_context("s").split("\n")[0].removeprefix("Earlier the user talked about: ")
+    # "foxtrot" is still in the window; the newest points before it survive
+    assert summary == "delta delta delta | echo echo echo"
+    assert estimate_tokens(summary) <= 10
+
+    # A single point longer than the budget is cut at a word boundary
+    store = ConversationStore(max_turns=1, summary_tokens=5)
+    store.add_turn("s", "one two three four five six seven", "ok")
+    store.add_turn("s", "next", "ok")
+    assert store.get_context("s").startswith("Earlier the user talked about: one two three four…\n")
+
+
+def test_context_keeps_the_newest_turns_that_fit():
+    store = ConversationStore(max_turns=6, context_tokens=15)
+    for i in range(6):
+        store.add_turn("s", f"q{i} " + "x" * 20, f"a{i}")
+    context = store.get_context("s")
+    assert "q5" in context and "q4" not in context
+
+
+def test_sessions_past_max_sessions_are_dropped_least_recently_used_first():
+    store = ConversationStore(max_sessions=2)
+    store.add_turn("a", "hi", "hello")
+    store.add_turn("b", "hi", "hello")
+    store.get_context("a")
+    store.add_turn("c", "hi", "hello")
+    assert len(store) == 2
+    assert store.get_context("a") == "User: hi\nYou: hello"
+    # Without a collection the memory is the only copy, so "b" starts over
+    assert store.get_context("b") == ""
+
+
+def test_idle_sessions_are_dropped_from_memory(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(conversation_memory.time, "monotonic", lambda: clock[0])
+    col = FakeCollection()
+    store = ConversationStore(col, idle_timeout=300)
+    store.add_turn("idle", "hi", "hello")
+    clock[0] += 200
+    store.add_turn("busy", "hi", "hello")
+    clock[0] += 200
+    store.get_context("busy")
+    assert len(store) == 1
+
+    # Still in Mongo, so it comes back on the next turn
+    assert store.get_context("idle") == "User: hi\nYou: hello"
+
+
+def test_workers_sharing_a_collection_see_each_others_turns():
+    col = FakeCollection()
+    first, second = ConversationStore(col, max_turns=3), ConversationStore(col, max_turns=3)
+    first.get_context("s")
+    second.get_context("s")
+    # Both start a new session; the second insert loses and retries as an update
+    first.add_turn("s", "q0", "a0")
+    second.add_turn("s", "q1", "a1")
+    # The first worker's copy is stale now; its save is rejected and re-based
+    first.add_turn("s", "q2", "a2")
+    second.add_turn("s", "q3", "a3")
+
+    assert [t["user"] for t in col.docs["s"]["turns"]] == ["q1", "q2", "q3"]
+    assert col.docs["s"]["summary"] == "q0"
+    assert col.docs["s"]["version"] == 4
+    assert first.get_context("s") == second.get_context("s")
+
+    second.clear("s")
+    assert first.get_context("s") == ""
+
+
+def test_documents_from_before_versioning_are_updated():
+    col = FakeCollection()
+    # No version field: the fake matches it with None, as Mongo does
+    col.docs["s"] = {"session_id": "s", "turns": [{"user": "old", "bot": "reply"}], "summary": ""}
+    store = ConversationStore(col)
+    store.add_turn("s", "new", "turn")
+    assert [t["user"] for t in col.docs["s"]["turns"]] == ["old", "new"]
+    assert col.docs["s"]["version"] == 1
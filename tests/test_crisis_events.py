@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta
+
+from crisis_events import CrisisEventBroker
+
+
+def read_events(stream, count):
+    """The next `count` crisis events from an SSE generator, skipping the retry line and keepalives"""
+    events = []
+    for chunk in stream:
+        if chunk.startswith("id: "):
+            events.append(json.loads(chunk.split("data: ", 1)[1]))
+            if len(events) == count:
+                return events
+    return events
+
+
+class FakeCrisisLog:
+    """Stands in for crisis_col as another worker process writes to it"""
+
+    def __init__(self):
+        self.events = []    # (written_at, event)
+        self.calls = []
+        self.fail = False
+
+    def poll(self, since):
+        self.calls.append(since)
+        if self.fail:
+            raise ConnectionError("mongo down")
+        return [event for written_at, event in self.events if written_at >= since]
+
+
+def test_events_from_other_workers_arrive_through_the_poll():
+    log = FakeCrisisLog()
+    broker = CrisisEventBroker(poll=log.poll, poll_interval=0.01)
+    stream = broker.stream(heartbeat=0.05)
+    assert next(stream).startswith("retry:")
+
+    log.events.append((datetime.now(), {"type": "new", "id": "a", "username": "sam"}))
+    log.events.append((datetime.now(), {"type": "resolved", "id": "a", "resolved_at": "now"}))
+    assert [e["type"] for e in read_events(stream, 2)] == ["new", "resolved"]
+    stream.close()
+    assert len(broker) == 0
+
+
+def test_event_seen_locally_and_in_mongo_is_sent_once():
+    log = FakeCrisisLog()
+    broker = CrisisEventBroker(poll=log.poll, poll_interval=0.01)
+    stream = broker.stream(heartbeat=0.05)
+    next(stream)
+
+    event = {"type": "new", "id": "b", "username": "kai"}
+    log.events.append((datetime.now(), event))
+    broker.publish(event)
+    log.events.append((datetime.now(), {"type": "notification", "id": "b", "notification": "sent"}))
+    events = read_events(stream, 2)
+    assert [(e["type"], e["id"]) for e in events] == [("new", "b"), ("notification", "b")]
+    stream.close()
+
+
+def test_resume_from_last_event_id_and_survive_failed_polls():
+    log = FakeCrisisLog()
+    since = datetime.now() - timedelta(minutes=5)
+    log.events.append((since + timedelta(minutes=1), {"type": "new", "id": "missed", "username": "ana"}))
+    log.fail = True
+    broker = CrisisEventBroker(poll=log.poll, poll_interval=0.01, overlap=10)
+    stream = broker.stream(heartbeat=0.05, since=since)
+    next(stream)
+    assert next(stream) == ": keepalive\n\n"    # polls failing, stream still up
+
+    log.fail = False
+    assert read_events(stream, 1)[0]["id"] == "missed"
+    # Failed polls didn't move the cursor past the disconnect
+    assert all(call == since - timedelta(seconds=10) for call in log.calls[:2])
+    stream.close()
+
+
+def test_stream_closes_after_max_age_with_a_resumable_id():
+    log = FakeCrisisLog()
+    broker = CrisisEventBroker(poll=log.poll, poll_interval=0.01)
+    stream = broker.stream(heartbeat=10, max_age=0.1)
+    next(stream)
+    log.events.append((datetime.now(), {"type": "new", "id": "c", "username": "lee"}))
+    assert read_events(stream, 1)[0]["id"] == "c"
+
+    # Ends on its own, with an id-only message and without waiting for a heartbeat
+    rest = list(stream)
+    assert rest[-1].startswith("id: ") and "data:" not in rest[-1]
+    assert len(broker) == 0
+
+    # Reconnecting with that id picks up what was logged after the last poll
+    last_id = datetime.fromisoformat(rest[-1][4:].strip())
+    log.events.append((datetime.now(), {"type": "new", "id": "d", "username": "lee"}))
+    stream = broker.stream(heartbeat=10, since=last_id, max_age=5)
+    next(stream)
+    # "c" again from the poll overlap; the dashboard skips rows it already has
+    assert [e["id"] for e in read_events(stream, 2)] == ["c", "d"]
+    stream.close()
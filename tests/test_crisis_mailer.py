@@ -0,0 +1,227 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+import crisis_mailer
+from crisis_mailer import CrisisMailer, enqueue_unsent
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class FakeServer:
+    """An SMTP server as seen through smtplib.SMTP_SSL: records logins and messages"""
+
+    def __init__(self):
+        self.connections = 0
+        self.sent = []
+        self.drop_next = 0      # sends answered with a dropped connection
+        self.error = None       # raised by every send when set
+
+    def connect(self, host, port, timeout=None):
+        self.connections += 1
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        if self.server.drop_next:
+            self.server.drop_next -= 1
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        if self.server.error is not None:
+            raise self.server.error
+        self.server.sent.append(msg)
+
+    def noop(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(crisis_mailer.smtplib, "SMTP_SSL", server.connect)
+    return server
+
+
+@pytest.fixture
+def make_mailer(monkeypatch):
+    """CrisisMailer without its worker thread; tests drive _claim/_process themselves"""
+    monkeypatch.setattr(CrisisMailer, "_run", lambda self: None)
+
+    def make(queue_col=None, **options):
+        return CrisisMailer("alerts@example.org", "app-password", "team@example.org", queue_col, **options)
+    return make
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().soulace
+
+
+def make_due(outbox):
+    """Skip the backoff wait"""
+    outbox.update_many({}, {"$set": {"next_attempt_at": datetime.now() - timedelta(seconds=1)}})
+
+
+def test_dedupe_key_makes_one_outbox_document(make_mailer, db):
+    mailer = make_mailer(db.outbox)
+    first = mailer.send_alert("Crisis", "body", dedupe_key="crisis:1")
+    assert mailer.send_alert("Crisis", "again", dedupe_key="crisis:1") == first
+    other = mailer.send_alert("Crisis", "body", dedupe_key="crisis:2")
+    undeduped = [mailer.send_alert("Test", "body") for _ in range(2)]
+
+    assert len({first, other, *undeduped}) == 4
+    assert db.outbox.count_documents({}) == 4
+    assert db.outbox.find_one({"tracking_id": first})["body"] == "body"
+    assert mailer.status(first)["status"] == "queued"
+
+
+def test_dedupe_key_without_a_collection(make_mailer):
+    mailer = make_mailer()
+    first = mailer.send_alert("Crisis", "body", dedupe_key="crisis:1")
+    assert mailer.send_alert("Crisis", "again", dedupe_key="crisis:1") == first
+    assert mailer.send_alert("Crisis", "body", dedupe_key="crisis:2") != first
+
+
+def test_claim_holds_a_lease_until_it_expires(make_mailer, db):
+    mailer = make_mailer(db.outbox, lease_seconds=120)
+    tracking_id = mailer.send_alert("Crisis", "body")
+    db.outbox.insert_one({**mailer.new_alert("Later", "body"),
+                          "next_attempt_at": datetime.now() + timedelta(minutes=5)})
+
+    claimed = mailer._claim()
+    assert claimed["tracking_id"] == tracking_id
+    assert claimed["status"] == "sending" and claimed["attempts"] == 1
+    assert claimed["lease_until"] > datetime.now() + timedelta(seconds=100)
+    # Leased to this worker, and the other alert isn't due yet
+    assert mailer._claim() is None
+
+    # The worker died mid-send: once the lease runs out another one takes over
+    db.outbox.update_one({"tracking_id": tracking_id}, {"$set": {"lease_until": datetime.now() - timedelta(seconds=1)}})
+    reclaimed = make_mailer(db.outbox)._claim()
+    assert reclaimed["tracking_id"] == tracking_id and reclaimed["attempts"] == 2
+
+
+def test_sent_alert_is_recorded_and_reported(make_mailer, db, server):
+    receipts = []
+    mailer = make_mailer(db.outbox, on_update=lambda alert: receipts.append(dict(alert)))
+    tracking_id = mailer.send_alert("Crisis", "Crisis button pressed", dedupe_key="crisis:1")
+
+    mailer._process(mailer._claim())
+    assert [msg["Subject"] for msg in server.sent] == ["Crisis"]
+    assert server.sent[0].get_content().strip() == "Crisis button pressed"
+    status = mailer.status(tracking_id)
+    assert status["status"] == "sent" and status["attempts"] == 1 and status["sent_at"]
+    assert [r["status"] for r in receipts] == ["sent"]
+    assert mailer._claim() is None
+
+
+def test_failed_sends_back_off_exponentially_and_never_give_up(make_mailer, db, server):
+    server.error = smtplib.SMTPDataError(451, b"try later")
+    receipts = []
+    mailer = make_mailer(db.outbox, base_delay=5, max_delay=60, max_attempts=3,
+                         on_update=lambda alert: receipts.append(alert["status"]))
+    tracking_id = mailer.send_alert("Crisis", "body")
+
+    delays = []
+    for _ in range(6):
+        alert = mailer._claim()
+        assert alert is not None
+        mailer._process(alert)
+        saved = db.outbox.find_one({"tracking_id": tracking_id})
+        delays.append(round((saved["next_attempt_at"] - datetime.now()).total_seconds()))
+        # Not due again until the delay has passed
+        assert mailer._claim() is None
+        make_due(db.outbox)
+
+    assert delays == [5, 10, 20, 40, 60, 60]
+    assert receipts == ["retrying", "retrying", "failing", "failing", "failing", "failing"]
+    assert "451" in mailer.status(tracking_id)["last_error"]
+
+    # Delivered as soon as the server accepts it again
+    server.error = None
+    mailer._process(mailer._claim())
+    assert mailer.status(tracking_id)["status"] == "sent"
+    assert len(server.sent) == 1
+
+
+def test_dropped_connection_is_reopened_and_the_alert_resent(make_mailer, db, server):
+    mailer = make_mailer(db.outbox)
+    first = mailer.send_alert("First", "body")
+    mailer._process(mailer._claim())
+    assert server.connections == 1
+
+    # The server closed the idle connection: reconnect once and resend
+    server.drop_next = 1
+    second = mailer.send_alert("Second", "body")
+    mailer._process(mailer._claim())
+    assert server.connections == 2
+    assert [msg["Subject"] for msg in server.sent] == ["First", "Second"]
+    assert mailer.status(first)["status"] == mailer.status(second)["status"] == "sent"
+    assert mailer.status(second)["attempts"] == 1
+
+    # Dropped again straight after reconnecting: that's a failed attempt, retried later
+    server.drop_next = 2
+    third = mailer.send_alert("Third", "body")
+    mailer._process(mailer._claim())
+    assert mailer.status(third)["status"] == "retrying"
+    assert "SMTPServerDisconnected" in mailer.status(third)["last_error"]
+
+
+def test_in_memory_queue_retries_and_sends(make_mailer, server):
+    server.error = smtplib.SMTPDataError(451, b"try later")
+    mailer = make_mailer(base_delay=0)
+    tracking_id = mailer.send_alert("Crisis", "body")
+    mailer._process(mailer._claim())
+    assert mailer.status(tracking_id)["status"] == "retrying"
+
+    server.error = None
+    mailer._process(mailer._claim())
+    assert mailer.status(tracking_id)["status"] == "sent"
+    assert mailer._claim() is None
+
+
+def crisis_alert(mailer, log):
+    return mailer.new_alert("Crisis", f"Crisis from {log['username']}", dedupe_key=f"crisis:{log['_id']}",
+                            crisis_id=log["_id"])
+
+
+def test_enqueue_unsent_queues_logs_missing_from_the_outbox(make_mailer, db):
+    mailer = make_mailer(db.outbox)
+    old = datetime.now() - timedelta(minutes=5)
+    logs = [
+        # Logged, but the process died before the outbox insert
+        {"_id": 1, "username": "lost", "timestamp": old},
+        # Logged and queued; just not attempted yet
+        {"_id": 2, "username": "queued", "timestamp": old},
+        # Still within its own request's grace period
+        {"_id": 3, "username": "recent", "timestamp": datetime.now()},
+    ]
+    for log in logs:
+        alert = crisis_alert(mailer, log)
+        log["notification"] = {"status": "queued", "tracking_id": alert["tracking_id"]}
+        if log["_id"] == 2:
+            db.outbox.insert_one(alert)
+    db.crisis_logs.insert_many(logs)
+
+    enqueue_unsent(mailer, db.crisis_logs, crisis_alert)
+    lost = db.outbox.find_one({"crisis_id": 1})
+    assert lost["tracking_id"] == logs[0]["notification"]["tracking_id"]
+    assert lost["status"] == "queued" and lost["dedupe_key"] == "crisis:1"
+    assert db.outbox.count_documents({"crisis_id": 2}) == 1
+    assert db.outbox.count_documents({"crisis_id": 3}) == 0
+    assert sorted(log["_id"] for log in db.crisis_logs.find({"notification.swept": True})) == [1, 2]
+
+    # Swept logs aren't looked at again, and a second sweep adds nothing
+    enqueue_unsent(mailer, db.crisis_logs, crisis_alert)
+    assert db.outbox.count_documents({}) == 2
+    assert mailer.status(lost["tracking_id"])["status"] == "queued"
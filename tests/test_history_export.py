@@ -0,0 +1,115 @@
+import csv
+import io
+import time
+from datetime import date, datetime
+
+import pytest
+
+from history_export import HistoryExporter
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    """find() with equality, $gte and $lt filters and an inclusion projection"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, cond in query.items():
+            value = doc.get(field)
+            if isinstance(cond, dict):
+                if "$gte" in cond and not value >= cond["$gte"]:
+                    return False
+                if "$lt" in cond and not value < cond["$lt"]:
+                    return False
+            elif value != cond:
+                return False
+        return True
+
+    def find(self, query, projection):
+        fields = [f for f, on in projection.items() if on and f != "_id"]
+        return FakeCursor([{f: doc[f] for f in fields if f in doc}
+                           for doc in self.docs if self._matches(doc, query)])
+
+
+@pytest.fixture
+def india_time(monkeypatch):
+    """Local time 5:30 ahead of UTC, so local and UTC dates differ in the evening"""
+    monkeypatch.setenv("TZ", "Asia/Kolkata")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def read_csv(chunks):
+    return list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+
+
+def make_exporter(moods=(), assessments=()):
+    return HistoryExporter({"moods": FakeCollection(list(moods)), "journals": FakeCollection([]),
+                            "assessments": FakeCollection(list(assessments))})
+
+
+MOODS = [
+    {"user_id": "u1", "datetime": datetime(2026, 3, 2, 9, 30), "mood": "Calm", "mood_code": 2},
+    {"user_id": "u1", "datetime": datetime(2026, 3, 1, 21, 5, 7), "mood": "Very Happy", "mood_code": 6},
+    {"user_id": "u2", "datetime": datetime(2026, 3, 1, 8, 0), "mood": "Sad", "mood_code": 4},
+]
+
+
+def test_mood_download_keeps_the_date_time_mood_layout():
+    rows = read_csv(make_exporter(MOODS).mood_download("u1"))
+    assert rows == [
+        ["Date", "Time", "Mood"],
+        ["2026-03-01", "21:05:07", "Very Happy"],
+        ["2026-03-02", "09:30:00", "Calm"],
+    ]
+
+
+def test_mood_export_has_codes_and_scores():
+    rows = read_csv(make_exporter(MOODS).stream("moods", "u1"))
+    assert rows == [
+        ["datetime", "mood", "mood_code", "score"],
+        ["2026-03-01 21:05:07", "Very Happy", "6", "4"],
+        ["2026-03-02 09:30:00", "Calm", "2", "3"],
+    ]
+
+
+def test_assessments_are_filtered_and_exported_in_local_time(india_time):
+    # Stored with datetime.utcnow(): 20:00 UTC on the 31st is 01:30 local on the 1st
+    exporter = make_exporter(assessments=[
+        {"user_id": "u1", "timestamp": datetime(2026, 1, 31, 20, 0), "test_type": "GAD", "gadTotal": 5},
+        {"user_id": "u1", "timestamp": datetime(2026, 1, 31, 17, 0), "test_type": "PHQ", "phqTotal": 3},
+    ])
+    rows = read_csv(exporter.stream("assessments", "u1", start=date(2026, 2, 1), end=date(2026, 2, 1)))
+    assert [row[:3] for row in rows[1:]] == [["2026-02-01 01:30:00", "GAD", "5"]]
+
+    rows = read_csv(exporter.stream("assessments", "u1", end=date(2026, 1, 31)))
+    assert [row[:2] for row in rows[1:]] == [["2026-01-31 22:30:00", "PHQ"]]
+
+
+def test_bad_requests_fail_before_the_first_chunk():
+    exporter = make_exporter(MOODS)
+    with pytest.raises(ValueError):
+        exporter.stream("sleep", "u1")
+    with pytest.raises(ValueError):
+        exporter.stream("moods", "u1", "xlsx")
+    with pytest.raises(ValueError):
+        exporter.stream("moods", "u1", start=date(2026, 3, 2), end=date(2026, 3, 1))
@@ -0,0 +1,78 @@
+import pytest
+
+from blob_store import LocalBlobStore
+from journal_audio import JournalAudioTranscoder
+
+
+class FakeJournals:
+    """count_documents over a list of entries, which is all release() asks of journals_col"""
+
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+
+    def count_documents(self, query, limit=0):
+        matches = sum(1 for e in self.entries if all(e.get(k) == v for k, v in query.items()))
+        return min(matches, limit) if limit else matches
+
+
+class NoFFmpeg:
+    def can_encode(self, codec):
+        return False
+
+
+@pytest.fixture
+def setup(tmp_path):
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+    journals = FakeJournals()
+    legacy = tmp_path / "uploads"
+    legacy.mkdir()
+    return JournalAudioTranscoder(journals, store, str(legacy), ffmpeg=NoFFmpeg()), journals, store, legacy
+
+
+def test_release_deletes_a_blob_only_once_nothing_references_it(setup):
+    audio, journals, store, _ = setup
+    key = store.put(b"the same recording")
+    # Two entries share the content-addressed blob
+    journals.entries = [{"journal_id": 1, "audio_blob": key}, {"journal_id": 2, "audio_blob": key}]
+
+    removed = journals.entries.pop(0)
+    audio.release(removed)
+    assert store.exists(key)
+
+    removed = journals.entries.pop(0)
+    audio.release(removed)
+    assert not store.exists(key)
+    # Releasing again is harmless
+    audio.release(removed)
+
+
+def test_release_removes_legacy_upload_files(setup):
+    audio, _, _, legacy = setup
+    (legacy / "old.wav").write_bytes(b"RIFF")
+    audio.release({"audio_file": "old.wav"})
+    assert not (legacy / "old.wav").exists()
+    audio.release({"audio_file": "old.wav"})
+    audio.release({"type": "text"})
+
+
+def test_ensure_stored_puts_back_a_blob_released_under_it(setup):
+    audio, journals, store, _ = setup
+    data = b"uploaded twice"
+    key = store.put(data)
+    journals.entries = [{"journal_id": 1, "audio_blob": key}]
+
+    # Entry 1 is deleted between entry 2's put() and its insert: the shared blob goes
+    audio.release(journals.entries.pop())
+    assert not store.exists(key)
+    journals.entries.append({"journal_id": 2, "audio_blob": key})
+
+    audio.ensure_stored(key, data)
+    assert store.get(key) == data
+    # Nothing to do when it is already there
+    audio.ensure_stored(key, b"not read")
+    assert store.get(key) == data
+
+
+def test_transcoding_needs_libopus(setup):
+    audio, *_ = setup
+    assert not audio.enabled
@@ -0,0 +1,34 @@
+import pytest
+
+from journal_insights import tag_topics
+
+
+@pytest.mark.parametrize("text, topics", [
+    ("Finished my homework before dinner", ["studies"]),
+    ("Went for a workout after class", ["studies", "health"]),
+    ("Picked a date for the dentist, 2024-05-01", []),
+    ("Our first date went well", ["relationships"]),
+    ("Worked late, my boss kept scheduling meetings", ["work"]),
+    ("Two exams and a lecture tomorrow", ["studies"]),
+    ("Slept badly, worried about rent", ["sleep", "money", "anxiety"]),
+])
+def test_tag_topics_matches_whole_words(text, topics):
+    assert sorted(tag_topics(text)) == sorted(topics)
+
+
+@pytest.mark.parametrize("text", [
+    "Homeless shelter volunteering",    # not "home"
+    "The network was down",             # not "work"
+    "Update the spreadsheet",           # not "date"
+    "Painting the fence",               # not "pain"
+    "Classic films all evening",        # not "class"
+    "My apartment is quiet",            # not "parent"
+])
+def test_tag_topics_ignores_words_that_only_start_with_a_keyword(text):
+    assert tag_topics(text) == []
+
+
+def test_tag_topics_ranks_by_hits_and_limits():
+    text = "Stress, panic, worries. Tired. Work, boss, office, meeting. Mom called."
+    assert tag_topics(text) == ["work", "anxiety", "sleep"]
+    assert tag_topics(text, limit=1) == ["work"]
@@ -0,0 +1,67 @@
+import re
+
+from journal_search import highlight_pattern, mark, parse_query, snippet
+
+
+def pattern_for(query):
+    words, phrases, _ = parse_query(query)
+    return highlight_pattern(words, phrases)
+
+
+def test_parse_query_splits_phrases_exclusions_and_words():
+    assert parse_query('"Rough day" -work sleep a') == (["sleep"], ["rough day"], ["work"])
+    assert parse_query('" padded phrase "  -"not excluded"') == ([], ["padded phrase", "not excluded"], [])
+    # One-letter leftovers like the "s" of "friend's" are dropped
+    assert parse_query("friend's birthday") == (["friend", "birthday"], [], [])
+    assert parse_query("") == ([], [], [])
+
+
+def test_highlight_pattern_matches_stems_and_phrases():
+    pattern = pattern_for('walking "long day"')
+    assert [m.group() for m in pattern.finditer("Walked home after a long day, then walks")] == \
+        ["Walked", "long day", "walks"]
+    # Only at the start of a word
+    assert not pattern.search("sidewalk")
+    assert highlight_pattern([], []) is None
+
+
+def test_mark_escapes_inside_and_outside_the_highlight():
+    pattern = re.compile(re.escape("<b>&"))
+    assert mark("say <b>& <i>", pattern) == "say <mark>&lt;b&gt;&amp;</mark> &lt;i&gt;"
+    assert mark("<script>alert(1)</script> & more", pattern_for("alert")) == \
+        "&lt;script&gt;<mark>alert</mark>(1)&lt;/script&gt; &amp; more"
+    assert mark('"quoted" & <tag>', None) == "&quot;quoted&quot; &amp; &lt;tag&gt;"
+
+
+def test_snippet_returns_short_text_whole():
+    assert snippet("A short entry about sleep", pattern_for("sleep"), width=160) == \
+        "A short entry about <mark>sleep</mark>"
+    assert snippet("No match <here>", pattern_for("sleep")) == "No match &lt;here&gt;"
+
+
+def test_snippet_windows_long_text_around_the_first_match():
+    words = [f"word{i:02d}" for i in range(60)]
+    text = " ".join(words[:30] + ["anxious"] + words[30:])
+    result = snippet(text, pattern_for("anxious"), width=60)
+
+    assert result.startswith("…") and result.endswith("…")
+    body = result.strip("…")
+    assert "<mark>anxious</mark>" in body
+    assert len(body.replace("<mark>", "").replace("</mark>", "")) <= 60
+    # Cut between words, never through one
+    assert all(word in words + ["anxious"] for word in re.sub("</?mark>", "", body).split(" "))
+    # The match sits about a third of the way in, so there is context before it
+    assert body.index("<mark>") > 0
+
+
+def test_snippet_keeps_the_ends_it_reaches():
+    text = "anxious " + "filler " * 40
+    result = snippet(text, pattern_for("anxious"), width=50)
+    assert result.startswith("<mark>anxious</mark>") and result.endswith("…")
+
+    text = "filler " * 40 + "anxious"
+    result = snippet(text, pattern_for("anxious"), width=50)
+    assert result.startswith("…") and result.endswith("<mark>anxious</mark>")
+
+    # No match: the start of the text
+    assert snippet("filler " * 40, pattern_for("anxious"), width=50).startswith("filler filler")
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import mood_registry
+from mood_registry import MOODS, UNKNOWN_CODE
+
+
+class FakeCollection:
+    """Just enough of a pymongo collection for migrate_mood_codes: equality and $exists filters"""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, cond in query.items():
+            if isinstance(cond, dict) and "$exists" in cond:
+                if (field in doc) != cond["$exists"]:
+                    return False
+            elif doc.get(field) != cond:
+                return False
+        return True
+
+    def update_many(self, query, update):
+        modified = 0
+        for doc in self.docs:
+            if self._matches(doc, query):
+                doc.update(update["$set"])
+                modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+    def distinct(self, field, query):
+        values = []
+        for doc in self.docs:
+            if self._matches(doc, query) and field in doc and doc[field] not in values:
+                values.append(doc[field])
+        return values
+
+
+def test_labels_and_codes_map_both_ways():
+    assert len({mood.code for mood in MOODS}) == len(MOODS)
+    assert len({mood.label for mood in MOODS}) == len(MOODS)
+    for mood in MOODS:
+        assert mood.code != UNKNOWN_CODE
+        assert mood_registry.label_for(mood_registry.code_for(mood.label)) == mood.label
+        assert mood_registry.mood_document(mood.label) == {"mood": mood.label, "mood_code": mood.code}
+    assert mood_registry.code_for("Ecstatic") == UNKNOWN_CODE
+    assert mood_registry.code_for(None) == UNKNOWN_CODE
+    assert mood_registry.label_for(UNKNOWN_CODE) is None
+
+
+def test_codes_index_the_lookup_tables():
+    for mood in MOODS:
+        assert mood_registry.SCORE_TABLE[mood.code] == mood.score
+        assert mood_registry.SENTIMENT_TABLE[mood.code] == mood_registry.SENTIMENT_BY_LABEL[mood.label]
+    assert mood_registry.SCORE_TABLE[UNKNOWN_CODE] is None
+    assert mood_registry.SENTIMENT_TABLE[UNKNOWN_CODE] == "neutral"
+
+
+def test_every_active_mood_has_a_journaling_prompt():
+    for mood in MOODS:
+        prompt = mood_registry.journaling_prompt(mood.code)
+        assert prompt == mood.journaling_prompt
+        if mood.active:
+            assert prompt
+    assert mood_registry.journaling_prompt(mood_registry.code_for("Sad")) == \
+        mood_registry.journaling_prompt(mood_registry.code_for("Angry"))
+    assert mood_registry.journaling_prompt(UNKNOWN_CODE) is None
+
+
+def test_migration_gives_legacy_string_moods_their_codes():
+    logs = FakeCollection([
+        {"mood_id": 1, "mood": "Happy"},
+        {"mood_id": 2, "mood": "Very Happy"},       # older picker, inactive now
+        {"mood_id": 3, "mood": "Crying"},
+        {"mood_id": 4, "mood": "Ecstatic"},         # never a known label
+        {"mood_id": 5, "mood": "Sad", "mood_code": 4},
+        {"mood_id": 6},                             # no label at all
+    ])
+
+    assert mood_registry.migrate_mood_codes(logs) == 5
+    codes = {doc["mood_id"]: doc["mood_code"] for doc in logs.docs}
+    assert codes == {1: 1, 2: 6, 3: 10, 4: UNKNOWN_CODE, 5: 4, 6: UNKNOWN_CODE}
+    assert mood_registry.migrate_mood_codes(logs) == 0
+
+
+def test_migration_picks_up_logs_written_later_without_a_code():
+    logs = FakeCollection([{"mood_id": 1, "mood": "Happy"}])
+    assert mood_registry.migrate_mood_codes(logs) == 1
+
+    # Saved without a code after the first run (e.g. by an older instance mid-deploy):
+    # the next startup's run converts it
+    logs.docs.append({"mood_id": 2, "mood": "Calm"})
+    assert mood_registry.migrate_mood_codes(logs) == 1
+    assert logs.docs[-1]["mood_code"] == 2
+    assert logs.docs[0]["mood_code"] == 1
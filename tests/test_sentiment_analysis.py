@@ -0,0 +1,85 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import mood_registry
+import sentiment_analysis as sa
+
+mongomock = pytest.importorskip("mongomock")
+
+# Current picker moods, moods from the older picker and one we never knew
+LABELS = ["Happy", "Calm", "Void", "Sad", "Angry", "Very Happy", "Crying", "Ecstatic"]
+
+
+@pytest.fixture
+def logs():
+    """Mood logs over the last 10 days for two users, saved with and without a mood_code"""
+    col = mongomock.MongoClient().soulace.moodtracking
+    today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    docs = []
+    for i in range(200):
+        label = LABELS[i * 7 % len(LABELS)]
+        doc = {"mood_id": i, "user_id": 1 + i % 2, "mood": label, "datetime": today - timedelta(days=i % 10)}
+        if i % 3:
+            doc["mood_code"] = mood_registry.code_for(label)
+        docs.append(doc)
+    col.insert_many(docs)
+    mood_registry.migrate_mood_codes(col)
+    return col, docs
+
+
+def sentiment_of(doc):
+    return sa.mood_sentiment_map.get(doc["mood"], "neutral")
+
+
+def test_sentiment_counts_match_the_labels(logs):
+    col, docs = logs
+    expected = Counter(sentiment_of(doc) for doc in docs if doc["user_id"] == 1)
+    assert sa.user_sentiment_counts(1, col) == {s: expected[s] for s in sa.SENTIMENTS}
+    assert sum(sa.admin_sentiment_counts(col).values()) == len(docs)
+    assert sa.mood_counts(col)[None] == sum(doc["mood"] == "Ecstatic" for doc in docs)
+
+
+def test_sentiment_series_buckets_by_day(logs):
+    col, docs = logs
+    start = date.today() - timedelta(days=13)
+    series = sa.sentiment_series(col, 2, start=start, bucket="day")
+
+    assert len(series["buckets"]) == 14
+    expected = Counter((doc["datetime"].strftime("%Y-%m-%d"), sentiment_of(doc))
+                       for doc in docs if doc["user_id"] == 2)
+    for s in sa.SENTIMENTS:
+        assert series["series"][s] == [expected[day, s] for day in series["buckets"]]
+    assert sum(series["totals"]) == sum(doc["user_id"] == 2 for doc in docs)
+    # The first four days have no logs
+    assert all(series["series"][s][:4] == [0] * 4 for s in sa.SENTIMENTS)
+
+    with pytest.raises(ValueError):
+        sa.sentiment_series(col, 2, bucket="year")
+
+
+def test_mood_trends_counts_and_averages_per_day(logs):
+    col, docs = logs
+    trends = sa.mood_trends(col)
+
+    assert trends["moods"] == ["Happy", "Calm", "Void", "Sad", "Angry"]
+    assert len(trends["dates"]) == 10
+    for date_str, row, avg in zip(trends["dates"], trends["distribution"], trends["averages"]):
+        day = [doc for doc in docs if doc["datetime"].strftime("%Y-%m-%d") == date_str]
+        labels = Counter(doc["mood"] for doc in day)
+        assert row == [labels[m] for m in trends["moods"]]
+        # Unknown moods have no score and are left out of the average
+        scores = [mood_registry.BY_LABEL[doc["mood"]].score for doc in day if doc["mood"] in mood_registry.BY_LABEL]
+        assert avg == round(sum(scores) / len(scores), 2)
+
+
+def test_daily_average_scores_fill_the_window(logs):
+    col, docs = logs
+    dates, averages = sa.daily_average_scores(col, days=30)
+
+    assert len(dates) == 30 and dates[-1] == date.today().isoformat()
+    assert averages[:20] == [0] * 20
+    today = [mood_registry.BY_LABEL[doc["mood"]].score for doc in docs
+             if doc["datetime"].date() == date.today() and doc["mood"] in mood_registry.BY_LABEL]
+    assert averages[-1] == round(sum(today) / len(today), 1)
@@ -0,0 +1,80 @@
+import random
+
+from stigma_filter import (
+    PUNCTUATION, STIGMATIZED_REPLACEMENTS, STIGMATIZED_WORDS, filter_stigmatized_words, find_stigmatized_terms,
+)
+from stigma_filter_bench import legacy_filter
+
+
+def words(text):
+    """Lower-cased words with surrounding punctuation stripped, as the legacy loop compared them"""
+    return [w for w in (word.lower().strip(PUNCTUATION) for word in text.split()) if w]
+
+
+# No complete multi-word phrase in here (the legacy loop never matched those),
+# but plenty of words that start or end one, terms inside longer hyphenated
+# words, mixed case and punctuation
+CORPUS = [
+    "You are not crazy, you are overwhelmed.",
+    "It's okay to feel WEAK sometimes; that doesn't make you a Failure!",
+    "Nobody is broken. Being weak-minded is a myth, and so is being high-strung.",
+    "That was a weak-kneed excuse, not a weak one.",
+    "Feeling Unstable after a loss is human (and so is feeling fragile).",
+    "The control panel says you're not a freak, not a control-freak either.",
+    "Don't call yourself stupid, dumb, or SLOW: you're learning.",
+    "\"Crazy\" is a word people throw around; \"hopeless\" is another.",
+    "psycho's and crazy's are left alone, like 'nuts' in single quotes.",
+    "Mad? Maybe just tired. Madness and madly aren't on the list.",
+    "Being over-the-top, two-faced or a stress-head says nothing about you.",
+    "A split decision, a lost weekend and a drama series: all fine.",
+    "   Extra   spaces\tand\ttabs around a damaged   and Broken   heart.  ",
+    "Lazy, he said. Stop. Lazy!",
+    "[insane] {nuts} (mad) ...crazy...",
+    "unstable-survivor and weak--minded are not terms; weak is.",
+]
+
+
+def test_matches_legacy_loop_on_corpus():
+    for text in CORPUS:
+        assert words(filter_stigmatized_words(text)) == words(legacy_filter(text)), text
+
+
+def test_matches_legacy_loop_on_random_text():
+    # Single-word terms, hyphenated terms and other words, none of which starts
+    # a phrase term, so the legacy loop is the reference everywhere
+    phrase_words = {w for term in STIGMATIZED_WORDS if ' ' in term for w in term.split()}
+    terms = sorted(t for t in STIGMATIZED_WORDS if ' ' not in t and t not in phrase_words)
+    others = ["you", "are", "feeling", "today", "weak-kneed", "madness", "freaky", "crazy's", "okay", "self"]
+    decorations = ["", "", "", ".", ",", "!", "?", '"', "(", ")", "...", ";"]
+    rng = random.Random(0)
+    for _ in range(500):
+        tokens = []
+        for _ in range(rng.randint(1, 20)):
+            word = rng.choice(terms if rng.random() < 0.4 else others)
+            word = rng.choice([word, word.upper(), word.capitalize()])
+            tokens.append(rng.choice(decorations) + word + rng.choice(decorations))
+        text = rng.choice([" ", "  ", "\n"]).join(tokens)
+        assert words(filter_stigmatized_words(text)) == words(legacy_filter(text)), text
+
+
+def test_phrases_are_removed():
+    # The legacy loop split on whitespace so never saw these
+    assert filter_stigmatized_words("You're not a drama queen.") == "You're not a."
+    assert filter_stigmatized_words("He went off  their\nROCKER, truly") == "He went, truly"
+    assert filter_stigmatized_words("That's a lost cause") == "That's a"
+
+
+def test_overlapping_terms_match_the_longest():
+    assert filter_stigmatized_words("an unstable survivor") == "an"
+    assert filter_stigmatized_words("a control freak") == "a"
+    assert filter_stigmatized_words("I freaked out") == "I"
+    assert filter_stigmatized_words("weak-minded") == ""
+    assert find_stigmatized_terms("unstable, not an  Unstable\nsurvivor") == ["unstable", "Unstable survivor"]
+
+
+def test_replacements_keep_case_and_punctuation():
+    assert filter_stigmatized_words("Crazy, right?") == "Overwhelming, right?"
+    assert filter_stigmatized_words('You\'re "broken"!') == 'You\'re "healing"!'
+    assert filter_stigmatized_words("not HOPELESS.") == "not Capable."
+    for term, replacement in STIGMATIZED_REPLACEMENTS.items():
+        assert filter_stigmatized_words(f"so {term}") == f"so {replacement}"
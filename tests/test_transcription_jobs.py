@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from transcription import TranscriptionError, TranscriptionJobs
+
+
+class GatedBackend:
+    """Transcribes only once the test opens the gate"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def transcribe(self, audio_bytes, language_code):
+        self.started.set()
+        self.gate.wait(5)
+        return f"{len(audio_bytes)} bytes in {language_code}"
+
+    def health(self):
+        return {"ok": True}
+
+
+def test_get_returns_snapshots_while_the_worker_runs():
+    backend = GatedBackend()
+    jobs = TranscriptionJobs(backend, max_workers=1)
+    job_id = jobs.submit(b"abc", "en-US", owner="u1")
+    assert backend.started.wait(5)
+
+    running = jobs.get(job_id)
+    assert running["status"] == "processing"
+    backend.gate.set()
+    done = jobs.wait(job_id, timeout=5)
+
+    # The copy handed out earlier doesn't change under the caller
+    assert running["status"] == "processing" and "transcript" not in running
+    assert done["status"] == "done" and done["transcript"] == "3 bytes in en-US"
+    assert jobs.get(job_id)["owner"] == "u1"
+
+
+def test_public_view_hides_internals():
+    backend = GatedBackend()
+    backend.gate.set()
+    jobs = TranscriptionJobs(backend, max_workers=1)
+    job_id = jobs.submit(b"abc", "en-US", owner="u1")
+    jobs.wait(job_id, timeout=5)
+
+    view = jobs.public_view(jobs.get(job_id))
+    assert view["status"] == "done"
+    assert not {"future", "owner", "error_status"} & set(view)
+
+
+def test_polling_during_updates_never_sees_a_changing_dict():
+    backend = GatedBackend()
+    backend.gate.set()
+    jobs = TranscriptionJobs(backend, max_workers=4, max_pending=200)
+    job_ids = [jobs.submit(b"x" * n, "en-US") for n in range(200)]
+    views = []
+    for _ in range(5):
+        for job_id in job_ids:
+            views.append(jobs.public_view(jobs.get(job_id)))
+    for job_id in job_ids:
+        assert jobs.wait(job_id, timeout=5)["status"] == "done"
+    assert all(view["status"] in ("queued", "processing", "done") for view in views)
+
+
+def test_submit_refuses_past_max_pending_until_a_job_finishes():
+    backend = GatedBackend()
+    jobs = TranscriptionJobs(backend, max_workers=1, max_pending=2)
+    first = jobs.submit(b"a", "en-US")
+    jobs.submit(b"b", "en-US")      # queued behind the first
+    with pytest.raises(TranscriptionError) as refused:
+        jobs.submit(b"c", "en-US")
+    assert refused.value.status == 503
+    assert jobs.health()["pending"] == 2
+
+    backend.gate.set()
+    jobs.wait(first, timeout=5)
+    assert jobs.wait(jobs.submit(b"c", "en-US"), timeout=5)["status"] == "done"
+
+
+def test_wait_times_out_and_the_job_carries_on():
+    backend = GatedBackend()
+    jobs = TranscriptionJobs(backend, max_workers=1)
+    job_id = jobs.submit(b"abc", "en-US")
+    with pytest.raises(TimeoutError):
+        jobs.wait(job_id, timeout=0.05)
+    assert jobs.get(job_id)["status"] in ("queued", "processing")
+
+    backend.gate.set()
+    assert jobs.wait(job_id, timeout=5)["transcript"] == "3 bytes in en-US"
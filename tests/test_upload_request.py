@@ -0,0 +1,81 @@
+import io
+
+from flask import Flask, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.test import EnvironBuilder
+
+from upload_request import UploadRequest
+
+LIMIT = 64 * 1024
+
+
+class LimitedRequest(UploadRequest):
+    in_memory_endpoints = frozenset({"clip"})
+    in_memory_limit = LIMIT
+
+
+def make_app():
+    app = Flask(__name__)
+    app.request_class = LimitedRequest
+    app.config["MAX_CONTENT_LENGTH"] = 4 * LIMIT
+
+    @app.route("/clip", methods=["POST"])
+    def clip():
+        try:
+            audio = request.files["audio"]
+        except RequestEntityTooLarge:
+            return jsonify({"error": "too large"}), 413
+        return jsonify({"size": len(audio.read()), "in_memory": isinstance(audio.stream, io.BytesIO)})
+
+    @app.route("/other", methods=["POST"])
+    def other():
+        return jsonify({"size": len(request.files["audio"].read())})
+
+    return app
+
+
+def multipart(size, boundary="b0undary"):
+    return (f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="audio"; filename="a.webm"\r\n'
+            "Content-Type: audio/webm\r\n\r\n").encode() + b"\0" * size + f"\r\n--{boundary}--\r\n".encode()
+
+
+def post_chunked(app, path, body):
+    """
+    POST `body` the way a chunked upload arrives: no Content-Length for the
+    server to check up front. Returns the response and how much of the body
+    the server read.
+    """
+    stream = io.BytesIO(body)
+    environ = EnvironBuilder(path=path, method="POST", input_stream=stream,
+                             content_type="multipart/form-data; boundary=b0undary").get_environ()
+    del environ["CONTENT_LENGTH"]
+    environ["HTTP_TRANSFER_ENCODING"] = "chunked"
+    environ["wsgi.input_terminated"] = True
+    return app.response_class.from_app(app, environ), stream.tell()
+
+
+def test_small_upload_is_kept_in_memory():
+    response, _ = post_chunked(make_app(), "/clip", multipart(LIMIT // 2))
+    assert response.status_code == 200
+    assert response.json == {"size": LIMIT // 2, "in_memory": True}
+
+
+def test_oversized_chunked_upload_is_refused():
+    body = multipart(LIMIT * 3)
+    response, read = post_chunked(make_app(), "/clip", body)
+    assert response.status_code == 413
+    # Reading stopped around the limit rather than taking the whole body first
+    assert read < LIMIT + 16 * 1024 < len(body)
+
+
+def test_oversized_upload_with_content_length_is_refused():
+    response = make_app().test_client().post(
+        "/clip", data=multipart(LIMIT * 3), content_type="multipart/form-data; boundary=b0undary")
+    assert response.status_code == 413
+
+
+def test_other_routes_use_max_content_length():
+    app = make_app()
+    assert post_chunked(app, "/other", multipart(LIMIT * 3))[0].json == {"size": LIMIT * 3}
+    assert post_chunked(app, "/other", multipart(LIMIT * 5))[0].status_code == 413
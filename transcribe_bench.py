@@ -0,0 +1,122 @@
+"""
+Accuracy and speed benchmark for the transcription backends.
+
+Runs every clip in a fixture manifest through one or more recognizers and
+prints a JSON report with word error rate against the reference transcript,
+real-time factor (processing seconds / audio seconds, lower is faster) and
+model load time, so backends can be compared on the same recordings.
+
+The manifest is a JSON list of clips; paths are relative to the manifest:
+
+    [{"audio": "clips/rough_day.webm", "transcript": "today was a rough day", "language_code": "en-US"}, ...]
+
+    python transcribe_bench.py --manifest fixtures/manifest.json --backend whisper --backend google
+    WHISPER_MODEL=small.en python transcribe_bench.py --manifest fixtures/manifest.json --backend whisper
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from audio_preprocess import SAMPLE_RATE, to_pcm16
+from transcription import RECOGNIZERS, TranscriptionError, make_recognizer
+
+
+def words(text):
+    return re.findall(r"[\w']+", text.lower())
+
+
+def word_errors(reference, hypothesis):
+    """Word-level Levenshtein distance (substitutions + insertions + deletions)"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def run_benchmark(recognizer, clips):
+    # First call loads the model / opens the client; time it separately from the clips
+    start = time.perf_counter()
+    try:
+        recognizer.recognize(b"\0\0" * SAMPLE_RATE, SAMPLE_RATE, clips[0]["language_code"])
+    except TranscriptionError as e:
+        return {"error": e.message}
+    load_seconds = time.perf_counter() - start
+
+    results = []
+    errors = reference_words = 0
+    audio_seconds = processing_seconds = 0.0
+    rtfs = []
+    for clip in clips:
+        duration = len(clip["pcm"]) / (SAMPLE_RATE * 2)
+        start = time.perf_counter()
+        try:
+            hypothesis = recognizer.recognize(clip["pcm"], SAMPLE_RATE, clip["language_code"])
+        except TranscriptionError as e:
+            hypothesis, error = "", e.message
+        else:
+            error = None
+        elapsed = time.perf_counter() - start
+
+        reference = words(clip["transcript"])
+        clip_errors = word_errors(reference, words(hypothesis))
+        errors += clip_errors
+        reference_words += len(reference)
+        audio_seconds += duration
+        processing_seconds += elapsed
+        rtfs.append(elapsed / duration if duration else 0.0)
+        results.append({
+            "audio": clip["audio"],
+            "seconds": round(duration, 2),
+            "rtf": round(rtfs[-1], 3),
+            "wer": round(clip_errors / len(reference), 3) if reference else None,
+            "transcript": hypothesis,
+            **({"error": error} if error else {}),
+        })
+
+    return {
+        "health": recognizer.health(),
+        "load_seconds": round(load_seconds, 3),
+        "wer": round(errors / reference_words, 4) if reference_words else None,
+        "rtf": round(processing_seconds / audio_seconds, 3) if audio_seconds else None,
+        "rtf_p50": round(sorted(rtfs)[len(rtfs) // 2], 3),
+        "rtf_max": round(max(rtfs), 3),
+        "audio_seconds": round(audio_seconds, 1),
+        "clips": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcription backends on a fixture set")
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--backend", action="append", choices=list(RECOGNIZERS),
+                        help="repeat to compare backends (default: TRANSCRIBE_BACKEND)")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding="utf-8") as f:
+        clips = json.load(f)
+    base = os.path.dirname(os.path.abspath(args.manifest))
+    for clip in clips:
+        clip.setdefault("language_code", "en-US")
+        with open(os.path.join(base, clip["audio"]), "rb") as f:
+            clip["pcm"] = to_pcm16(f.read())
+
+    report = {"manifest": args.manifest, "backends": {}}
+    for name in args.backend or [None]:
+        recognizer = make_recognizer(name)
+        report["backends"][recognizer.name] = run_benchmark(recognizer, clips)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
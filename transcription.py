@@ -0,0 +1,435 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+import numpy as np
+
+from audio_preprocess import AudioError, FFMPEG, MAX_UPLOAD_BYTES, SAMPLE_RATE, to_pcm16, vad_chunks
+
+try:
+    from faster_whisper import WhisperModel
+except ImportError:
+    WhisperModel = None
+
+try:
+    import vosk
+except ImportError:
+    vosk = None
+
+logger = logging.getLogger("transcribe")
+
+
+class TranscriptionError(Exception):
+    """Failure with a user-facing message and the HTTP status /transcribe should return"""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# --- Recognizers ---
+class Recognizer:
+    """
+    Speech-to-text engine used by the transcription pipeline.
+    Takes 16-bit mono PCM (no WAV header) and returns the transcript text.
+    """
+
+    name = "base"
+
+    def recognize(self, pcm, sample_rate, language_code):
+        raise NotImplementedError
+
+    def health(self):
+        return {}
+
+
+class GoogleSpeechRecognizer(Recognizer):
+    """
+    Google Cloud Speech. Clips up to ~55 s use synchronous recognize; longer
+    audio is cut into chunks that each go through long_running_recognize, so a
+    long voice note is not rejected by the one-minute sync limit.
+    """
+
+    name = "google"
+    SYNC_LIMIT_SECONDS = 55
+    CHUNK_SECONDS = 240     # keeps each inline request under the 10 MB content limit
+
+    def __init__(self):
+        self._speech = None
+        self._client_instance = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        """
+        One SpeechClient (and gRPC channel) per process, created on first use;
+        the client is thread-safe so every worker shares it.
+        """
+        with self._lock:
+            if self._client_instance is None:
+                from google.cloud import speech_v1 as speech
+                try:
+                    self._client_instance = speech.SpeechClient()
+                except Exception:
+                    logger.exception("Failed to initialize Google Speech client")
+                    raise TranscriptionError("Server misconfiguration: Google Speech client init failed. Check GOOGLE_APPLICATION_CREDENTIALS.")
+                self._speech = speech
+            return self._speech, self._client_instance
+
+    def health(self):
+        return {
+            "client_ready": self._client_instance is not None,
+            "credentials_configured": bool(os.getenv("GOOGLE_APPLICATION_CREDENTIALS")),
+        }
+
+    def recognize(self, pcm, sample_rate, language_code):
+        speech, client = self._client()
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+            language_code=language_code,
+            enable_automatic_punctuation=True,
+        )
+        bytes_per_second = sample_rate * 2
+        try:
+            if len(pcm) <= self.SYNC_LIMIT_SECONDS * bytes_per_second:
+                # synchronous recognize (good for short audio < 60s)
+                responses = [client.recognize(config=config, audio=speech.RecognitionAudio(content=pcm))]
+            else:
+                chunk = self.CHUNK_SECONDS * bytes_per_second
+                operations = [
+                    client.long_running_recognize(config=config, audio=speech.RecognitionAudio(content=pcm[i:i + chunk]))
+                    for i in range(0, len(pcm), chunk)
+                ]
+                responses = [op.result(timeout=self.CHUNK_SECONDS * 2) for op in operations]
+        except TranscriptionError:
+            raise
+        except Exception as e:
+            logger.exception("Google Speech API error")
+            raise TranscriptionError(f"Speech API error: {str(e)}")
+
+        return " ".join(
+            result.alternatives[0].transcript
+            for response in responses
+            for result in response.results
+            if result.alternatives
+        ).strip()
+
+
+class FakeRecognizer(Recognizer):
+    """Offline stand-in for development and tests: describes the audio instead of transcribing it"""
+
+    name = "fake"
+
+    def __init__(self, delay=0.0, realtime_factor=0.0):
+        self.delay = delay
+        self.realtime_factor = realtime_factor
+
+    def recognize(self, pcm, sample_rate, language_code):
+        if self.delay or self.realtime_factor:
+            time.sleep(self.delay + self.realtime_factor * len(pcm) / (sample_rate * 2))
+        seconds = len(pcm) / (sample_rate * 2)
+        return f"[{language_code}] {seconds:.1f} seconds of audio"
+
+
+class WhisperRecognizer(Recognizer):
+    """
+    Local Whisper on CPU via faster-whisper (CTranslate2, int8 weights by default),
+    so transcription needs no network call or cloud credentials.
+
+    Configured by WHISPER_MODEL (a size like "base"/"small.en" or a model
+    directory), WHISPER_COMPUTE_TYPE, WHISPER_CPU_THREADS and WHISPER_WORKERS
+    (concurrent transcriptions the model accepts). The model is loaded once,
+    on first use.
+    """
+
+    name = "whisper"
+
+    def __init__(self, model=None, compute_type=None, cpu_threads=None, num_workers=None, beam_size=1):
+        self.model_name = model or os.getenv("WHISPER_MODEL", "base")
+        self.compute_type = compute_type or os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+        self.cpu_threads = cpu_threads or int(os.getenv("WHISPER_CPU_THREADS", "0"))
+        self.num_workers = num_workers or int(os.getenv("WHISPER_WORKERS", "1"))
+        self.beam_size = beam_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                if WhisperModel is None:
+                    raise TranscriptionError("Server misconfiguration: faster-whisper is not installed (pip install faster-whisper).")
+                try:
+                    self._model = WhisperModel(self.model_name, device="cpu", compute_type=self.compute_type,
+                                               cpu_threads=self.cpu_threads, num_workers=self.num_workers)
+                except Exception as e:
+                    logger.exception("Failed to load Whisper model %s", self.model_name)
+                    raise TranscriptionError(f"Server misconfiguration: could not load Whisper model {self.model_name!r}: {e}")
+            return self._model
+
+    def health(self):
+        return {"model": self.model_name, "compute_type": self.compute_type,
+                "installed": WhisperModel is not None, "model_loaded": self._model is not None}
+
+    def recognize(self, pcm, sample_rate, language_code):
+        model = self._load()
+        # "hi-IN" -> "hi"; let Whisper detect the language when the model doesn't know the code
+        language = language_code.split("-")[0].lower() if language_code else None
+        if language not in model.supported_languages:
+            language = None
+        audio = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768
+        try:
+            segments, _ = model.transcribe(audio, language=language, beam_size=self.beam_size)
+            return " ".join(segment.text.strip() for segment in segments).strip()
+        except Exception as e:
+            logger.exception("Whisper transcription error")
+            raise TranscriptionError(f"Speech recognition error: {str(e)}")
+
+
+class VoskRecognizer(Recognizer):
+    """
+    Local Kaldi-based recognizer (Vosk). Models are per language, so
+    VOSK_MODEL_PATH points at one model directory and VOSK_MODEL_PATH_<LANG>
+    (e.g. VOSK_MODEL_PATH_HI) adds others; requests for a language without a
+    model use the default one.
+    """
+
+    name = "vosk"
+
+    def __init__(self, model_path=None):
+        self.model_path = model_path or os.getenv("VOSK_MODEL_PATH")
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, language):
+        path = os.getenv(f"VOSK_MODEL_PATH_{language.upper()}") or self.model_path
+        with self._lock:
+            if path not in self._models:
+                if vosk is None:
+                    raise TranscriptionError("Server misconfiguration: vosk is not installed (pip install vosk).")
+                if not path or not os.path.isdir(path):
+                    raise TranscriptionError("Server misconfiguration: VOSK_MODEL_PATH is not set to a model directory.")
+                vosk.SetLogLevel(-1)
+                self._models[path] = vosk.Model(path)
+            return self._models[path]
+
+    def health(self):
+        return {"installed": vosk is not None, "model_path": self.model_path, "models_loaded": len(self._models)}
+
+    def recognize(self, pcm, sample_rate, language_code):
+        model = self._model((language_code or "en").split("-")[0])
+        recognizer = vosk.KaldiRecognizer(model, sample_rate)
+        step = sample_rate * 2 * 5  # 5 s of audio per call
+        texts = []
+        try:
+            for i in range(0, len(pcm), step):
+                # True means an utterance ended; its text has to be collected before feeding more
+                if recognizer.AcceptWaveform(pcm[i:i + step]):
+                    texts.append(json.loads(recognizer.Result()).get("text", ""))
+            texts.append(json.loads(recognizer.FinalResult()).get("text", ""))
+            return " ".join(text for text in texts if text).strip()
+        except Exception as e:
+            logger.exception("Vosk transcription error")
+            raise TranscriptionError(f"Speech recognition error: {str(e)}")
+
+
+RECOGNIZERS = {
+    "google": GoogleSpeechRecognizer,
+    "whisper": WhisperRecognizer,
+    "vosk": VoskRecognizer,
+    "fake": FakeRecognizer,
+}
+
+
+def make_recognizer(name=None):
+    """Build the recognizer named by TRANSCRIBE_BACKEND (default: google)"""
+    name = (name or os.getenv("TRANSCRIBE_BACKEND", "google")).lower()
+    if name not in RECOGNIZERS:
+        raise ValueError(f"Unknown transcription backend {name!r}; choose from {', '.join(RECOGNIZERS)}")
+    return RECOGNIZERS[name]()
+
+
+# --- Pipeline ---
+class TranscriptionBackend:
+    """
+    Everything /transcribe needs that is expensive to set up, created once per
+    process: the recognizer (which keeps its client and channel) and the cached
+    ffmpeg probe. health() reports whether both are usable.
+
+    With `vad` on, audio is split at silences into chunks of speech that are
+    recognized in parallel on `chunk_workers` threads and joined in order, so
+    silence is never sent to the recognizer and latency follows the longest
+    chunk rather than the whole recording.
+    """
+
+    def __init__(self, recognizer, ffmpeg=FFMPEG, vad=True, chunk_workers=4, chunk_seconds=15):
+        self.recognizer = recognizer
+        self.ffmpeg = ffmpeg
+        self.vad = vad
+        self.chunk_seconds = chunk_seconds
+        self._chunk_pool = ThreadPoolExecutor(max_workers=chunk_workers, thread_name_prefix="transcribe-chunk") \
+            if vad and chunk_workers > 1 else None
+        self.stats = {"audio_seconds": 0.0, "speech_seconds": 0.0, "chunks": 0}
+        self._stats_lock = threading.Lock()
+
+    def transcribe(self, audio_bytes, language_code):
+        """Convert an uploaded audio blob to 16 kHz mono PCM and transcribe it"""
+        if len(audio_bytes) > MAX_UPLOAD_BYTES:
+            raise TranscriptionError(
+                f"Uploaded audio too large ({len(audio_bytes)} bytes). Max allowed {MAX_UPLOAD_BYTES} bytes.", 413)
+
+        try:
+            pcm = to_pcm16(audio_bytes, SAMPLE_RATE, self.ffmpeg)
+        except AudioError as e:
+            raise TranscriptionError(e.message, e.status)
+
+        chunks = vad_chunks(pcm, SAMPLE_RATE, target_seconds=self.chunk_seconds) if self.vad else [pcm]
+        with self._stats_lock:
+            self.stats["audio_seconds"] += len(pcm) / (SAMPLE_RATE * 2)
+            self.stats["speech_seconds"] += sum(len(chunk) for chunk in chunks) / (SAMPLE_RATE * 2)
+            self.stats["chunks"] += len(chunks)
+
+        if not chunks:
+            transcript = ""
+        elif len(chunks) == 1 or self._chunk_pool is None:
+            transcript = " ".join(self.recognizer.recognize(chunk, SAMPLE_RATE, language_code) for chunk in chunks)
+        else:
+            futures = [self._chunk_pool.submit(self.recognizer.recognize, chunk, SAMPLE_RATE, language_code)
+                       for chunk in chunks]
+            # Results come back in chunk order regardless of which finished first
+            transcript = " ".join(future.result() for future in futures)
+        transcript = " ".join(transcript.split())
+        logger.info("Transcription result (%d chunks): %s", len(chunks), transcript)
+        return transcript
+
+    def health(self):
+        ffmpeg = self.ffmpeg.info()
+        recognizer = self.recognizer.health()
+        return {
+            "ok": ffmpeg["available"] and recognizer.get("credentials_configured", True) and recognizer.get("installed", True),
+            "ffmpeg": ffmpeg,
+            "recognizer": {"name": self.recognizer.name, **recognizer},
+            "vad": self.vad,
+            "processed": {k: round(v, 1) for k, v in self.stats.items()},
+        }
+
+
+class TranscriptionJobs:
+    """
+    Background transcription: submit() returns a job id at once, a small worker
+    pool converts and transcribes, and get() reports progress and the result.
+    Finished jobs are kept for `retention` seconds so clients can poll them.
+    At most `max_pending` jobs may be queued or running at once; past that,
+    submit() refuses new ones with a 503 TranscriptionError rather than letting
+    uploads pile up in memory behind the workers.
+
+    Jobs live in this process's memory, so polling only works when every
+    request reaches the process that took the upload: run the app with a
+    single worker process (threads are fine) or sticky sessions.
+    Job dicts are only changed under the registry lock; get() and
+    public_view() hand out copies taken under it.
+    """
+
+    def __init__(self, backend, max_workers=2, retention=3600, max_pending=20):
+        self.backend = backend
+        self.retention = retention
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcribe")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, audio_bytes, language_code, owner=None, callback=None):
+        """
+        callback(job), if given, runs on the worker once the job is done or
+        failed. Raises TranscriptionError (503) when max_pending jobs are
+        already queued or running.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "owner": owner,
+            "language_code": language_code,
+            "created_at": datetime.now(),
+        }
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise TranscriptionError("Too many transcriptions in progress. Please try again shortly.", 503)
+            self._pending += 1
+            self._expire()
+            self._jobs[job_id] = job
+        future = self._executor.submit(self._run, job, audio_bytes, callback)
+        self._update(job, future=future)
+        return job_id
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def _run(self, job, audio_bytes, callback=None):
+        self._update(job, status="processing")
+        start = time.monotonic()
+        try:
+            result = {"transcript": self.backend.transcribe(audio_bytes, job["language_code"]), "status": "done"}
+        except TranscriptionError as e:
+            result = {"status": "failed", "error": e.message, "error_status": e.status}
+        except Exception as e:
+            logger.exception("Unhandled exception in transcription job %s", job["job_id"])
+            result = {"status": "failed", "error": f"Internal server error: {str(e)}", "error_status": 500}
+        with self._lock:
+            job.update(finished_at=datetime.now(), seconds=round(time.monotonic() - start, 3), **result)
+            self._pending -= 1
+        if callback:
+            try:
+                callback(job)
+            except Exception:
+                logger.exception("Callback for transcription job %s failed", job["job_id"])
+        return job
+
+    def _expire(self):
+        now = datetime.now()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.get("finished_at") and (now - job["finished_at"]).total_seconds() > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Copy of the job as it stands, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, timeout=None):
+        """
+        Block until the job finishes (used by the synchronous /transcribe
+        route). Raises TimeoutError if it is still running after `timeout`
+        seconds; the job carries on, and can be polled with get().
+        """
+        with self._lock:
+            future = self._jobs[job_id]["future"]
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Transcription job {job_id} still running after {timeout}s")
+        return self.get(job_id)
+
+    def health(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            pending = self._pending
+        return {**self.backend.health(), "jobs": counts, "pending": pending, "max_pending": self.max_pending}
+
+    def public_view(self, job):
+        """What a client polling the job may see"""
+        with self._lock:
+            return {k: v for k, v in job.items() if k not in ("future", "owner", "error_status")}
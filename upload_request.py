@@ -0,0 +1,28 @@
+import io
+
+from flask import Request
+
+
+class UploadRequest(Request):
+    """
+    Request class for apps that take uploads. Werkzeug stops reading a body
+    once it passes max_content_length (MAX_CONTENT_LENGTH), chunked uploads
+    without a Content-Length included. Endpoints in `in_memory_endpoints` get
+    the smaller `in_memory_limit` instead, and their file parts stay in memory
+    rather than being spooled to a temp file, since their handlers hold the
+    whole upload anyway.
+    """
+
+    in_memory_endpoints = frozenset()
+    in_memory_limit = None
+
+    @property
+    def max_content_length(self):
+        if self.endpoint in self.in_memory_endpoints:
+            return self.in_memory_limit
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in self.in_memory_endpoints:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)